@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+Benchmark: create_BPM_summary vs create_BPM_summary_vectorized on synthetic Data_BPM
+(default 1000 files x 60 electrodes). Also checks that both give identical outputs.
+"""
+
+import argparse
+import time
+import warnings
+import numpy as np
+
+from datanalyzer.models import DataInfo as DataInfoClass
+from datanalyzer.part3_data_handling_and_analyses import (
+    update_Data_BPM,
+    create_BPM_summary,
+    create_BPM_summary_vectorized,
+    PeakStore,
+)
+
+
+def make_synthetic_Data_BPM(n_files: int, n_cols: int, seed: int = 0):
+    """Random low/high peaks (0..60 per column, some empty or single) for n_files x n_cols."""
+    rng = np.random.default_rng(seed)
+    info = DataInfoClass(
+        file_names=["file_%04d.h5" % ii for ii in range(n_files)],
+        files_amount=n_files,
+        datacol_numbers=list(range(1, n_cols + 1)),
+        framerate=np.full((n_files, 1), 25e3),
+    )
+    Data_BPM = []
+    for kk in range(n_files):
+        d = {}
+        for suffix, sign in (("low", -1), ("high", 1)):
+            d[f"peak_values_{suffix}"] = {}
+            d[f"peak_locations_{suffix}"] = {}
+            d[f"peak_widths_{suffix}"] = {}
+            d[f"Amount_of_peaks_{suffix}"] = np.zeros(n_cols)
+            for pp in range(1, n_cols + 1):
+                n = int(rng.integers(0, 60))
+                locs = np.sort(rng.choice(500000, size=n, replace=False)) + 1
+                d[f"peak_locations_{suffix}"][pp] = locs
+                d[f"peak_values_{suffix}"][pp] = sign * rng.uniform(5e-5, 5e-4, n)
+                d[f"peak_widths_{suffix}"][pp] = rng.uniform(50, 400, n)
+                d[f"Amount_of_peaks_{suffix}"][pp - 1] = n
+        Data_BPM.append(d)
+    return info, Data_BPM
+
+
+def assert_same_summary(S1: dict, S2: dict) -> None:
+    for key, value in S1.items():
+        if isinstance(value, np.ndarray):
+            assert np.array_equal(value, S2[key], equal_nan=True), key
+    for kk, cols in S1["peak_distances"].items():
+        for col, value in cols.items():
+            assert np.array_equal(value, S2["peak_distances"][kk][col], equal_nan=True), (kk, col)
+
+
+def main():
+    p = argparse.ArgumentParser(description="Benchmark create_BPM_summary vs create_BPM_summary_vectorized")
+    p.add_argument("--files", type=int, default=1000)
+    p.add_argument("--channels", type=int, default=60)
+    p.add_argument("--repeat", type=int, default=3)
+    args = p.parse_args()
+
+    info, Data_BPM = make_synthetic_Data_BPM(args.files, args.channels)
+    Data_BPM = update_Data_BPM(info, Data_BPM, using_high_peaks=-1)
+    store = PeakStore.from_Data_BPM(Data_BPM, info).update_bpm(info, using_high_peaks=-1)
+
+    timings = {}
+    results = {}
+    for name, func, data in (
+        ("create_BPM_summary", create_BPM_summary, Data_BPM),
+        ("create_BPM_summary_vectorized (Data_BPM)", create_BPM_summary_vectorized, Data_BPM),
+        ("create_BPM_summary_vectorized (PeakStore)", create_BPM_summary_vectorized, store),
+    ):
+        best = np.inf
+        with warnings.catch_warnings():
+            # Mean of empty slices (columns without peaks) is NaN by design
+            warnings.simplefilter("ignore", RuntimeWarning)
+            for _ in range(args.repeat):
+                t0 = time.perf_counter()
+                results[name] = func(info, data)
+                best = min(best, time.perf_counter() - t0)
+        timings[name] = best
+
+    reference = results["create_BPM_summary"]
+    for name, summary in results.items():
+        assert_same_summary(reference, summary)
+    print("%d files x %d channels, identical outputs" % (args.files, args.channels))
+    for name, t in timings.items():
+        print("  %-45s %8.3f s  (x%.1f)" % (name, t, timings["create_BPM_summary"] / t))
+
+
+if __name__ == "__main__":
+    main()
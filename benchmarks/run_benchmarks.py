@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+"""
+End-to-end benchmark on synthetic MEA .h5 files: times load_raw_mea_data_to_Data_and_DataInfo,
+find_peaks_in_loop, update_Data_BPM and create_BPM_summary separately and writes a JSON
+results file (throughput in samples/s and files/s, peak RSS per stage, environment, git commit).
+
+    python benchmarks/run_benchmarks.py --files 10 --duration 60 --output results.json
+    python benchmarks/run_benchmarks.py --compare old.json --output new.json
+"""
+
+import argparse
+import json
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import warnings
+from pathlib import Path
+from typing import Optional
+
+import h5py
+import numpy as np
+import scipy
+
+from synthetic_mea import make_synthetic_mea_folder
+from datanalyzer.part1_raw_data_handling import (
+    load_raw_mea_data_to_Data_and_DataInfo,
+    read_mea_electrode_layout,
+)
+from datanalyzer.part2_peak_handling import find_peaks_in_loop, set_default_filetype_rules_for_peak_finding
+from datanalyzer.part3_data_handling_and_analyses import update_Data_BPM, create_BPM_summary
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+RESULTS_FORMAT_VERSION = 2
+
+
+def max_rss_so_far_bytes() -> Optional[int]:
+    """
+    Largest resident set size of this process since it started (ru_maxrss; None where not
+    available). It never decreases, so after a stage it is not that stage's own peak.
+    """
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return int(rss if sys.platform == "darwin" else rss * 1024)
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "HEAD"], cwd=Path(__file__).resolve().parent, stderr=subprocess.DEVNULL, text=True
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def electrodes_within_channels(n_channels: int, n_electrodes: Optional[int]) -> list:
+    """Layout electrode numbers whose data column exists in files with n_channels columns."""
+    layout = read_mea_electrode_layout()
+    electrodes = [int(e) for e, col in zip(layout.iloc[:, 0], layout.iloc[:, 1]) if col <= n_channels]
+    return electrodes[:n_electrodes] if n_electrodes else electrodes
+
+
+def run_stage(results: dict, name: str, func, n_samples: int, n_files: int):
+    t0 = time.perf_counter()
+    out = func()
+    seconds = time.perf_counter() - t0
+    results["stages"][name] = {
+        "seconds": seconds,
+        "samples_per_sec": n_samples / seconds if seconds > 0 else None,
+        "files_per_sec": n_files / seconds if seconds > 0 else None,
+        "max_rss_so_far_bytes": max_rss_so_far_bytes(),
+    }
+    return out
+
+
+def run_benchmark(args: argparse.Namespace, folder: str) -> dict:
+    # Describe the files actually in the folder (--data-dir may hold an earlier set)
+    paths = sorted(Path(folder).glob("*.h5"))
+    with h5py.File(paths[0], "r") as f:
+        samples_per_file, args.channels = f["/Data/Recording_0/AnalogStream/Stream_0/ChannelData"].shape
+    args.files = len(paths)
+    electrodes = electrodes_within_channels(args.channels, args.electrodes)
+    results = {
+        "format_version": RESULTS_FORMAT_VERSION,
+        "git_commit": git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "numpy": np.__version__,
+            "scipy": scipy.__version__,
+            "h5py": h5py.__version__,
+        },
+        "parameters": {
+            "files": args.files,
+            "duration_sec": samples_per_file / args.framerate,
+            "channels": args.channels,
+            "electrodes": len(electrodes),
+            "framerate": args.framerate,
+            "bpm": args.bpm,
+            "noise_uV": args.noise,
+            "chunks": args.chunks,
+            "data_multiply": args.data_multiply,
+        },
+        "stages": {},
+    }
+    n_samples = samples_per_file * len(electrodes) * args.files
+
+    Data, DataInfo = run_stage(
+        results,
+        "load_raw_mea_data_to_Data_and_DataInfo",
+        lambda: load_raw_mea_data_to_Data_and_DataInfo(folder_of_files=folder, manually_chosen_mea_electrodes=electrodes),
+        n_samples,
+        args.files,
+    )
+    Rule = set_default_filetype_rules_for_peak_finding(frame_rate=float(DataInfo.framerate.flat[0]))
+    Rule.max_bpm = args.max_bpm
+    Rule.min_peak_value = args.min_peak_value
+    DataInfo.Rule = Rule
+    Data_BPM = run_stage(
+        results,
+        "find_peaks_in_loop",
+        lambda: find_peaks_in_loop(Data, DataInfo, Rule_in=Rule, data_multiply=args.data_multiply),
+        n_samples,
+        args.files,
+    )
+    Data_BPM = run_stage(
+        results, "update_Data_BPM", lambda: update_Data_BPM(DataInfo, Data_BPM, using_high_peaks=-1), n_samples, args.files
+    )
+    summary = run_stage(
+        results, "create_BPM_summary", lambda: create_BPM_summary(DataInfo, Data_BPM), n_samples, args.files
+    )
+    results["total_seconds"] = sum(stage["seconds"] for stage in results["stages"].values())
+    results["checks"] = {
+        "peaks_found": int(np.nansum(summary["Amount_of_peaks"])),
+        "BPM_avg_mean": float(np.nanmean(summary["BPM_avg"])) if np.isfinite(summary["BPM_avg"]).any() else None,
+    }
+    return results
+
+
+def print_results(results: dict, baseline: Optional[dict] = None) -> None:
+    p = results["parameters"]
+    print("%d files x %g s x %d electrodes @ %g Hz" % (p["files"], p["duration_sec"], p["electrodes"], p["framerate"]))
+    for name, stage in results["stages"].items():
+        line = "  %-40s %8.3f s  %10.3g samples/s  %7.2f files/s" % (
+            name, stage["seconds"], stage["samples_per_sec"] or 0, stage["files_per_sec"] or 0
+        )
+        if baseline and name in baseline.get("stages", {}):
+            line += "  (x%.2f vs baseline)" % (baseline["stages"][name]["seconds"] / stage["seconds"])
+        print(line)
+    rss = max((s["max_rss_so_far_bytes"] or 0) for s in results["stages"].values())
+    print("  max RSS of the process %.1f MiB, peaks found %d" % (rss / 2 ** 20, results["checks"]["peaks_found"]))
+
+
+def main():
+    p = argparse.ArgumentParser(description="DatAnalyzer end-to-end benchmark on synthetic MEA files")
+    p.add_argument("--files", type=int, default=5)
+    p.add_argument("--duration", type=float, default=60.0, help="Seconds per file")
+    p.add_argument("--channels", type=int, default=60, help="ChannelData columns per file")
+    p.add_argument("--electrodes", type=int, default=None, help="Electrodes to analyze (default: all channels)")
+    p.add_argument("--framerate", type=float, default=25e3)
+    p.add_argument("--bpm", type=float, default=40.0)
+    p.add_argument("--noise", type=float, default=8.0, help="Noise standard deviation (µV)")
+    p.add_argument("--chunks", type=int, nargs=2, default=None, help="HDF5 chunk shape (rows cols); default contiguous")
+    p.add_argument("--max-bpm", type=float, default=80.0)
+    p.add_argument("--min-peak-value", type=float, default=5e-5)
+    p.add_argument("--data-multiply", type=int, default=-1)
+    p.add_argument("--data-dir", default=None, help="Reuse/keep synthetic files here (default: temporary folder)")
+    p.add_argument("--output", default="benchmark_results.json")
+    p.add_argument("--compare", default=None, help="Earlier results JSON to compare stage times against")
+    args = p.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        folder = args.data_dir or tmp
+        if not list(Path(folder).glob("*.h5")):
+            make_synthetic_mea_folder(
+                folder,
+                n_files=args.files,
+                duration_sec=args.duration,
+                n_channels=args.channels,
+                framerate=args.framerate,
+                bpm=args.bpm,
+                noise_uV=args.noise,
+                chunks=tuple(args.chunks) if args.chunks else None,
+            )
+        with warnings.catch_warnings():
+            # Columns without peaks give mean-of-empty warnings by design
+            warnings.simplefilter("ignore", RuntimeWarning)
+            results = run_benchmark(args, folder)
+
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    print_results(results, baseline)
+    print("Results written to %s" % args.output)
+
+
+if __name__ == "__main__":
+    main()
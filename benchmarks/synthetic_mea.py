@@ -0,0 +1,100 @@
+"""
+Synthetic Multichannel Systems-style MEA .h5 files for benchmarks.
+
+Layout as read by datanalyzer.part1_raw_data_handling.read_h5:
+/Data/Recording_0 (attribute Duration in µs)
+/Data/Recording_0/AnalogStream/Stream_0/ChannelData       int32, samples x channels
+/Data/Recording_0/AnalogStream/Stream_0/InfoChannel       ADZero, ConversionFactor, Exponent
+/Data/Recording_0/AnalogStream/Stream_0/ChannelDataTimeStamps
+File names end with the measurement datetime (..._yyyy-MM-ddTHH-mm-ss.h5).
+"""
+
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import List, Optional, Tuple
+import h5py
+import numpy as np
+
+AD_ZERO = 32768
+CONVERSION_FACTOR = 59605
+EXPONENT = -12  # 1 ADC step = 59605e-12 V ~ 0.06 µV
+
+
+def synthetic_field_potential(
+    n_samples: int,
+    framerate: float,
+    bpm: float,
+    amplitude_uV: float,
+    rng: np.random.Generator,
+) -> np.ndarray:
+    """One channel of beats (sharp negative spike followed by a slow positive wave) in µV, random phase."""
+    out = np.zeros(n_samples)
+    period = 60.0 / bpm * framerate
+    spike = np.arange(-int(0.004 * framerate), int(0.016 * framerate))
+    shape = -amplitude_uV * np.exp(-(spike / (0.0018 * framerate)) ** 2)
+    shape += 0.25 * amplitude_uV * np.exp(-((spike - 0.01 * framerate) / (0.0024 * framerate)) ** 2)
+    for beat in np.arange(rng.uniform(0, period), n_samples, period * rng.uniform(0.97, 1.03)):
+        idx = int(beat) + spike
+        ok = (idx >= 0) & (idx < n_samples)
+        out[idx[ok]] += shape[ok]
+    return out
+
+
+def write_synthetic_mea_file(
+    path: str,
+    duration_sec: float = 60.0,
+    n_channels: int = 60,
+    framerate: float = 25e3,
+    bpm: float = 40.0,
+    noise_uV: float = 8.0,
+    amplitude_uV: float = 100.0,
+    chunks: Optional[Tuple[int, int]] = None,
+    seed: int = 0,
+) -> None:
+    """Write one synthetic .h5 file; chunks=None stores ChannelData contiguously."""
+    rng = np.random.default_rng(seed)
+    n_samples = int(round(duration_sec * framerate))
+    step_uV = CONVERSION_FACTOR * 10.0 ** EXPONENT * 1e6
+    channel_data = np.empty((n_samples, n_channels), dtype=np.int32)
+    for ch in range(n_channels):
+        signal = synthetic_field_potential(n_samples, framerate, bpm, amplitude_uV, rng)
+        signal += rng.normal(0.0, noise_uV, n_samples)
+        channel_data[:, ch] = np.round(signal / step_uV) + AD_ZERO
+    with h5py.File(path, "w") as f:
+        recording = f.create_group("Data/Recording_0")
+        recording.attrs["Duration"] = int(round(duration_sec * 1e6))
+        stream = f.create_group("Data/Recording_0/AnalogStream/Stream_0")
+        stream.create_dataset("ChannelData", data=channel_data, chunks=chunks)
+        info = stream.create_group("InfoChannel")
+        info["ChannelID"] = np.arange(n_channels, dtype=np.int32)
+        info["ADZero"] = np.full(n_channels, AD_ZERO, dtype=np.int32)
+        info["ConversionFactor"] = np.full(n_channels, CONVERSION_FACTOR, dtype=np.int64)
+        info["Exponent"] = np.full(n_channels, EXPONENT, dtype=np.int32)
+        stream["ChannelDataTimeStamps"] = np.array([0, 0, n_samples - 1], dtype=np.int64)
+
+
+def make_synthetic_mea_folder(
+    folder: str,
+    n_files: int = 5,
+    duration_sec: float = 60.0,
+    n_channels: int = 60,
+    framerate: float = 25e3,
+    bpm: float = 40.0,
+    noise_uV: float = 8.0,
+    amplitude_uV: float = 100.0,
+    chunks: Optional[Tuple[int, int]] = None,
+    start: datetime = datetime(2020, 9, 15, 9, 30, 0),
+    interval_sec: float = 300.0,
+    seed: int = 0,
+) -> List[str]:
+    """Write n_files synthetic recordings interval_sec apart; returns their paths."""
+    Path(folder).mkdir(parents=True, exist_ok=True)
+    paths = []
+    for ii in range(n_files):
+        stamp = (start + timedelta(seconds=ii * interval_sec)).strftime("%Y-%m-%dT%H-%M-%S")
+        path = str(Path(folder) / ("synthetic_mea_%s.h5" % stamp))
+        write_synthetic_mea_file(
+            path, duration_sec, n_channels, framerate, bpm, noise_uV, amplitude_uV, chunks, seed + ii
+        )
+        paths.append(path)
+    return paths
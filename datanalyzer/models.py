@@ -18,6 +18,14 @@ class Rule:
     min_peak_value: float = 2.5e-5  # V, 25 µV typical MEA
     min_dist_sec: Optional[float] = None
     min_dist_frames: Optional[float] = None
+    peak_engine: str = "scipy"  # "scipy" (find_peaks per column) or "vectorized" (all columns at once)
+    # Optional pre-filtering while loading (part1_raw_data_handling.filtering); None = off
+    filter_highpass: Optional[float] = None  # Hz; with filter_lowpass a band-pass
+    filter_lowpass: Optional[float] = None  # Hz
+    filter_notch: Optional[float] = None  # Hz, line noise (50 or 60)
+    filter_order: int = 2
+    filter_notch_q: float = 30.0
+    filter_zero_phase: bool = False  # forward-backward (not possible when streaming)
 
     def __post_init__(self):
         if self.min_dist_sec is None:
@@ -53,6 +61,14 @@ class DataInfo:
         "time_sec": [],
         "names": [],
     })
+    io_stats: Dict[str, Any] = field(default_factory=lambda: {
+        "bytes_read": [],
+        "bytes_in_file": [],
+    })
+    file_metadata: List[Dict[str, Any]] = field(default_factory=list)
+    # {"recording", "stream", "start" (s from file start)} per file_names entry when files hold
+    # several recordings/streams (all_streams loading); empty: Recording_0/Stream_0 of each file
+    segments: List[Dict[str, Any]] = field(default_factory=list)
     Rule: Optional[Rule] = None
     hypoxia: Optional[Dict[str, Any]] = None
     irregular_beating_limit: float = 0.2
@@ -1,14 +1,30 @@
 """Raw MEA data loading from HDF5 (.h5) files."""
 
-from .load_mea import load_raw_mea_data_to_Data_and_DataInfo
-from .read_h5 import read_h5_to_data, read_raw_mea_file
+from .load_mea import load_raw_mea_data_to_Data_and_DataInfo, create_DataInfo_of_folder, load_Data_of_DataInfo
+from .read_h5 import read_h5_to_data, read_raw_mea_file, read_mea_columns, read_mea_file_framerate
+from .lazy_data import LazyData
+from .prefetch import PrefetchReader
+from .channel_cache import ChannelDataCache
+from .folder_index import scan_mea_file, scan_mea_folder
+from .filtering import BlockFilter, filter_data_in_place
 from .mea_layout import read_mea_electrode_layout, find_mea_electrode_index
 from .datetime_utils import convert_end_string_in_filename_to_datetime
 
 __all__ = [
     "load_raw_mea_data_to_Data_and_DataInfo",
+    "create_DataInfo_of_folder",
+    "load_Data_of_DataInfo",
     "read_h5_to_data",
     "read_raw_mea_file",
+    "read_mea_columns",
+    "read_mea_file_framerate",
+    "LazyData",
+    "PrefetchReader",
+    "ChannelDataCache",
+    "scan_mea_file",
+    "scan_mea_folder",
+    "BlockFilter",
+    "filter_data_in_place",
     "read_mea_electrode_layout",
     "find_mea_electrode_index",
     "convert_end_string_in_filename_to_datetime",
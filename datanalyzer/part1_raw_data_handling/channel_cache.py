@@ -0,0 +1,161 @@
+"""
+Memory-mapped cache of converted channel data.
+
+On first load a file's chosen electrodes are written to cache_dir as one Fortran-order
+.npy (each electrode is a contiguous column) next to a small .json manifest holding the
+source identity (size, mtime), MEA columns, storage mode and framerate. Later loads open
+the .npy with np.load(mmap_mode="r"): no HDF5 decoding or Volt conversion, pages are read
+on access, and concurrent analysis processes share them through the OS page cache.
+A SignalPyramid of the entry can be stored next to it (.pyramid.npz).
+"""
+
+from pathlib import Path
+from typing import Optional, Sequence, Tuple
+import hashlib
+import json
+import os
+import numpy as np
+
+from .signal_pyramid import SignalPyramid
+
+CHANNEL_CACHE_FORMAT_VERSION = 1
+
+
+class ChannelDataCache:
+    """
+    Converted channel data per (absolute source path, segment, MEA columns, storage) under cache_dir.
+    An entry is valid while the source file keeps its size and mtime; otherwise it is
+    rebuilt on the next load. Files are written under temporary names and renamed, so a
+    reader never sees a partial entry.
+    """
+
+    def __init__(self, cache_dir: str):
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+
+    def _paths(self, path: str, columns: Sequence[int], storage: str, segment: Tuple[int, int] = (0, 0)) -> Tuple[Path, Path]:
+        # The absolute source path is part of the name: folders of different experiments
+        # often hold files of the same name and may share one cache_dir
+        selection = {"source": os.path.abspath(path), "columns": [int(c) for c in columns], "storage": storage}
+        if tuple(segment) != (0, 0):
+            selection["segment"] = [int(n) for n in segment]
+        selection = json.dumps(selection)
+        name = "%s-%s" % (Path(path).stem, hashlib.sha1(selection.encode()).hexdigest()[:12])
+        return self.cache_dir / (name + ".npy"), self.cache_dir / (name + ".json")
+
+    @staticmethod
+    def source_identity(path: str) -> dict:
+        st = os.stat(path)
+        return {"path": os.path.abspath(path), "size": st.st_size, "mtime_ns": st.st_mtime_ns}
+
+    def get(
+        self, path: str, columns: Sequence[int], storage: str, segment: Tuple[int, int] = (0, 0)
+    ) -> Optional[Tuple[dict, dict]]:
+        """
+        (entry {"data" (read-only memmap), "scale"/"offset" for raw}, manifest) of a valid
+        entry for 0-based ChannelData columns of path, or None.
+        segment: (recording, stream) of the data in path (see read_h5.get_mea_segment).
+        """
+        npy_path, manifest_path = self._paths(path, columns, storage, segment)
+        try:
+            with open(manifest_path) as f:
+                manifest = json.load(f)
+            valid = (
+                manifest.get("version") == CHANNEL_CACHE_FORMAT_VERSION
+                and manifest.get("source") == self.source_identity(path)
+                and manifest.get("columns") == [int(c) for c in columns]
+                and manifest.get("storage") == storage
+            )
+            data = np.load(npy_path, mmap_mode="r") if valid else None
+        except (OSError, ValueError):
+            valid = False
+        if not valid:
+            self.misses += 1
+            return None
+        entry = {"data": data}
+        if storage == "raw":
+            entry["scale"] = np.asarray(manifest["scale"], dtype=float)
+            entry["offset"] = np.asarray(manifest["offset"], dtype=float)
+        self.hits += 1
+        return entry, manifest
+
+    def put(
+        self,
+        path: str,
+        columns: Sequence[int],
+        storage: str,
+        entry: dict,
+        framerate: float,
+        bytes_in_file: int,
+        segment: Tuple[int, int] = (0, 0),
+    ) -> None:
+        """Write entry["data"] (columns contiguous) and its manifest for path."""
+        npy_path, manifest_path = self._paths(path, columns, storage, segment)
+        manifest = {
+            "version": CHANNEL_CACHE_FORMAT_VERSION,
+            "source": self.source_identity(path),
+            "columns": [int(c) for c in columns],
+            "storage": storage,
+            "framerate": float(framerate),
+            "bytes_in_file": int(bytes_in_file),
+            "shape": list(entry["data"].shape),
+            "dtype": str(entry["data"].dtype),
+        }
+        if storage == "raw":
+            manifest["scale"] = np.asarray(entry["scale"], dtype=float).tolist()
+            manifest["offset"] = np.asarray(entry["offset"], dtype=float).tolist()
+        suffix = ".%d.tmp" % os.getpid()
+        # Manifest goes last: an entry is only valid once both files are in place
+        tmp = npy_path.with_name(npy_path.name + suffix)
+        with open(tmp, "wb") as f:
+            np.save(f, np.asfortranarray(entry["data"]))
+        os.replace(tmp, npy_path)
+        tmp = manifest_path.with_name(manifest_path.name + suffix)
+        with open(tmp, "w") as f:
+            json.dump(manifest, f)
+        os.replace(tmp, manifest_path)
+        self.stores += 1
+        # A pyramid of the previous contents would no longer match
+        self._pyramid_path(npy_path).unlink(missing_ok=True)
+
+    @staticmethod
+    def _pyramid_path(npy_path: Path) -> Path:
+        return npy_path.with_name(npy_path.stem + ".pyramid.npz")
+
+    def get_pyramid(
+        self, path: str, columns: Sequence[int], storage: str, segment: Tuple[int, int] = (0, 0)
+    ) -> Optional[SignalPyramid]:
+        """Stored SignalPyramid of the entry (call after a successful get), or None."""
+        try:
+            return SignalPyramid.load(self._pyramid_path(self._paths(path, columns, storage, segment)[0]))
+        except (OSError, KeyError, ValueError):
+            return None
+
+    def put_pyramid(
+        self, path: str, columns: Sequence[int], storage: str, pyramid: SignalPyramid, segment: Tuple[int, int] = (0, 0)
+    ) -> None:
+        """Store the SignalPyramid of an entry written with put."""
+        pyramid_path = self._pyramid_path(self._paths(path, columns, storage, segment)[0])
+        tmp = pyramid_path.with_name(pyramid_path.name + ".%d.tmp" % os.getpid())
+        pyramid.save(tmp)
+        os.replace(tmp, pyramid_path)
+
+    def stats(self) -> dict:
+        """Counters: hits, misses, stores, entries and bytes on disk."""
+        files = list(self.cache_dir.glob("*.npy"))
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "stores": self.stores,
+            "entries": len(files),
+            "cache_bytes": sum(p.stat().st_size for p in files),
+        }
+
+    def clear(self) -> None:
+        """Remove all cached entries."""
+        for pattern in ("*.npy", "*.json", "*.pyramid.npz"):
+            for p in self.cache_dir.glob(pattern):
+                p.unlink()
@@ -0,0 +1,128 @@
+"""
+Band-pass / notch pre-filtering of MEA signals, configured from Rule and applied block by block.
+
+The filter is a cascade of second-order sections (Butterworth high-pass, low-pass or band-pass
+and an optional notch for line noise). Data is filtered in place in blocks of
+FILTER_BLOCK_ROWS rows with the filter state carried between blocks, so no second full-length
+copy of a file is made. Causal filtering (the default) also works on streamed blocks
+(BlockFilter); zero-phase filtering runs forward and then backward over the blocks and equals
+scipy.signal.sosfiltfilt of the whole signal.
+"""
+
+from typing import Any, Optional
+import numpy as np
+from scipy.signal import butter, iirnotch, sosfilt, sosfilt_zi, tf2sos
+
+FILTER_BLOCK_ROWS = 2 ** 16
+
+
+def get_filter_settings(Rule_in: Any) -> Optional[dict]:
+    """Filter fields of Rule_in as a dict, or None if Rule_in configures no filter."""
+    if Rule_in is None:
+        return None
+    settings = {
+        "highpass": getattr(Rule_in, "filter_highpass", None),
+        "lowpass": getattr(Rule_in, "filter_lowpass", None),
+        "notch": getattr(Rule_in, "filter_notch", None),
+    }
+    if all(value is None for value in settings.values()):
+        return None
+    settings["order"] = int(getattr(Rule_in, "filter_order", 2))
+    settings["notch_q"] = float(getattr(Rule_in, "filter_notch_q", 30.0))
+    settings["zero_phase"] = bool(getattr(Rule_in, "filter_zero_phase", False))
+    return settings
+
+
+def get_filter_sos(settings: dict, framerate: float) -> np.ndarray:
+    """Second-order sections of the filter described by get_filter_settings at framerate (Hz)."""
+    highpass, lowpass = settings["highpass"], settings["lowpass"]
+    sections = []
+    if highpass is not None and lowpass is not None:
+        sections.append(butter(settings["order"], [highpass, lowpass], "bandpass", fs=framerate, output="sos"))
+    elif highpass is not None:
+        sections.append(butter(settings["order"], highpass, "highpass", fs=framerate, output="sos"))
+    elif lowpass is not None:
+        sections.append(butter(settings["order"], lowpass, "lowpass", fs=framerate, output="sos"))
+    if settings["notch"] is not None:
+        sections.append(tf2sos(*iirnotch(settings["notch"], settings["notch_q"], fs=framerate)))
+    return np.concatenate(sections)
+
+
+class BlockFilter:
+    """
+    Causal filtering of consecutive (samples x channels) blocks, carrying the filter state.
+    The state starts at the steady state of the first sample, so a signal offset gives no step.
+    """
+
+    def __init__(self, sos: np.ndarray):
+        self.sos = sos
+        self.zi = None
+
+    def process(self, block: np.ndarray) -> np.ndarray:
+        """Filtered float64 copy of the next block."""
+        if self.zi is None:
+            self.zi = sosfilt_zi(self.sos)[:, :, None] * np.asarray(block[0], dtype=np.float64)
+        out, self.zi = sosfilt(self.sos, block, axis=0, zi=self.zi)
+        return out
+
+
+def get_sosfiltfilt_padlen(sos: np.ndarray) -> int:
+    """Default odd-extension length of scipy.signal.sosfiltfilt for sos."""
+    ntaps = 2 * sos.shape[0] + 1
+    ntaps -= min((sos[:, 2] == 0).sum(), (sos[:, 5] == 0).sum())
+    return 3 * ntaps
+
+
+def filter_data_in_place(
+    data: np.ndarray,
+    sos: np.ndarray,
+    zero_phase: bool = False,
+    block_rows: int = FILTER_BLOCK_ROWS,
+) -> np.ndarray:
+    """
+    Filter the columns of data (samples x channels, float64 or float32) in place, block_rows
+    rows at a time. zero_phase: forward-backward filtering with sosfiltfilt's odd extension at
+    both ends; otherwise causal (BlockFilter). Returns data.
+    """
+    n_rows = data.shape[0]
+    if n_rows == 0:
+        return data
+    if not zero_phase:
+        block_filter = BlockFilter(sos)
+        for r0 in range(0, n_rows, block_rows):
+            data[r0:r0 + block_rows] = block_filter.process(data[r0:r0 + block_rows])
+        return data
+
+    padlen = get_sosfiltfilt_padlen(sos)
+    if n_rows <= padlen:
+        raise ValueError(f"Zero-phase filtering needs more than {padlen} samples, got {n_rows}")
+    zi = sosfilt_zi(sos)[:, :, None]
+    head = np.asarray(data[:padlen + 1], dtype=np.float64)
+    tail = np.asarray(data[-(padlen + 1):], dtype=np.float64)
+    left = 2 * head[0] - head[:0:-1]
+    right = 2 * tail[-1] - tail[-2::-1]
+    # Forward pass: left extension, the data blocks, then the right extension
+    _, state = sosfilt(sos, left, axis=0, zi=zi * left[0])
+    for r0 in range(0, n_rows, block_rows):
+        data[r0:r0 + block_rows], state = sosfilt(sos, data[r0:r0 + block_rows], axis=0, zi=state)
+    right, _ = sosfilt(sos, right, axis=0, zi=state)
+    # Backward pass from the end of the right extension
+    _, state = sosfilt(sos, right[::-1], axis=0, zi=zi * right[-1])
+    for r1 in range(n_rows, 0, -block_rows):
+        r0 = max(0, r1 - block_rows)
+        out, state = sosfilt(sos, data[r0:r1][::-1], axis=0, zi=state)
+        data[r0:r1] = out[::-1]
+    return data
+
+
+def filter_mea_data(data: np.ndarray, settings: dict, framerate: float) -> np.ndarray:
+    """
+    data filtered with get_filter_settings settings: in place for writable float arrays,
+    otherwise (e.g. a read-only memory-mapped cache) into a new array of the same float dtype.
+    """
+    if data.dtype.kind != "f":
+        raise ValueError("Filtering needs float storage ('float64' or 'float32'), not 'raw'")
+    if not data.flags.writeable:
+        data = np.array(data)
+    sos = get_filter_sos(settings, framerate)
+    return filter_data_in_place(data, sos, zero_phase=settings["zero_phase"])
@@ -0,0 +1,228 @@
+"""
+Metadata-only scan of a folder of MEA .h5 files with a sidecar index.
+
+scan_mea_file reads only attributes, dataset shapes and the small InfoChannel tables
+(never ChannelData samples). scan_mea_folder keeps the results in a JSON index in the folder
+(.datanalyzer_index.json); a file is scanned again only when its size or mtime changed, so
+a folder of thousands of files is described in milliseconds after the first scan. Files that
+cannot be scanned (partial exports, other .h5 files) are left out and recorded in the index
+as skipped with their error, which is raised only when such a file is selected.
+"""
+
+from pathlib import Path
+from typing import Dict, List, Optional
+import datetime
+import json
+import os
+import h5py
+
+from datanalyzer.models import DataInfo
+from .datetime_utils import convert_end_string_in_filename_to_datetime
+from .read_h5 import get_mea_stream_path, list_mea_streams, read_mea_duration, read_mea_info_channel
+
+FOLDER_INDEX_FORMAT_VERSION = 2
+FOLDER_INDEX_NAME = ".datanalyzer_index.json"
+
+
+def scan_mea_stream(f: "h5py.File", recording: int = 0, stream: int = 0) -> dict:
+    """duration (s), n_rows, n_channels, dtype, framerate and InfoChannel (lists) of one analog stream."""
+    ds = f[get_mea_stream_path(recording, stream) + "/ChannelData"]
+    meta = {"duration": read_mea_duration(f, recording)}
+    meta["n_rows"], meta["n_channels"] = (int(n) for n in ds.shape)
+    meta["dtype"] = str(ds.dtype)
+    meta["framerate"] = meta["n_rows"] / meta["duration"]
+    meta["info_channel"] = {key: value.tolist() for key, value in read_mea_info_channel(f, recording, stream).items()}
+    return meta
+
+
+def scan_mea_file(path: str) -> dict:
+    """
+    Metadata of one .h5 file: size, mtime_ns, duration (s), n_rows, n_channels, dtype,
+    framerate and InfoChannel (lists) of its first analog stream (normally
+    Recording_0/Stream_0), datetime (ISO string from the filename, or None) and segments:
+    the same fields plus recording, stream and start (s from the file start; recordings are
+    taken to follow each other) of every analog stream.
+    ValueError if the file has no analog stream with ChannelData.
+    """
+    st = os.stat(path)
+    meta = {"size": st.st_size, "mtime_ns": st.st_mtime_ns}
+    with h5py.File(path, "r") as f:
+        segments = []
+        starts = {}
+        for recording, stream in list_mea_streams(f):
+            if recording not in starts:
+                starts[recording] = float(sum(read_mea_duration(f, r) for r in starts))
+            segment = {"recording": recording, "stream": stream, "start": starts[recording]}
+            segment.update(scan_mea_stream(f, recording, stream))
+            segments.append(segment)
+    if not segments:
+        raise ValueError(f"No analog stream with ChannelData in {path}")
+    meta.update((k, v) for k, v in segments[0].items() if k not in ("recording", "stream", "start"))
+    meta["segments"] = segments
+    try:
+        meta["datetime"] = convert_end_string_in_filename_to_datetime(Path(path).name).isoformat()
+    except Exception:
+        meta["datetime"] = None
+    return meta
+
+
+def read_folder_index(
+    folder: str, index_name: str = FOLDER_INDEX_NAME, skipped: Optional[Dict[str, dict]] = None
+) -> Dict[str, dict]:
+    """
+    {file name: metadata} of the sidecar index of folder ({} if missing or unreadable).
+    skipped: dict to fill with {file name: {size, mtime_ns, error}} of files that could not be scanned.
+    """
+    try:
+        with open(Path(folder) / index_name) as f:
+            index = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if index.get("version") != FOLDER_INDEX_FORMAT_VERSION:
+        return {}
+    tables = index.get("info_channels", [])
+    files = index.get("files", {})
+    if skipped is not None:
+        skipped.update(index.get("skipped", {}))
+    for meta in files.values():
+        for item in [meta] + meta["segments"]:
+            item["info_channel"] = tables[item.pop("info_channel_id")]
+    return files
+
+
+def write_folder_index(
+    folder: str,
+    files: Dict[str, dict],
+    index_name: str = FOLDER_INDEX_NAME,
+    skipped: Optional[Dict[str, dict]] = None,
+) -> bool:
+    """
+    Write the sidecar index atomically; identical InfoChannel tables are stored once.
+    skipped: {file name: {size, mtime_ns, error}} of files that could not be scanned.
+    Returns False if the folder is not writable.
+    """
+    tables = []
+    table_ids = {}
+
+    def without_table(item: dict) -> dict:
+        key = json.dumps(item["info_channel"], sort_keys=True)
+        if key not in table_ids:
+            table_ids[key] = len(tables)
+            tables.append(item["info_channel"])
+        out_item = {k: v for k, v in item.items() if k != "info_channel"}
+        out_item["info_channel_id"] = table_ids[key]
+        return out_item
+
+    out = {}
+    for name, meta in files.items():
+        out[name] = without_table(meta)
+        out[name]["segments"] = [without_table(segment) for segment in meta["segments"]]
+    path = Path(folder) / index_name
+    tmp = path.with_name("%s.%d.tmp" % (path.name, os.getpid()))
+    try:
+        with open(tmp, "w") as f:
+            json.dump({
+                "version": FOLDER_INDEX_FORMAT_VERSION,
+                "info_channels": tables,
+                "files": out,
+                "skipped": skipped or {},
+            }, f)
+        os.replace(tmp, path)
+    except OSError:
+        return False
+    return True
+
+
+def scan_mea_folder(
+    folder: str,
+    file_type: str = ".h5",
+    use_index: bool = True,
+    index_name: str = FOLDER_INDEX_NAME,
+    skipped: Optional[Dict[str, dict]] = None,
+) -> Dict[str, dict]:
+    """
+    {file name: scan_mea_file metadata} of every file_type file in folder that can be
+    scanned, in sorted order. skipped: dict to fill with {file name: {size, mtime_ns, error}}
+    of the others (see get_scanned_file). With use_index, unchanged files (same size and
+    mtime) come from the sidecar index and the index is rewritten when files were added,
+    changed or removed.
+    """
+    folder = Path(folder)
+    if not folder.is_dir():
+        raise FileNotFoundError(f"Folder not found: {folder}")
+    cached_skipped = {}
+    cached = read_folder_index(folder, index_name, cached_skipped) if use_index else {}
+    files = {}
+    failed = {}
+    changed = False
+    for entry in sorted(os.scandir(folder), key=lambda e: e.name):
+        if not entry.name.endswith(file_type) or not entry.is_file():
+            continue
+        st = entry.stat()
+        meta = cached.get(entry.name) or cached_skipped.get(entry.name)
+        if meta is None or meta["size"] != st.st_size or meta["mtime_ns"] != st.st_mtime_ns:
+            try:
+                meta = scan_mea_file(entry.path)
+            except (OSError, KeyError, ValueError, ZeroDivisionError) as e:
+                meta = {"size": st.st_size, "mtime_ns": st.st_mtime_ns, "error": "%s: %s" % (type(e).__name__, e)}
+            changed = True
+        if "error" in meta:
+            failed[entry.name] = meta
+        else:
+            files[entry.name] = meta
+    if use_index and (changed or len(files) != len(cached) or len(failed) != len(cached_skipped)):
+        write_folder_index(folder, files, index_name, failed)
+    if skipped is not None:
+        skipped.update(failed)
+    return files
+
+
+def get_scanned_file(files: Dict[str, dict], name: str, skipped: Optional[Dict[str, dict]] = None) -> dict:
+    """Metadata of file name from scan_mea_folder; ValueError with the scan error if it was skipped."""
+    try:
+        return files[name]
+    except KeyError:
+        if skipped is not None and name in skipped:
+            raise ValueError(f"Cannot read metadata of {name}: {skipped[name]['error']}") from None
+        raise
+
+
+def get_segment_metadata(meta: dict, recording: int, stream: int) -> dict:
+    """
+    scan_mea_file metadata of one segment of a file: the file's fields with the segment's
+    duration, shape, framerate and InfoChannel, and its datetime shifted by the segment start.
+    """
+    for segment in meta["segments"]:
+        if segment["recording"] == recording and segment["stream"] == stream:
+            break
+    else:
+        raise KeyError(f"No Recording_{recording}/Stream_{stream} in file")
+    out = {k: v for k, v in meta.items() if k != "segments"}
+    out.update((k, v) for k, v in segment.items() if k not in ("recording", "stream", "start"))
+    if meta["datetime"] is not None:
+        start = datetime.datetime.fromisoformat(meta["datetime"]) + datetime.timedelta(seconds=segment["start"])
+        out["datetime"] = start.isoformat()
+    return out
+
+
+def get_folder_metadata(
+    info: DataInfo,
+    use_index: bool = True,
+    files: Optional[Dict[str, dict]] = None,
+    skipped: Optional[Dict[str, dict]] = None,
+) -> List[dict]:
+    """
+    Metadata (scan_mea_folder) of the files of DataInfo, in DataInfo.file_names order;
+    with DataInfo.segments, of each entry's segment (get_segment_metadata).
+    files, skipped: scan_mea_folder result to use instead of scanning the folder.
+    ValueError if a file of DataInfo could not be scanned.
+    """
+    if files is None:
+        skipped = {}
+        files = scan_mea_folder(info.folder_raw_files, info.file_type, use_index=use_index, skipped=skipped)
+    if not info.segments:
+        return [get_scanned_file(files, name, skipped) for name in info.file_names]
+    return [
+        get_segment_metadata(get_scanned_file(files, name, skipped), segment["recording"], segment["stream"])
+        for name, segment in zip(info.file_names, info.segments)
+    ]
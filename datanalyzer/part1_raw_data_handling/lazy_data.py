@@ -0,0 +1,160 @@
+"""
+Lazy Data container: same Data[ii]["data"] / Data[ii]["file_index"] access as the list of
+dicts from load_raw_mea_data_to_Data_and_DataInfo, but a file's chosen electrodes are
+read only when accessed and kept in an LRU cache with a byte budget.
+"""
+
+from collections import OrderedDict
+from collections.abc import Mapping, Sequence
+from typing import Any, Callable, Iterator, Tuple
+import numpy as np
+
+from .signal_pyramid import SignalPyramid
+
+
+def get_entry_nbytes(entry: dict) -> int:
+    """
+    Resident bytes of a loaded entry: its arrays and pyramid levels. Memory-mapped arrays
+    (ChannelDataCache entries) are paged in by the OS and not counted.
+    """
+    total = 0
+    for value in entry.values():
+        if isinstance(value, np.memmap):
+            continue
+        if isinstance(value, np.ndarray):
+            total += value.nbytes
+        elif isinstance(value, SignalPyramid):
+            # Its full-resolution data is the entry's own array
+            total += value.nbytes
+    return total
+
+
+class LazyDataEntry(Mapping):
+    """
+    One file of LazyData; "data" (and "scale"/"offset") are read or taken from the cache on
+    access. The first such access counts as the file's cache hit or miss, later keys do not.
+    """
+
+    def __init__(self, owner: "LazyData", ii: int):
+        self._owner = owner
+        self._ii = ii
+        self._counted = False
+
+    def __getitem__(self, key: str) -> Any:
+        if key == "file_index":
+            return self._ii + 1
+        if key in self._owner.entry_keys:
+            entry = self._owner.get_entry(self._ii, count_hit=not self._counted)
+            self._counted = True
+            return entry[key]
+        raise KeyError(key)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(("file_index",) + self._owner.entry_keys)
+
+    def __len__(self) -> int:
+        return 1 + len(self._owner.entry_keys)
+
+
+class LazyData(Sequence):
+    """
+    Data (list of {data, file_index}) that loads files on demand.
+    info: DataInfo with file list and MEA_columns; framerate must already be set.
+    loader(info, idx) -> (entry dict with "data", read stats dict) reads 1-based file idx.
+    cache_max_bytes: LRU budget for the arrays of loaded entries (get_entry_nbytes); an entry
+    larger than the budget is returned but not cached. hits (one per Data[ii] access or
+    get_entry call), misses and evictions count cache use.
+    storage: storage mode of the loader ("float64", "float32" or "raw"); "raw" entries
+    also have "scale" and "offset". extra_entry_keys: further keys the loader adds (e.g. "pyramid").
+    """
+
+    def __init__(
+        self,
+        info: Any,
+        loader: Callable[[Any, int], Tuple[dict, dict]],
+        cache_max_bytes: int = 512 * 2 ** 20,
+        storage: str = "float64",
+        extra_entry_keys: Tuple[str, ...] = (),
+    ):
+        self.info = info
+        self.loader = loader
+        self.cache_max_bytes = cache_max_bytes
+        self.storage = storage
+        self.entry_keys = (("data", "scale", "offset") if storage == "raw" else ("data",)) + tuple(extra_entry_keys)
+        self._cache = OrderedDict()
+        self.cache_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self.info.file_names)
+
+    @property
+    def n_columns(self) -> int:
+        """Number of data columns (chosen electrodes) per file."""
+        return len(self.info.MEA_columns)
+
+    def __getitem__(self, ii):
+        if isinstance(ii, slice):
+            return [self[kk] for kk in range(*ii.indices(len(self)))]
+        if ii < 0:
+            ii += len(self)
+        if ii < 0 or ii >= len(self):
+            raise IndexError(ii)
+        return LazyDataEntry(self, ii)
+
+    def get_data(self, ii: int) -> np.ndarray:
+        """Converted data of 0-based file ii, from the cache or read from disk."""
+        return self.get_entry(ii)["data"]
+
+    def get_entry(self, ii: int, count_hit: bool = True) -> dict:
+        """
+        Loaded entry ({"data", "file_index", ...}) of 0-based file ii, from the cache or read
+        from disk. count_hit=False: a cache hit is not counted (another key of the same access).
+        """
+        if ii in self._cache:
+            self._cache.move_to_end(ii)
+            self.hits += count_hit
+            return self._cache[ii][0]
+        entry, stats = self.loader(self.info, ii + 1)
+        return self.store_entry(ii, entry, stats)
+
+    def is_cached(self, ii: int) -> bool:
+        """True if 0-based file ii is in the cache (counters are not changed)."""
+        return ii in self._cache
+
+    def store_entry(self, ii: int, entry: dict, stats: dict) -> dict:
+        """
+        Count a miss and the read stats of a loaded entry of 0-based file ii and cache it, as
+        get_entry does after calling the loader (PrefetchReader calls the loader itself).
+        """
+        self.misses += 1
+        nbytes = get_entry_nbytes(entry)
+        if len(self.info.io_stats.get("bytes_read", [])) == len(self):
+            self.info.io_stats["bytes_read"][ii] += stats["bytes_read"]
+            self.info.io_stats["bytes_in_file"][ii] = stats["bytes_in_file"]
+        if nbytes <= self.cache_max_bytes:
+            self._cache[ii] = (entry, nbytes)
+            self.cache_bytes += nbytes
+            while self.cache_bytes > self.cache_max_bytes:
+                _, (_, old_nbytes) = self._cache.popitem(last=False)
+                self.cache_bytes -= old_nbytes
+                self.evictions += 1
+        return entry
+
+    def cache_info(self) -> dict:
+        """Cache counters: hits, misses, evictions, cached files and bytes, budget."""
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "files_cached": len(self._cache),
+            "cache_bytes": self.cache_bytes,
+            "cache_max_bytes": self.cache_max_bytes,
+        }
+
+    def clear_cache(self) -> None:
+        """Drop all cached arrays (counters are kept)."""
+        self._cache.clear()
+        self.cache_bytes = 0
@@ -2,14 +2,30 @@
 Load raw MEA data from .h5 folder into Data (list of dicts) and DataInfo.
 """
 
+import datetime
+import functools
+import warnings
+from contextlib import ExitStack
 from pathlib import Path
 from typing import List, Optional, Tuple
 import numpy as np
+import h5py
 
 from datanalyzer.models import DataInfo, Rule
+from datanalyzer.profiling import profile_stage
 from .mea_layout import read_mea_electrode_layout, find_mea_electrode_index, read_wanted_electrodes_of_measurement
 from .datetime_utils import convert_end_string_in_filename_to_datetime
-from .read_h5 import read_raw_mea_file, read_chosen_mea_electrode_data
+from .read_h5 import (
+    read_raw_mea_file,
+    read_chosen_mea_electrode_data,
+    get_mea_scale_and_offset,
+    get_mea_segment,
+)
+from .lazy_data import LazyData
+from .channel_cache import ChannelDataCache
+from .folder_index import get_folder_metadata, get_scanned_file, scan_mea_folder
+from .signal_pyramid import build_signal_pyramid
+from .filtering import filter_mea_data, get_filter_settings, get_filter_sos, get_sosfiltfilt_padlen
 
 
 def list_files(
@@ -48,7 +64,7 @@ def create_DataInfo_start(
     return info
 
 
-def load_raw_mea_data_to_Data_and_DataInfo(
+def create_DataInfo_of_folder(
     exp_name: Optional[str] = None,
     meas_name: Optional[str] = None,
     meas_date: Optional[str] = None,
@@ -57,13 +73,18 @@ def load_raw_mea_data_to_Data_and_DataInfo(
     folder_of_files: Optional[str] = None,
     file_numbers_to_analyze: Optional[List[int]] = None,
     manually_chosen_mea_electrodes: Optional[List[int]] = None,
-) -> Tuple[List[dict], DataInfo]:
+    read_metadata: bool = False,
+    use_index: bool = True,
+    all_streams: bool = False,
+) -> DataInfo:
     """
-    Load MEA .h5 data into Data and DataInfo.
-    If folder_of_files is None, only DataInfo is set up (no loading).
-    file_numbers_to_analyze: 1-based indices into file list (default: all).
-    manually_chosen_mea_electrodes: electrode numbers to load; if None, uses
-    read_wanted_electrodes_of_measurement(exp_name, meas_name) or all from layout.
+    Set up DataInfo (file list, electrode layout, chosen MEA columns) without reading data.
+    Arguments as in load_raw_mea_data_to_Data_and_DataInfo. framerate and
+    measurement_time are filled in later with set_DataInfo_measurement_time, or here with
+    read_metadata: from HDF5 attributes and shapes only (scan_mea_folder; with use_index the
+    folder's sidecar index is used and updated), also setting DataInfo.file_metadata.
+    all_streams: one DataInfo entry per recording and analog stream of each file
+    (set_DataInfo_segments); implies read_metadata.
     """
     exp_name = exp_name or "Exp_11311_EURCCS_p32_180820"
     meas_name = meas_name or "mea21001a"
@@ -100,7 +121,7 @@ def load_raw_mea_data_to_Data_and_DataInfo(
             datacol_numbers=list(range(1, len(mea_columns) + 1)),
         )
         info.Rule = Rule(frame_rate=25e3, signal="MEA", max_bpm=120, min_peak_value=2.5e-5)
-        return [], info
+        return info
 
     folder_raw_files, filename_list = list_files(file_type, folder_of_files)
     if file_numbers_to_analyze is None:
@@ -115,43 +136,338 @@ def load_raw_mea_data_to_Data_and_DataInfo(
     info.MEA_columns = mea_columns
     info.datacol_numbers = list(range(1, len(mea_columns) + 1))
     info.Rule = Rule(frame_rate=25e3, signal="MEA", max_bpm=120, min_peak_value=2.5e-5)
+    if all_streams:
+        skipped = {}
+        files = scan_mea_folder(folder_raw_files, file_type, use_index=use_index, skipped=skipped)
+        set_DataInfo_segments(info, files, skipped)
+        set_DataInfo_from_folder_metadata(info, get_folder_metadata(info, files=files, skipped=skipped))
+    elif read_metadata:
+        set_DataInfo_from_folder_metadata(info, get_folder_metadata(info, use_index=use_index))
+    return info
 
-    n_files = len(file_names)
-    framerates = []
-    measurement_datetime = []
-    measurement_duration = []
-    measurement_time_sec = []
-    measurement_names = []
-    Data = []
 
-    for idx in range(1, n_files + 1):
-        try:
-            dt = convert_end_string_in_filename_to_datetime(info.file_names[idx - 1])
-        except Exception:
-            import datetime as dtmod
-            dt = dtmod.datetime.now()
-        rawmeadata, fs = read_raw_mea_file(info, idx)
-        chosen = read_chosen_mea_electrode_data(info, rawmeadata)
-
-        framerates.append(fs)
-        measurement_datetime.append(dt)
-        if idx == 1:
-            meas_duration_sec = 0.0
-        else:
-            meas_duration_sec = (dt - measurement_datetime[0]).total_seconds()
-        measurement_duration.append(meas_duration_sec)
-        measurement_time_sec.append(meas_duration_sec)
-        measurement_names.append(info.file_names[idx - 1].replace(".h5", ""))
-
-        Data.append({
-            "data": chosen,
-            "file_index": idx,
-        })
+def set_DataInfo_segments(info: DataInfo, files: dict, skipped: Optional[dict] = None) -> DataInfo:
+    """
+    Give every recording and analog stream (scan_mea_folder segments) of the files of DataInfo
+    its own entry: file_names repeats a file once per segment and DataInfo.segments holds the
+    recording, stream and start. Streams with fewer channels than MEA_columns need are skipped.
+    skipped: files scan_mea_folder could not scan; ValueError if one of them is in DataInfo.
+    """
+    n_channels_needed = max(info.MEA_columns) if info.MEA_columns else 0
+    file_names = []
+    segments = []
+    for name in info.file_names:
+        for segment in get_scanned_file(files, name, skipped)["segments"]:
+            if segment["n_channels"] < n_channels_needed:
+                continue
+            file_names.append(name)
+            segments.append({key: segment[key] for key in ("recording", "stream", "start")})
+    info.file_names = file_names
+    info.files_amount = len(file_names)
+    info.segments = segments
+    return info
+
+
+def get_file_label(info: DataInfo, idx: int) -> str:
+    """Name of file idx (1-based) without extension, with _Recording_N_Stream_M for segments."""
+    label = info.file_names[idx - 1].replace(".h5", "")
+    if info.segments:
+        label += "_Recording_%d_Stream_%d" % get_mea_segment(info, idx)
+    return label
+
+
+def read_file_datetime(info: DataInfo, idx: int) -> datetime.datetime:
+    """
+    Measurement datetime of file idx (1-based) from its filename (plus the segment start with
+    DataInfo.segments); now() if not parseable.
+    """
+    try:
+        dt = convert_end_string_in_filename_to_datetime(info.file_names[idx - 1])
+    except Exception:
+        return datetime.datetime.now()
+    if info.segments:
+        dt += datetime.timedelta(seconds=info.segments[idx - 1]["start"])
+    return dt
+
 
+def set_DataInfo_measurement_time(
+    info: DataInfo,
+    framerates: List[float],
+    measurement_datetime: List[datetime.datetime],
+) -> DataInfo:
+    """Fill DataInfo.framerate and measurement_time (datetime, duration, time_sec, names) per file."""
+    measurement_duration = [
+        0.0 if idx == 0 else (dt - measurement_datetime[0]).total_seconds()
+        for idx, dt in enumerate(measurement_datetime)
+    ]
     info.framerate = np.array(framerates).reshape(-1, 1)
     info.measurement_time["datetime"] = np.array(measurement_datetime)
     info.measurement_time["duration"] = np.array(measurement_duration, dtype=float)
-    info.measurement_time["time_sec"] = np.array(measurement_time_sec, dtype=float)
-    info.measurement_time["names"] = measurement_names
+    info.measurement_time["time_sec"] = np.array(measurement_duration, dtype=float)
+    info.measurement_time["names"] = [get_file_label(info, idx) for idx in range(1, len(info.file_names) + 1)]
+    return info
+
+
+def set_DataInfo_from_folder_metadata(info: DataInfo, metadata: List[dict]) -> DataInfo:
+    """
+    Fill DataInfo.framerate, measurement_time and file_metadata from scanned metadata
+    (get_folder_metadata); files without a datetime in their name get now() as in read_file_datetime.
+    """
+    datetimes = [
+        datetime.datetime.fromisoformat(meta["datetime"]) if meta["datetime"] else read_file_datetime(info, idx)
+        for idx, meta in enumerate(metadata, start=1)
+    ]
+    set_DataInfo_measurement_time(info, [meta["framerate"] for meta in metadata], datetimes)
+    info.file_metadata = metadata
+    return info
+
+
+def load_chosen_mea_electrode_data(
+    info: DataInfo,
+    idx: int,
+    storage: str = "float64",
+    cache_dir: Optional[str] = None,
+    pyramid: bool = False,
+    Rule_in: Optional[Rule] = None,
+    h5file: Optional[h5py.File] = None,
+) -> Tuple[dict, dict]:
+    """
+    Read chosen electrodes (info.MEA_columns) of file idx (1-based) and convert to Volts.
+    Returns (Data entry {"data", "file_index"}, read stats {"framerate", "bytes_read", "bytes_in_file"}).
+    storage "raw" keeps ADC integers and adds per-column "scale" and "offset" to the entry.
+    cache_dir: ChannelDataCache folder; a valid cached copy is memory-mapped instead of
+    reading the .h5 file (bytes_read 0), otherwise the converted data is cached after reading.
+    pyramid: also add entry["pyramid"], a SignalPyramid for plotting (kept in the cache too).
+    Rule_in: if it sets filter_highpass, filter_lowpass or filter_notch, the data is filtered
+    block by block in place (see filtering); the cache keeps the unfiltered data, and the
+    pyramid is built from the filtered data and not cached. A file too short for zero-phase
+    filtering is filtered causally, listed in info.io_stats["zero_phase_too_short"] and warned about.
+    h5file: the file of idx, already open (see read_raw_mea_file).
+    """
+    filter_settings = get_filter_settings(Rule_in)
+    if filter_settings is not None and storage == "raw":
+        raise ValueError("Filtering needs float storage ('float64' or 'float32'), not 'raw'")
+    with profile_stage("load_file", idx):
+        read_columns = np.asarray(info.MEA_columns, dtype=int) - 1
+        segment = get_mea_segment(info, idx)
+        cache = None
+        if cache_dir is not None:
+            cache = ChannelDataCache(cache_dir)
+            path = info.folder_raw_files + info.file_names[idx - 1]
+            cached = cache.get(path, read_columns, storage, segment)
+            if cached is not None:
+                entry, manifest = cached
+                entry["file_index"] = idx
+                stats = {"framerate": manifest["framerate"], "bytes_read": 0, "bytes_in_file": manifest["bytes_in_file"]}
+                if filter_settings is not None:
+                    entry["data"] = filter_entry_data(info, entry["data"], filter_settings, stats["framerate"], idx)
+                    if pyramid:
+                        entry["pyramid"] = build_entry_pyramid(entry, stats["framerate"], idx)
+                elif pyramid:
+                    entry["pyramid"] = cache.get_pyramid(path, read_columns, storage, segment)
+                    if entry["pyramid"] is None:
+                        entry["pyramid"] = build_entry_pyramid(entry, stats["framerate"], idx)
+                        cache.put_pyramid(path, read_columns, storage, entry["pyramid"], segment)
+                    attach_pyramid_data(entry)
+                return entry, stats
+        rawmeadata, fs = read_raw_mea_file(info, idx, columns=read_columns, h5file=h5file)
+        entry = {
+            "data": read_chosen_mea_electrode_data(info, rawmeadata, storage=storage),
+            "file_index": idx,
+        }
+        if storage == "raw":
+            entry["scale"], entry["offset"] = get_mea_scale_and_offset(rawmeadata["info"], read_columns)
+        stats = {
+            "framerate": fs,
+            "bytes_read": rawmeadata["bytes_read"],
+            "bytes_in_file": rawmeadata["bytes_in_file"],
+        }
+        if cache is not None:
+            cache.put(path, read_columns, storage, entry, fs, rawmeadata["bytes_in_file"], segment)
+        if filter_settings is not None:
+            entry["data"] = filter_entry_data(info, entry["data"], filter_settings, fs, idx)
+        if pyramid:
+            entry["pyramid"] = build_entry_pyramid(entry, fs, idx)
+            if cache is not None and filter_settings is None:
+                cache.put_pyramid(path, read_columns, storage, entry["pyramid"], segment)
+        return entry, stats
+
+
+def filter_entry_data(info: DataInfo, data: np.ndarray, settings: dict, framerate: float, idx: int) -> np.ndarray:
+    """filter_mea_data of a loaded entry's data, as profiling stage "filter"."""
+    n_rows = data.shape[0]
+    if settings["zero_phase"] and 0 < n_rows <= get_sosfiltfilt_padlen(get_filter_sos(settings, framerate)):
+        # Too short for sosfiltfilt's odd extension: the other files of the run are still filtered zero-phase
+        info.io_stats.setdefault("zero_phase_too_short", []).append(idx)
+        warnings.warn(
+            "%s has only %d samples, too few for zero-phase filtering: filtered causally" % (
+                get_file_label(info, idx), n_rows),
+            stacklevel=2,
+        )
+        settings = dict(settings, zero_phase=False)
+    with profile_stage("filter", idx) as rec:
+        data = filter_mea_data(data, settings, framerate)
+        rec.add(array_bytes=data.nbytes)
+    return data
+
+
+def build_entry_pyramid(entry: dict, framerate: float, idx: int):
+    """SignalPyramid of a loaded entry (see build_signal_pyramid)."""
+    with profile_stage("build_pyramid", idx) as rec:
+        pyramid = build_signal_pyramid(entry, framerate)
+        rec.add(array_bytes=pyramid.nbytes)
+    return pyramid
+
+
+def attach_pyramid_data(entry: dict) -> None:
+    """Link a stored pyramid to the entry's full-resolution data (for zoomed-in windows)."""
+    entry["pyramid"].data = entry["data"]
+    entry["pyramid"].scale = entry.get("scale")
+    entry["pyramid"].offset = entry.get("offset")
+
 
+def set_DataInfo_of_read_files(
+    info: DataInfo,
+    framerates: np.ndarray,
+    bytes_read: np.ndarray,
+    bytes_in_file: np.ndarray,
+) -> DataInfo:
+    """
+    Fill framerate, measurement_time and io_stats after files were read outside
+    load_raw_mea_data_to_Data_and_DataInfo; files not read (NaN framerate) get the first known one.
+    """
+    framerates = np.array(framerates, dtype=float)
+    if np.isnan(framerates).any():
+        known = framerates[~np.isnan(framerates)]
+        framerates[np.isnan(framerates)] = known[0] if known.size else info.Rule.frame_rate
+    set_DataInfo_measurement_time(
+        info,
+        list(framerates),
+        [read_file_datetime(info, idx) for idx in range(1, len(info.file_names) + 1)],
+    )
+    info.io_stats["bytes_read"] = np.asarray(bytes_read, dtype=np.int64)
+    info.io_stats["bytes_in_file"] = np.asarray(bytes_in_file, dtype=np.int64)
+    return info
+
+
+def load_raw_mea_data_to_Data_and_DataInfo(
+    exp_name: Optional[str] = None,
+    meas_name: Optional[str] = None,
+    meas_date: Optional[str] = None,
+    file_type: str = ".h5",
+    mea_layout_name: Optional[str] = None,
+    folder_of_files: Optional[str] = None,
+    file_numbers_to_analyze: Optional[List[int]] = None,
+    manually_chosen_mea_electrodes: Optional[List[int]] = None,
+    lazy: bool = False,
+    cache_max_bytes: int = 512 * 2 ** 20,
+    storage: str = "float64",
+    cache_dir: Optional[str] = None,
+    pyramid: bool = False,
+    Rule_in: Optional[Rule] = None,
+    all_streams: bool = False,
+) -> Tuple[List[dict], DataInfo]:
+    """
+    Load MEA .h5 data into Data and DataInfo.
+    If folder_of_files is None, only DataInfo is set up (no loading).
+    file_numbers_to_analyze: 1-based indices into file list (default: all).
+    manually_chosen_mea_electrodes: electrode numbers to load; if None, uses
+    read_wanted_electrodes_of_measurement(exp_name, meas_name) or all from layout.
+    lazy: if True, Data is a LazyData that reads a file only when Data[ii]["data"] is
+    accessed and keeps at most cache_max_bytes of converted data in an LRU cache.
+    storage: "float64" (default), "float32" or "raw". "raw" keeps the ADC integers in
+    Data[ii]["data"] with per-column Data[ii]["scale"] and Data[ii]["offset"]
+    (Volts = (raw - offset) * scale); find_peaks_in_loop converts thresholds instead of data.
+    cache_dir: folder of a ChannelDataCache. Files with a valid cached copy are opened as
+    read-only np.memmap arrays (no .h5 decoding); others are read and then cached. A cached
+    copy is rebuilt when its source file changes (size or mtime).
+    pyramid: add Data[ii]["pyramid"], a min/max SignalPyramid for fast plotting
+    (part4_visualization), built while loading and stored with cache_dir entries.
+    Rule_in: peak-finding Rule, stored as DataInfo.Rule; its filter_* fields (band-pass /
+    notch, see filtering) are applied to each file block by block right after conversion.
+    all_streams: every recording and analog stream of a file is its own Data / DataInfo entry
+    (DataInfo.segments) with its own framerate and measurement time; the segments of a file
+    are read with the file opened once.
+    """
+    info = create_DataInfo_of_folder(
+        exp_name=exp_name,
+        meas_name=meas_name,
+        meas_date=meas_date,
+        file_type=file_type,
+        mea_layout_name=mea_layout_name,
+        folder_of_files=folder_of_files,
+        file_numbers_to_analyze=file_numbers_to_analyze,
+        manually_chosen_mea_electrodes=manually_chosen_mea_electrodes,
+        all_streams=all_streams,
+    )
+    if Rule_in is not None:
+        info.Rule = Rule_in
+    if folder_of_files is None:
+        return [], info
+    Data = load_Data_of_DataInfo(
+        info, lazy=lazy, cache_max_bytes=cache_max_bytes, storage=storage, cache_dir=cache_dir, pyramid=pyramid,
+        Rule_in=Rule_in,
+    )
     return Data, info
+
+
+def load_Data_of_DataInfo(
+    info: DataInfo,
+    lazy: bool = False,
+    cache_max_bytes: int = 512 * 2 ** 20,
+    storage: str = "float64",
+    cache_dir: Optional[str] = None,
+    pyramid: bool = False,
+    Rule_in: Optional[Rule] = None,
+) -> List[dict]:
+    """
+    Data of the files of a DataInfo set up with create_DataInfo_of_folder; arguments as in
+    load_raw_mea_data_to_Data_and_DataInfo. DataInfo.framerate, measurement_time and io_stats
+    are filled in (with lazy, from the folder metadata unless DataInfo.file_metadata is set).
+    """
+    n_files = len(info.file_names)
+    if lazy:
+        if len(info.file_metadata) != n_files:
+            set_DataInfo_from_folder_metadata(info, get_folder_metadata(info))
+        info.io_stats["bytes_read"] = np.zeros(n_files, dtype=np.int64)
+        info.io_stats["bytes_in_file"] = np.zeros(n_files, dtype=np.int64)
+        loader = functools.partial(
+            load_chosen_mea_electrode_data, storage=storage, cache_dir=cache_dir, pyramid=pyramid, Rule_in=Rule_in
+        )
+        extra_entry_keys = ("pyramid",) if pyramid else ()
+        return LazyData(
+            info, loader, cache_max_bytes=cache_max_bytes, storage=storage, extra_entry_keys=extra_entry_keys
+        )
+
+    framerates = []
+    measurement_datetime = []
+    bytes_read = []
+    bytes_in_file = []
+    Data = []
+
+    # Segments of one file follow each other: the file stays open while they are read
+    with ExitStack() as open_file:
+        open_name = None
+        h5file = None
+        for idx in range(1, n_files + 1):
+            dt = read_file_datetime(info, idx)
+            if info.segments and info.file_names[idx - 1] != open_name:
+                open_file.close()
+                open_name = info.file_names[idx - 1]
+                h5file = open_file.enter_context(h5py.File(info.folder_raw_files + open_name, "r"))
+            entry, stats = load_chosen_mea_electrode_data(
+                info, idx, storage=storage, cache_dir=cache_dir, pyramid=pyramid, Rule_in=Rule_in, h5file=h5file
+            )
+            bytes_read.append(stats["bytes_read"])
+            bytes_in_file.append(stats["bytes_in_file"])
+
+            framerates.append(stats["framerate"])
+            measurement_datetime.append(dt)
+
+            Data.append(entry)
+
+    set_DataInfo_measurement_time(info, framerates, measurement_datetime)
+    info.io_stats["bytes_read"] = np.array(bytes_read, dtype=np.int64)
+    info.io_stats["bytes_in_file"] = np.array(bytes_in_file, dtype=np.int64)
+
+    return Data
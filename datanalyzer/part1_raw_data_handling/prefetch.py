@@ -0,0 +1,128 @@
+"""
+Prefetching reader: the next files of a LazyData are read and converted in a background
+thread while the current file is processed, so disk (or network) reads overlap with CPU work.
+
+Files read ahead wait in a bounded queue of at most depth files; a new read is started only while
+the queued files and the next one (sizes from DataInfo.file_metadata when known, else the
+largest file so far) stay within max_bytes. metrics() reports how much of the load time was
+hidden behind processing.
+"""
+
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Iterator, List, Tuple
+import time
+import numpy as np
+
+from datanalyzer.profiling import profile_stage
+from .lazy_data import LazyData
+
+PREFETCH_MAX_BYTES = 512 * 2 ** 20
+
+
+class PrefetchReader:
+    """
+    Iterate (file_index, entry) of Data for 1-based filenumbers, in order, with up to depth
+    files loaded ahead by one background thread. Data that is not a LazyData (a list of loaded
+    entries), files already in the LazyData cache and depth 0 are returned without a thread.
+    Loaded entries are stored in the LazyData cache and io_stats as if read by Data[ii].
+    """
+
+    def __init__(
+        self,
+        Data: Any,
+        filenumbers: List[int],
+        depth: int = 2,
+        max_bytes: int = PREFETCH_MAX_BYTES,
+    ):
+        self.Data = Data
+        self.filenumbers = list(filenumbers)
+        self.depth = depth
+        self.max_bytes = max_bytes
+        self.files_loaded = 0
+        self.load_seconds = 0.0
+        self.wait_seconds = 0.0
+        self.max_queued_bytes = 0
+
+    def _load(self, ii: int) -> Tuple[dict, dict, float]:
+        t0 = time.perf_counter()
+        entry, stats = self.Data.loader(self.Data.info, ii + 1)
+        return entry, stats, time.perf_counter() - t0
+
+    def _estimate_bytes(self, ii: int, largest: int) -> int:
+        """Converted size of 0-based file ii from DataInfo.file_metadata, else the largest file so far."""
+        info = self.Data.info
+        try:
+            meta = info.file_metadata[ii]
+            itemsize = np.dtype(meta["dtype"] if self.Data.storage == "raw" else self.Data.storage).itemsize
+            return meta["n_rows"] * len(info.MEA_columns) * itemsize
+        except (AttributeError, IndexError, KeyError):
+            return largest
+
+    def _queued_bytes(self, pending: deque, largest: int) -> int:
+        total = 0
+        for file_idx, future in pending:
+            if future is None:
+                continue
+            if future.done() and future.exception() is None:
+                total += future.result()[0]["data"].nbytes
+            else:
+                total += self._estimate_bytes(file_idx - 1, largest)
+        return total
+
+    def __iter__(self) -> Iterator[Tuple[int, Any]]:
+        Data = self.Data
+        if not isinstance(Data, LazyData) or self.depth < 1:
+            for file_idx in self.filenumbers:
+                yield file_idx, Data[file_idx - 1]
+            return
+        pending = deque()  # (file_idx, future), future None for files already in the cache
+        todo = deque(self.filenumbers)
+        largest = 0
+        executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="prefetch")
+        try:
+            while todo or pending:
+                # The first pending file is the next one to return; depth more are read ahead
+                while todo and len(pending) <= self.depth:
+                    file_idx = todo[0]
+                    if Data.is_cached(file_idx - 1):
+                        pending.append((todo.popleft(), None))
+                        continue
+                    queued = self._queued_bytes(pending, largest) + self._estimate_bytes(file_idx - 1, largest)
+                    if pending and queued > self.max_bytes:
+                        break
+                    pending.append((todo.popleft(), executor.submit(self._load, file_idx - 1)))
+                    self.max_queued_bytes = max(self.max_queued_bytes, queued)
+                file_idx, future = pending.popleft()
+                if future is None:
+                    yield file_idx, Data[file_idx - 1]
+                    continue
+                with profile_stage("prefetch_wait", file_idx):
+                    t0 = time.perf_counter()
+                    entry, stats, seconds = future.result()
+                    self.wait_seconds += time.perf_counter() - t0
+                self.files_loaded += 1
+                self.load_seconds += seconds
+                largest = max(largest, entry["data"].nbytes)
+                yield file_idx, Data.store_entry(file_idx - 1, entry, stats)
+        finally:
+            for _, future in pending:
+                if future is not None:
+                    future.cancel()
+            executor.shutdown(wait=True)
+
+    def metrics(self) -> dict:
+        """
+        files_loaded, load_seconds (background load time), wait_seconds (time the consumer
+        waited for a file), hidden_seconds (load time overlapped with processing),
+        hidden_fraction and max_queued_bytes.
+        """
+        hidden = max(0.0, self.load_seconds - self.wait_seconds)
+        return {
+            "files_loaded": self.files_loaded,
+            "load_seconds": self.load_seconds,
+            "wait_seconds": self.wait_seconds,
+            "hidden_seconds": hidden,
+            "hidden_fraction": hidden / self.load_seconds if self.load_seconds > 0 else 0.0,
+            "max_queued_bytes": self.max_queued_bytes,
+        }
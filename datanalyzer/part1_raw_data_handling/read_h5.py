@@ -1,66 +1,262 @@
 """
 Read MEA data from HDF5 (.h5) files (Multichannel Systems format).
+
+A file holds one or more recordings (/Data/Recording_N), each with one or more analog streams
+(AnalogStream/Stream_M). DataInfo.segments selects the (recording, stream) of each entry of
+DataInfo.file_names; without segments every file is read from Recording_0/Stream_0.
 """
 
-from typing import Optional, Tuple
+from contextlib import nullcontext
+from typing import Any, List, Optional, Sequence, Tuple
+import re
 import numpy as np
 import h5py
 
+from datanalyzer.profiling import profile_stage
+
+RECORDING_PATH = "/Data/Recording_%d"
+STREAM_PATH = RECORDING_PATH + "/AnalogStream/Stream_%d"
+
+
+def get_mea_stream_path(recording: int = 0, stream: int = 0) -> str:
+    """HDF5 group of analog stream `stream` of recording `recording`."""
+    return STREAM_PATH % (recording, stream)
+
+
+def get_mea_segment(info: Any, index: int) -> Tuple[int, int]:
+    """(recording, stream) of 1-based file index of info (DataInfo.segments), (0, 0) without segments."""
+    segments = getattr(info, "segments", None)
+    if not segments:
+        return 0, 0
+    segment = segments[index - 1]
+    return int(segment["recording"]), int(segment["stream"])
+
+
+def list_mea_streams(f: "h5py.File") -> List[Tuple[int, int]]:
+    """(recording, stream) of every analog stream with ChannelData in f, in numeric order."""
+    def numbered(group: Any, prefix: str) -> List[int]:
+        return sorted(int(m.group(1)) for m in (re.fullmatch(prefix + r"_(\d+)", name) for name in group) if m)
+
+    streams = []
+    data = f.get("/Data")
+    if data is None:
+        return streams
+    for recording in numbered(data, "Recording"):
+        analog = data["Recording_%d" % recording].get("AnalogStream")
+        if analog is None:
+            continue
+        for stream in numbered(analog, "Stream"):
+            if "ChannelData" in analog["Stream_%d" % stream]:
+                streams.append((recording, stream))
+    return streams
+
+
+def read_mea_columns(
+    ds: "h5py.Dataset",
+    columns: Sequence[int],
+    start_row: int = 0,
+    stop_row: Optional[int] = None,
+) -> Tuple[np.ndarray, int]:
+    """
+    Read only the given 0-based columns (rows start_row:stop_row) of a ChannelData dataset.
+    Read order follows the chunk layout: contiguous data is read with one hyperslab
+    selection, chunks holding all channels are read one chunk row band at a time (each
+    chunk decoded once), and column-split chunks are read per chunk column so untouched
+    channels are never decoded.
+    Returns (array in requested column order, estimated bytes read from the file).
+    """
+    cols = np.asarray(columns, dtype=int)
+    n_rows_total, n_cols_total = ds.shape
+    if stop_row is None or stop_row > n_rows_total:
+        stop_row = n_rows_total
+    start_row = max(0, min(start_row, stop_row))
+    uniq, inverse = np.unique(cols, return_inverse=True)
+    if uniq.size and (uniq[0] < 0 or uniq[-1] >= n_cols_total):
+        raise IndexError(f"Column index out of range 0..{n_cols_total - 1}: {cols.tolist()}")
+    n_rows = stop_row - start_row
+    out = np.empty((n_rows, uniq.size), dtype=ds.dtype)
+    if n_rows == 0 or uniq.size == 0:
+        return out[:, inverse], 0
+
+    chunks = ds.chunks
+    if chunks is None:
+        out[:] = ds[start_row:stop_row, uniq.tolist()]
+        bytes_read = out.nbytes
+    else:
+        chunk_rows, chunk_cols = chunks
+        first_band = start_row // chunk_rows
+        last_band = (stop_row - 1) // chunk_rows
+        chunk_col_ids = uniq // chunk_cols
+        if chunk_cols >= n_cols_total:
+            for band in range(first_band, last_band + 1):
+                r0 = max(start_row, band * chunk_rows)
+                r1 = min(stop_row, (band + 1) * chunk_rows)
+                out[r0 - start_row : r1 - start_row] = ds[r0:r1, uniq.tolist()]
+        else:
+            for chunk_col in np.unique(chunk_col_ids):
+                pos = np.nonzero(chunk_col_ids == chunk_col)[0]
+                out[:, pos] = ds[start_row:stop_row, uniq[pos].tolist()]
+        n_chunks_touched = (last_band - first_band + 1) * np.unique(chunk_col_ids).size
+        n_chunks_total = -(-n_rows_total // chunk_rows) * -(-n_cols_total // chunk_cols)
+        bytes_read = int(ds.id.get_storage_size() * n_chunks_touched / n_chunks_total)
+    if not np.array_equal(uniq, cols):
+        out = out[:, inverse]
+    return out, int(bytes_read)
+
 
 def read_raw_mea_file(
     info: "object",
     index: int,
+    columns: Optional[Sequence[int]] = None,
+    h5file: Optional["h5py.File"] = None,
 ) -> Tuple[dict, float]:
     """
     Read single MEA .h5 file: duration, ChannelData, InfoChannel, framerate.
-    index is 1-based file index. Returns (rawmeadata dict, framerate).
+    index is 1-based file index; its recording and stream come from get_mea_segment.
+    h5file: the file, already open (several segments of one file are read in one pass).
+    Returns (rawmeadata dict, framerate).
+    columns: 0-based ChannelData columns to read (default: all). When given, only those
+    channels are read (read_mea_columns) and rawmeadata["columns"] lists them.
+    rawmeadata["bytes_read"] and rawmeadata["bytes_in_file"] report the I/O cost.
     """
     path = info.folder_raw_files + info.file_names[index - 1]
+    recording, stream = get_mea_segment(info, index)
+    stream_path = get_mea_stream_path(recording, stream)
     rawmeadata = {}
-    with h5py.File(path, "r") as f:
-        try:
-            dur_attr = f["/Data/Recording_0"].attrs.get("Duration")
-            rawmeadata["duration"] = float(dur_attr) * 1e-6
-        except (KeyError, TypeError):
-            rawmeadata["duration"] = 60.0
-        ds = f["/Data/Recording_0/AnalogStream/Stream_0/ChannelData"]
-        rawmeadata["MCSFile"] = np.array(ds[:])
-        rawmeadata["info"] = {}
-        info_ds = f["/Data/Recording_0/AnalogStream/Stream_0/InfoChannel"]
-        for key in info_ds.keys():
-            rawmeadata["info"][key] = np.array(info_ds[key][:])
-        n_rows = rawmeadata["MCSFile"].shape[0]
-        rawmeadata["framerate"] = n_rows / rawmeadata["duration"]
+    with profile_stage("hdf5_read", index) as rec:
+        with (h5py.File(path, "r") if h5file is None else nullcontext(h5file)) as f:
+            rawmeadata["duration"] = read_mea_duration(f, recording)
+            ds = f[stream_path + "/ChannelData"]
+            rawmeadata["bytes_in_file"] = int(ds.id.get_storage_size())
+            if columns is None:
+                rawmeadata["MCSFile"] = np.array(ds[:])
+                rawmeadata["bytes_read"] = rawmeadata["bytes_in_file"]
+            else:
+                rawmeadata["columns"] = np.asarray(columns, dtype=int)
+                rawmeadata["MCSFile"], rawmeadata["bytes_read"] = read_mea_columns(ds, rawmeadata["columns"])
+            n_rows = ds.shape[0]
+            rawmeadata["info"] = read_mea_info_channel(f, recording, stream)
+            rawmeadata["framerate"] = n_rows / rawmeadata["duration"]
+        rec.add(bytes_read=rawmeadata["bytes_read"], array_bytes=rawmeadata["MCSFile"].nbytes)
     return rawmeadata, rawmeadata["framerate"]
 
 
-def read_chosen_mea_electrode_data(info: "object", rawmeadata: dict) -> np.ndarray:
+def read_mea_duration(f: "h5py.File", recording: int = 0) -> float:
+    """Duration in seconds of a recording from its Duration attribute (µs); 60 s if missing."""
+    try:
+        return float(f[RECORDING_PATH % recording].attrs.get("Duration")) * 1e-6
+    except (KeyError, TypeError):
+        return 60.0
+
+
+def read_mea_info_channel(f: "h5py.File", recording: int = 0, stream: int = 0) -> dict:
+    """Read InfoChannel fields (ADZero, ConversionFactor, Exponent, ...) into a dict of arrays."""
+    info_ds = f[get_mea_stream_path(recording, stream) + "/InfoChannel"]
+    return {key: np.array(info_ds[key][:]) for key in info_ds.keys()}
+
+
+def read_mea_file_framerate(info: "object", index: int) -> float:
+    """
+    Framerate of MEA .h5 file (1-based index) from ChannelData shape and Duration only,
+    without reading the samples (same value as read_raw_mea_file).
+    """
+    path = info.folder_raw_files + info.file_names[index - 1]
+    recording, stream = get_mea_segment(info, index)
+    with h5py.File(path, "r") as f:
+        duration = read_mea_duration(f, recording)
+        n_rows = f[get_mea_stream_path(recording, stream) + "/ChannelData"].shape[0]
+    return n_rows / duration
+
+
+def read_chosen_mea_electrode_data(info: "object", rawmeadata: dict, storage: str = "float64") -> np.ndarray:
     """
     From raw MEA file data, extract chosen electrode columns and convert to Volts.
     Columns are 1-based in MEA_columns; HDF5 indexing uses 0-based so we use col - 1.
+    If rawmeadata holds only a column subset (rawmeadata["columns"]), it is indexed by position.
+    storage: "float64" (Volts), "float32" (Volts, half the memory) or "raw" (ADC integers
+    as stored; convert with get_mea_scale_and_offset: Volts = (raw - offset) * scale).
     """
     cols = np.asarray(info.MEA_columns, dtype=int) - 1
     MCS = rawmeadata["MCSFile"]
     inf = rawmeadata["info"]
+    if "columns" in rawmeadata:
+        position = {int(c): pos for pos, c in enumerate(rawmeadata["columns"])}
+        sel = [position[int(c)] for c in cols]
+        if sel != list(range(MCS.shape[1])):
+            MCS = MCS[:, sel]
+    else:
+        MCS = MCS[:, cols]
+    return convert_mea_data_to_storage(MCS, inf, cols, storage)
+
+
+def get_mea_scale_and_offset(inf: dict, cols: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Per-channel (scale, offset) for ChannelData columns cols: Volts = (raw - offset) * scale."""
+    scale = inf["ConversionFactor"][cols].astype(np.float64) * (10.0 ** inf["Exponent"][cols].astype(np.float64))
+    offset = inf["ADZero"][cols].astype(np.float64)
+    return scale, offset
+
+
+def convert_mea_data_to_storage(MCS: np.ndarray, inf: dict, cols: np.ndarray, storage: str = "float64") -> np.ndarray:
+    """Raw ADC columns MCS as Volts in float64/float32, or unchanged for storage "raw"."""
+    with profile_stage("volt_conversion") as rec:
+        data = _convert_mea_data_to_storage(MCS, inf, cols, storage)
+        rec.add(array_bytes=data.nbytes)
+    return data
+
+
+def _convert_mea_data_to_storage(MCS: np.ndarray, inf: dict, cols: np.ndarray, storage: str) -> np.ndarray:
+    if storage == "float64":
+        return convert_mea_data_to_volts(MCS, inf, cols)
+    if storage == "raw":
+        return np.ascontiguousarray(MCS)
+    if storage == "float32":
+        # Column by column, so no full float64 temporary is needed
+        data = np.empty(MCS.shape, dtype=np.float32)
+        for jj in range(MCS.shape[1]):
+            data[:, jj] = convert_mea_data_to_volts(MCS[:, jj : jj + 1], inf, cols[jj : jj + 1])[:, 0]
+        return data
+    raise ValueError(f"Unknown storage '{storage}' (use 'float64', 'float32' or 'raw')")
+
+
+def convert_mea_data_to_volts(MCS: np.ndarray, inf: dict, cols: np.ndarray) -> np.ndarray:
+    """
+    Convert raw ADC columns MCS (ChannelData columns cols, 0-based) to Volts using
+    InfoChannel ADZero, ConversionFactor and Exponent.
+    """
     ADZero = inf["ADZero"][cols]
     ConversionFactor = inf["ConversionFactor"][cols]
     Exponent = inf["Exponent"][cols]
-    data = (MCS[:, cols].astype(np.float64) - ADZero) * (
+    data = (MCS.astype(np.float64) - ADZero) * (
         ConversionFactor.astype(np.float64) * (10.0 ** Exponent.astype(np.float64))
     )
     return data
 
 
+def read_last_timestamps(ds: "h5py.Dataset") -> np.ndarray:
+    """Last two values of ChannelDataTimeStamps (in flattened order), reading only those elements."""
+    if ds.size == 0:
+        return np.array([])
+    if ds.ndim == 1:
+        return np.asarray(ds[max(0, ds.shape[0] - 2):])
+    last_row = np.asarray(ds[-1]).ravel()
+    if last_row.size >= 2 or ds.shape[0] == 1:
+        return last_row[-2:]
+    return np.concatenate((np.asarray(ds[-2]).ravel()[-1:], last_row))
+
+
 def read_h5_to_data(
     info: "object",
     index: int,
     how_many_datarows: int = 0,
     how_many_datacolumns: Optional[int] = None,
     start_indexes: Optional[Tuple[int, int]] = None,
+    storage: str = "float64",
 ) -> Tuple[np.ndarray, dict, float]:
     """
     Read single .h5 file into converted data array.
-    index: 1-based file index.
+    index: 1-based file index (recording and stream from get_mea_segment).
+    storage: "float64", "float32" or "raw" as in read_chosen_mea_electrode_data; for "raw",
+    h5info["scale"] and h5info["offset"] hold the per-column conversion.
     Returns (data 2D array, h5info dict, framerate).
     """
     if start_indexes is None:
@@ -71,22 +267,19 @@ def read_h5_to_data(
     start_row, start_col = start_indexes
     start_row -= 1
     start_col -= 1
+    recording, stream = get_mea_segment(info, index)
+    stream_path = get_mea_stream_path(recording, stream)
     h5info = {}
     with h5py.File(path, "r") as f:
-        info_ch = f["/Data/Recording_0/AnalogStream/Stream_0/InfoChannel"]
-        for key in info_ch.keys():
-            h5info[key] = np.array(info_ch[key][:])
-        try:
-            h5info["duration"] = float(f["/Data/Recording_0"].attrs["Duration"]) * 1e-6
-        except (KeyError, TypeError):
-            h5info["duration"] = 60.0
-        ts = f["/Data/Recording_0/AnalogStream/Stream_0/ChannelDataTimeStamps"][:]
+        h5info.update(read_mea_info_channel(f, recording, stream))
+        h5info["duration"] = read_mea_duration(f, recording)
+        ts = read_last_timestamps(f[stream_path + "/ChannelDataTimeStamps"])
         if ts.size >= 2:
             index_length = int(ts[-1] - ts[-2] + 1)
         else:
             index_length = 1
         h5info["framerate"] = index_length / h5info["duration"]
-        ds = f["/Data/Recording_0/AnalogStream/Stream_0/ChannelData"]
+        ds = f[stream_path + "/ChannelData"]
         n_cols_total = ds.shape[1]
         n_read_cols = min(how_many_datacolumns, n_cols_total - start_col)
         if how_many_datarows == 0:
@@ -95,10 +288,7 @@ def read_h5_to_data(
             MCS = ds[start_row : start_row + how_many_datarows, start_col : start_col + n_read_cols]
         MCS = np.array(MCS)
     cols_idx = np.arange(start_col, start_col + MCS.shape[1])
-    ADZero = h5info["ADZero"][cols_idx]
-    ConversionFactor = h5info["ConversionFactor"][cols_idx]
-    Exponent = h5info["Exponent"][cols_idx]
-    data = (MCS.astype(np.float64) - ADZero) * (
-        ConversionFactor.astype(np.float64) * (10.0 ** Exponent.astype(np.float64))
-    )
+    data = convert_mea_data_to_storage(MCS, h5info, cols_idx, storage)
+    if storage == "raw":
+        h5info["scale"], h5info["offset"] = get_mea_scale_and_offset(h5info, cols_idx)
     return data, h5info, h5info["framerate"]
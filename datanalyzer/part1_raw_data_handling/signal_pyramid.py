@@ -0,0 +1,232 @@
+"""
+Multi-resolution min/max decimation pyramid of a file's signals, for plotting.
+
+Level 0 holds the minimum and maximum of every base_block samples of each electrode, level
+l of every base_block * factor**l samples (computed from level l - 1, so exact). A plot
+window only needs the coarsest level whose blocks are no longer than one screen pixel, so
+drawing a 10-minute 25 kHz trace reads a few thousand values instead of 15 million.
+Values are stored in Volts as float32.
+"""
+
+from typing import List, Optional, Sequence, Tuple
+import numpy as np
+
+PYRAMID_FORMAT_VERSION = 1
+
+
+def block_min_max(data: np.ndarray, block: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Per-column min and max of consecutive blocks of rows (the last block may be shorter)."""
+    n_full = data.shape[0] // block
+    head = np.asarray(data[:n_full * block]).reshape(n_full, block, data.shape[1])
+    mins, maxs = head.min(axis=1), head.max(axis=1)
+    if n_full * block < data.shape[0]:
+        tail = np.asarray(data[n_full * block:])
+        mins = np.concatenate((mins, tail.min(axis=0, keepdims=True)))
+        maxs = np.concatenate((maxs, tail.max(axis=0, keepdims=True)))
+    return mins, maxs
+
+
+def to_volts_min_max(
+    mins: np.ndarray,
+    maxs: np.ndarray,
+    scale: Optional[np.ndarray] = None,
+    offset: Optional[np.ndarray] = None,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Convert min/max of raw ADC values ((raw - offset) * scale per column) to Volts as float32."""
+    if scale is None:
+        return mins.astype(np.float32), maxs.astype(np.float32)
+    lo = (mins - offset) * scale
+    hi = (maxs - offset) * scale
+    return np.minimum(lo, hi).astype(np.float32), np.maximum(lo, hi).astype(np.float32)
+
+
+class SignalPyramid:
+    """
+    Min/max pyramid of one file: levels[l] = (mins, maxs), each (blocks, columns) float32,
+    with blocks of base_block * factor**l samples. data (optional, with scale/offset for raw
+    storage) is the full-resolution signal used when a window is zoomed in below level 0.
+    """
+
+    def __init__(
+        self,
+        levels: List[Tuple[np.ndarray, np.ndarray]],
+        n_samples: int,
+        framerate: float,
+        base_block: int = 8,
+        factor: int = 4,
+        data: Optional[np.ndarray] = None,
+        scale: Optional[np.ndarray] = None,
+        offset: Optional[np.ndarray] = None,
+    ):
+        self.levels = levels
+        self.n_samples = int(n_samples)
+        self.framerate = float(framerate)
+        self.base_block = int(base_block)
+        self.factor = int(factor)
+        self.data = data
+        self.scale = scale
+        self.offset = offset
+
+    @property
+    def n_columns(self) -> int:
+        return self.levels[0][0].shape[1]
+
+    @property
+    def nbytes(self) -> int:
+        return sum(mins.nbytes + maxs.nbytes for mins, maxs in self.levels)
+
+    def block_size(self, level: int) -> int:
+        return self.base_block * self.factor ** level
+
+    def envelope(
+        self,
+        t_start: float = 0.0,
+        t_end: Optional[float] = None,
+        n_pixels: int = 1000,
+        columns: Optional[Sequence[int]] = None,
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Envelope of the window t_start..t_end (seconds) at about n_pixels points.
+        columns: 1-based data columns (default all). Returns (times of the bin starts in
+        seconds, mins, maxs), mins/maxs of shape (bins, columns) in Volts. When a pixel is
+        shorter than level 0 blocks and data is attached, the samples themselves are returned
+        (mins == maxs).
+        """
+        s0 = max(0, int(np.floor(t_start * self.framerate)))
+        s1 = self.n_samples if t_end is None else min(self.n_samples, int(np.ceil(t_end * self.framerate)))
+        cols = slice(None) if columns is None else np.asarray(columns, dtype=int) - 1
+        if s1 <= s0:
+            n_cols = self.n_columns if columns is None else len(columns)
+            empty = np.empty((0, n_cols), dtype=np.float32)
+            return np.empty(0), empty, empty
+        samples_per_pixel = (s1 - s0) / max(1, n_pixels)
+
+        if samples_per_pixel < self.base_block and self.data is not None:
+            raw = np.asarray(self.data[s0:s1])[:, cols]
+            values = to_volts_min_max(
+                raw, raw,
+                None if self.scale is None else np.asarray(self.scale)[cols],
+                None if self.offset is None else np.asarray(self.offset)[cols],
+            )[0]
+            return np.arange(s0, s1) / self.framerate, values, values
+
+        level = 0
+        while level + 1 < len(self.levels) and self.block_size(level + 1) <= samples_per_pixel:
+            level += 1
+        block = self.block_size(level)
+        mins, maxs = self.levels[level]
+        b0, b1 = s0 // block, -(-s1 // block)
+        n_blocks = b1 - b0
+        # Pixel bins as block ranges; each bin covers at least one block, so starts are increasing
+        n_bins = min(n_pixels, n_blocks)
+        starts = (np.arange(n_bins) * n_blocks) // n_bins + b0
+        mins = np.minimum.reduceat(mins[b0:b1][:, cols], starts - b0, axis=0)
+        maxs = np.maximum.reduceat(maxs[b0:b1][:, cols], starts - b0, axis=0)
+        return starts * block / self.framerate, mins, maxs
+
+    def save(self, path: str) -> None:
+        """Write the levels and parameters (not the attached data) to an .npz file."""
+        arrays = {
+            "version": np.array(PYRAMID_FORMAT_VERSION),
+            "params": np.array([self.n_samples, self.base_block, self.factor], dtype=np.int64),
+            "framerate": np.array(self.framerate),
+        }
+        for level, (mins, maxs) in enumerate(self.levels):
+            arrays["mins_%d" % level] = mins
+            arrays["maxs_%d" % level] = maxs
+        with open(path, "wb") as f:
+            np.savez(f, **arrays)
+
+    @classmethod
+    def load(cls, path: str) -> "SignalPyramid":
+        """Read a pyramid written by save()."""
+        with np.load(path) as z:
+            if int(z["version"]) != PYRAMID_FORMAT_VERSION:
+                raise ValueError("Unsupported pyramid format in %s" % path)
+            n_samples, base_block, factor = (int(v) for v in z["params"])
+            levels = []
+            while "mins_%d" % len(levels) in z:
+                levels.append((z["mins_%d" % len(levels)], z["maxs_%d" % len(levels)]))
+            return cls(levels, n_samples, float(z["framerate"]), base_block, factor)
+
+
+class SignalPyramidBuilder:
+    """
+    Builds a SignalPyramid from consecutive blocks of rows (e.g. while streaming a file):
+    append(block) for each block in Volts (or raw with scale/offset), then finish().
+    """
+
+    def __init__(
+        self,
+        framerate: float,
+        base_block: int = 8,
+        factor: int = 4,
+        min_blocks: int = 256,
+        scale: Optional[np.ndarray] = None,
+        offset: Optional[np.ndarray] = None,
+    ):
+        self.framerate = framerate
+        self.base_block = base_block
+        self.factor = factor
+        self.min_blocks = min_blocks
+        self.scale = scale
+        self.offset = offset
+        self.n_samples = 0
+        self._tail = None
+        self._mins = []
+        self._maxs = []
+
+    def append(self, block: np.ndarray) -> None:
+        """Add the next rows (samples x columns)."""
+        block = np.asarray(block)
+        self.n_samples += block.shape[0]
+        if self._tail is not None:
+            block = np.concatenate((self._tail, block))
+        n_full = (block.shape[0] // self.base_block) * self.base_block
+        if n_full:
+            mins, maxs = block_min_max(block[:n_full], self.base_block)
+            self._mins.append(mins)
+            self._maxs.append(maxs)
+        self._tail = block[n_full:].copy() if n_full < block.shape[0] else None
+
+    def finish(self) -> SignalPyramid:
+        """Level 0 from all appended rows, then coarser levels until fewer than min_blocks blocks remain."""
+        if self._tail is not None:
+            mins, maxs = block_min_max(self._tail, self.base_block)
+            self._mins.append(mins)
+            self._maxs.append(maxs)
+            self._tail = None
+        mins, maxs = to_volts_min_max(np.concatenate(self._mins), np.concatenate(self._maxs), self.scale, self.offset)
+        levels = [(mins, maxs)]
+        while mins.shape[0] > self.min_blocks:
+            mins = block_min_max(mins, self.factor)[0]
+            maxs = block_min_max(maxs, self.factor)[1]
+            levels.append((mins, maxs))
+        return SignalPyramid(levels, self.n_samples, self.framerate, self.base_block, self.factor)
+
+
+def build_signal_pyramid(
+    entry: dict,
+    framerate: float,
+    base_block: int = 8,
+    factor: int = 4,
+    min_blocks: int = 256,
+    block_rows: int = 2 ** 18,
+) -> SignalPyramid:
+    """
+    Pyramid of a Data entry ({"data"}, with "scale"/"offset" for raw storage); the entry's data
+    is attached for full-resolution zoom. Rows are processed block_rows at a time, so memmapped
+    data is not read into memory at once.
+    """
+    data = entry["data"]
+    builder = SignalPyramidBuilder(
+        framerate, base_block, factor, min_blocks, scale=entry.get("scale"), offset=entry.get("offset")
+    )
+    block_rows = max(base_block, block_rows - block_rows % base_block)
+    for r0 in range(0, data.shape[0], block_rows):
+        builder.append(data[r0:r0 + block_rows])
+    pyramid = builder.finish()
+    pyramid.data = data
+    pyramid.scale = entry.get("scale")
+    pyramid.offset = entry.get("offset")
+    return pyramid
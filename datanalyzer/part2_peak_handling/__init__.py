@@ -1,6 +1,19 @@
 """Peak finding and handling for MEA signals."""
 
 from .find_peaks import find_peaks_in_loop
+from .parallel_peaks import find_peaks_in_files_parallel
+from .stream_peaks import find_peaks_streaming
+from .vector_peaks import find_peaks_in_block
+from .peak_cache import PeakCache
+from .rule_sweep import sweep_peak_finding_rules
 from .rules import set_default_filetype_rules_for_peak_finding
 
-__all__ = ["find_peaks_in_loop", "set_default_filetype_rules_for_peak_finding"]
+__all__ = [
+    "find_peaks_in_loop",
+    "find_peaks_in_files_parallel",
+    "find_peaks_streaming",
+    "find_peaks_in_block",
+    "PeakCache",
+    "sweep_peak_finding_rules",
+    "set_default_filetype_rules_for_peak_finding",
+]
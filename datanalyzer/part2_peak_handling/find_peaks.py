@@ -2,12 +2,70 @@
 Find peaks in MEA data (low or high) using scipy.signal.find_peaks.
 """
 
+from contextlib import nullcontext
 from typing import List, Optional, Any
 import numpy as np
-from scipy.signal import find_peaks as scipy_find_peaks
 
 from datanalyzer.models import Rule
+from datanalyzer.profiling import profile_stage
+from datanalyzer.part1_raw_data_handling.prefetch import PREFETCH_MAX_BYTES, PrefetchReader
+from datanalyzer.part1_raw_data_handling.read_h5 import get_mea_segment
+from .peak_signals import find_peaks_in_signal, get_peak_finding_parameters, get_polarities, get_signals_to_check
 from .rules import set_default_filetype_rules_for_peak_finding
+from .vector_peaks import find_peaks_in_block, get_peak_engine
+
+
+def get_data_storage(Data: Any, ii: int) -> str:
+    """Storage mode of Data file ii ("float64", "float32" or "raw") without loading LazyData."""
+    storage = getattr(Data, "storage", None)
+    if storage is not None:
+        return storage
+    entry = Data[ii]
+    if "scale" in entry:
+        return "raw"
+    return "float32" if entry["data"].dtype == np.float32 else "float64"
+
+
+def init_Data_BPM(Data_BPM: Optional[List[dict]], n_files: int, n_cols_data: int) -> List[dict]:
+    """Create (or extend) Data_BPM with empty low/high peak containers for n_files."""
+    if Data_BPM is None:
+        Data_BPM = [{} for _ in range(n_files)]
+    while len(Data_BPM) < n_files:
+        Data_BPM.append({})
+
+    for kk in range(n_files):
+        Data_BPM[kk].setdefault("file_index", kk + 1)
+        Data_BPM[kk].setdefault("peak_values_high", {})
+        Data_BPM[kk].setdefault("peak_locations_high", {})
+        Data_BPM[kk].setdefault("peak_widths_high", {})
+        Data_BPM[kk].setdefault("Amount_of_peaks_high", np.zeros(n_cols_data))
+        Data_BPM[kk].setdefault("peak_values_low", {})
+        Data_BPM[kk].setdefault("peak_locations_low", {})
+        Data_BPM[kk].setdefault("peak_widths_low", {})
+        Data_BPM[kk].setdefault("Amount_of_peaks_low", np.zeros(n_cols_data))
+    return Data_BPM
+
+
+def store_peaks_to_Data_BPM(
+    Data_BPM: List[dict],
+    ii: int,
+    col: int,
+    pks: np.ndarray,
+    locs_1based: np.ndarray,
+    w: np.ndarray,
+    data_multiply: int,
+) -> None:
+    """Store peaks of 0-based file ii, 1-based column col as high (data_multiply > 0) or low peaks."""
+    if data_multiply > 0:
+        Data_BPM[ii]["peak_values_high"][col] = pks
+        Data_BPM[ii]["peak_locations_high"][col] = locs_1based
+        Data_BPM[ii]["peak_widths_high"][col] = w
+        Data_BPM[ii]["Amount_of_peaks_high"][col - 1] = len(pks)
+    else:
+        Data_BPM[ii]["peak_values_low"][col] = pks * data_multiply
+        Data_BPM[ii]["peak_locations_low"][col] = locs_1based
+        Data_BPM[ii]["peak_widths_low"][col] = w
+        Data_BPM[ii]["Amount_of_peaks_low"][col - 1] = len(pks)
 
 
 def find_peaks_in_loop(
@@ -18,10 +76,26 @@ def find_peaks_in_loop(
     datacolumns: Optional[List[int]] = None,
     data_multiply: int = -1,
     Data_BPM: Optional[List[dict]] = None,
+    peak_cache: Optional[Any] = None,
+    prefetch_depth: int = 0,
+    prefetch_max_bytes: int = PREFETCH_MAX_BYTES,
 ) -> List[dict]:
     """
     Find peaks in Data (list of {data, file_index}) for each file and datacolumn.
-    data_multiply: 1 = high peaks, -1 = low peaks (invert signal).
+    data_multiply: 1 = high peaks, -1 = low peaks (invert signal), 0 = both low and high
+    peaks in one pass (each column is read once; two reused column buffers, no per-column copies).
+    Data may hold float64, float32 or raw ADC data (see load_raw_mea_data_to_Data_and_DataInfo
+    storage). Compared with float64 Data, raw storage gives identical peak values and the same
+    locations except for a sample exactly at min_peak_value (threshold rounding); widths agree
+    to ~1e-12 relative. float32 storage rounds the signal to ~6e-8 relative, so values and
+    widths agree to that tolerance and a peak can move only between samples equal in float32.
+    peak_cache: optional PeakCache; cached columns are taken from disk and, with LazyData,
+    a file whose columns are all cached is not read at all.
+    Rule_in.peak_engine "vectorized" searches all columns of a file at once (vector_peaks)
+    with results identical to the default "scipy" engine (one find_peaks call per column).
+    prefetch_depth: with LazyData, read up to this many files ahead in a background thread
+    (PrefetchReader, at most prefetch_max_bytes queued) while peaks are found; the reader's
+    metrics are stored in DataInfo.io_stats["prefetch"].
     Returns Data_BPM: list of dicts per file with peak_values_low/high,
     peak_locations_low/high, peak_widths_low/high, Amount_of_peaks_low/high.
     """
@@ -35,64 +109,80 @@ def find_peaks_in_loop(
             DataInfo.Rule = Rule_in
 
     n_files = len(Data)
+    # LazyData knows its column count without reading a file
+    n_cols_data = getattr(Data, "n_columns", None) or Data[0]["data"].shape[1]
     if filenumbers is None:
         filenumbers = list(range(1, n_files + 1))
     if datacolumns is None:
-        datacolumns = list(range(1, Data[0]["data"].shape[1] + 1))
+        datacolumns = list(range(1, n_cols_data + 1))
 
-    min_peak_distance = Rule_in.frame_rate * 60.0 / Rule_in.max_bpm
-    min_peak_value = getattr(Rule_in, "MinPeakValue", Rule_in.min_peak_value)
-    min_peak_width = getattr(Rule_in, "minimum_peak_width", 50)
+    min_peak_distance, min_peak_value, min_peak_width = get_peak_finding_parameters(Rule_in)
 
-    n_cols_data = Data[0]["data"].shape[1]
-    if Data_BPM is None:
-        Data_BPM = [{} for _ in range(n_files)]
-    while len(Data_BPM) < n_files:
-        Data_BPM.append({})
+    Data_BPM = init_Data_BPM(Data_BPM, n_files, n_cols_data)
 
-    for kk in range(n_files):
-        Data_BPM[kk].setdefault("file_index", kk + 1)
-        Data_BPM[kk].setdefault("peak_values_high", {})
-        Data_BPM[kk].setdefault("peak_locations_high", {})
-        Data_BPM[kk].setdefault("peak_widths_high", {})
-        Data_BPM[kk].setdefault("Amount_of_peaks_high", np.zeros(n_cols_data))
-        Data_BPM[kk].setdefault("peak_values_low", {})
-        Data_BPM[kk].setdefault("peak_locations_low", {})
-        Data_BPM[kk].setdefault("peak_widths_low", {})
-        Data_BPM[kk].setdefault("Amount_of_peaks_low", np.zeros(n_cols_data))
-
-    for pp, file_idx in enumerate(filenumbers):
+    polarities = get_polarities(data_multiply)
+    engine = get_peak_engine(Rule_in)
+    buffers = []
+    # Cache lookups first, so that files whose columns are all cached are never read
+    plan = []
+    for file_idx in filenumbers:
         if file_idx < 1 or file_idx > n_files:
             continue
-        ii = file_idx - 1
-        raw_data = Data[ii]["data"] * data_multiply
-        n_cols = raw_data.shape[1]
-        for col in datacolumns:
-            if col < 1 or col > n_cols:
-                continue
-            data_to_check = raw_data[:, col - 1].copy()
-            data_to_check[data_to_check < 0] = 0
-            locs, props = scipy_find_peaks(
-                data_to_check,
-                height=min_peak_value,
-                distance=int(min_peak_distance),
-                width=min_peak_width,
-            )
-            pks = data_to_check[locs]
-            w = props.get("widths", np.full(len(locs), np.nan))
-            if not np.iterable(w):
-                w = np.full(len(locs), w)
-            locs_1based = locs + 1
-
-            if data_multiply > 0:
-                Data_BPM[ii]["peak_values_high"][col] = pks
-                Data_BPM[ii]["peak_locations_high"][col] = locs_1based
-                Data_BPM[ii]["peak_widths_high"][col] = w
-                Data_BPM[ii]["Amount_of_peaks_high"][col - 1] = len(pks)
+        # Timed as its own stage, so that find_peaks counts each file once
+        with profile_stage("peak_cache", file_idx) if peak_cache is not None else nullcontext():
+            ii = file_idx - 1
+            if peak_cache is not None:
+                path = DataInfo.folder_raw_files + DataInfo.file_names[ii]
+                storage = get_data_storage(Data, ii)
+                segment = get_mea_segment(DataInfo, file_idx)
+            keys = {}
+            todo = {}
+            for col in datacolumns:
+                if col < 1 or col > n_cols_data:
+                    continue
+                for polarity in polarities:
+                    if peak_cache is not None:
+                        keys[col, polarity] = peak_cache.make_key(
+                            path, DataInfo.MEA_columns[col - 1], Rule_in, polarity, storage, segment
+                        )
+                        cached = peak_cache.get(keys[col, polarity])
+                        if cached is not None:
+                            pks, locs_1based, w = cached
+                            store_peaks_to_Data_BPM(Data_BPM, ii, col, pks, locs_1based, w, polarity)
+                            continue
+                    todo.setdefault(col, []).append(polarity)
+            if todo:
+                plan.append((file_idx, keys, todo))
+
+    reader = PrefetchReader(Data, [file_idx for file_idx, _, _ in plan], prefetch_depth, prefetch_max_bytes)
+    for (file_idx, keys, todo), (_, entry) in zip(plan, reader):
+        with profile_stage("find_peaks", file_idx) as rec:
+            ii = file_idx - 1
+            if engine == "vectorized":
+                found = find_peaks_in_block(
+                    entry, list(todo), polarities, min_peak_value, min_peak_distance, min_peak_width
+                )
             else:
-                Data_BPM[ii]["peak_values_low"][col] = pks * data_multiply
-                Data_BPM[ii]["peak_locations_low"][col] = locs_1based
-                Data_BPM[ii]["peak_widths_low"][col] = w
-                Data_BPM[ii]["Amount_of_peaks_low"][col - 1] = len(pks)
+                found = {}
+                n_rows = entry["data"].shape[0]
+                if not buffers or buffers[0].shape[0] != n_rows:
+                    buffers = [np.empty(n_rows, dtype=np.float64) for _ in polarities]
+                    rec.add(array_bytes=sum(b.nbytes for b in buffers))
+                for col, todo_polarities in todo.items():
+                    signals, scale = get_signals_to_check(entry, col, tuple(todo_polarities), buffers)
+                    for polarity, data_to_check in zip(todo_polarities, signals):
+                        # Raw ADC data: scale the threshold instead of the signal
+                        pks, locs_1based, w = find_peaks_in_signal(
+                            data_to_check, min_peak_value / scale, min_peak_distance, min_peak_width
+                        )
+                        found[col, polarity] = (pks * scale, locs_1based, w)
+            for col, todo_polarities in todo.items():
+                for polarity in todo_polarities:
+                    pks, locs_1based, w = found[col, polarity]
+                    if peak_cache is not None:
+                        peak_cache.put(keys[col, polarity], pks, locs_1based, w)
+                    store_peaks_to_Data_BPM(Data_BPM, ii, col, pks, locs_1based, w, polarity)
+    if prefetch_depth > 0:
+        DataInfo.io_stats["prefetch"] = reader.metrics()
 
     return Data_BPM
@@ -0,0 +1,167 @@
+"""
+Parallel load + peak finding: each .h5 file is read, converted and peak-detected in a
+worker process; only the compact peak results are sent back and merged into Data_BPM.
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+from types import SimpleNamespace
+from typing import List, Optional, Any, Tuple
+import os
+import numpy as np
+
+from datanalyzer.models import Rule
+from datanalyzer.profiling import get_profiler, profile_stage, separate_profiler
+from datanalyzer.part1_raw_data_handling.load_mea import load_chosen_mea_electrode_data, set_DataInfo_of_read_files
+from .find_peaks import init_Data_BPM, store_peaks_to_Data_BPM
+from .peak_signals import find_peaks_in_signal, get_peak_finding_parameters, get_polarities, get_signals_to_check
+from .vector_peaks import find_peaks_in_block, get_peak_engine
+
+
+def load_file_and_find_peaks(job: dict) -> dict:
+    """
+    Worker: read one file (job["info"], job["index"]), convert chosen electrodes to Volts
+    (filtered as configured by job["rule"]) and find peaks in job["datacolumns"] with job["peak_engine"] ("scipy" or "vectorized").
+    Returns framerate, I/O stats and peaks {(col, data_multiply): (values, 1-based locations, widths)}; the signal itself is not returned.
+    With job["profile"], also the worker's stage records (see datanalyzer.profiling).
+    """
+    info = job["info"]
+    index = job["index"]
+    polarities = get_polarities(job["data_multiply"])
+    min_peak_distance, min_peak_value, min_peak_width = job["peak_parameters"]
+    with separate_profiler(job.get("profile", False)) as profiler:
+        entry, stats = load_chosen_mea_electrode_data(info, index, Rule_in=job.get("rule"))
+        with profile_stage("find_peaks", index) as rec:
+            data = entry["data"]
+            if job.get("peak_engine", "scipy") == "vectorized":
+                peaks = find_peaks_in_block(
+                    entry, job["datacolumns"], polarities, min_peak_value, min_peak_distance, min_peak_width
+                )
+            else:
+                buffers = [np.empty(data.shape[0], dtype=np.float64) for _ in polarities]
+                rec.add(array_bytes=sum(b.nbytes for b in buffers))
+                peaks = {}
+                for col in job["datacolumns"]:
+                    if col < 1 or col > data.shape[1]:
+                        continue
+                    signals, _ = get_signals_to_check(entry, col, polarities, buffers)
+                    for polarity, data_to_check in zip(polarities, signals):
+                        peaks[col, polarity] = find_peaks_in_signal(
+                            data_to_check, min_peak_value, min_peak_distance, min_peak_width
+                        )
+    return {
+        "framerate": stats["framerate"],
+        "bytes_read": stats["bytes_read"],
+        "bytes_in_file": stats["bytes_in_file"],
+        "peaks": peaks,
+        "profile_records": profiler.records if profiler is not None else [],
+    }
+
+
+def make_peak_finding_jobs(
+    DataInfo: Any,
+    peak_parameters: Tuple[float, float, float],
+    filenumbers: List[int],
+    datacolumns: List[int],
+    data_multiply: int = -1,
+    peak_engine: str = "scipy",
+    Rule_in: Optional[Rule] = None,
+) -> List[dict]:
+    """
+    One load_file_and_find_peaks job per valid file number (1-based) of DataInfo.
+    Rule_in: applies its filter_* settings while loading (see load_chosen_mea_electrode_data).
+    """
+    n_files = len(DataInfo.file_names)
+    # Workers only need the file path and the column selection, not the whole DataInfo
+    return [
+        {
+            "info": SimpleNamespace(
+                folder_raw_files=DataInfo.folder_raw_files,
+                file_names=[DataInfo.file_names[idx - 1]],
+                MEA_columns=list(DataInfo.MEA_columns),
+                segments=[DataInfo.segments[idx - 1]] if getattr(DataInfo, "segments", None) else [],
+            ),
+            "index": 1,
+            "file_index": idx,
+            "datacolumns": list(datacolumns),
+            "data_multiply": data_multiply,
+            "peak_parameters": peak_parameters,
+            "peak_engine": peak_engine,
+            "rule": Rule_in,
+            "profile": get_profiler() is not None,
+        }
+        for idx in filenumbers
+        if 1 <= idx <= n_files
+    ]
+
+
+def merge_peak_finding_results(
+    DataInfo: Any,
+    jobs: List[dict],
+    results: List[dict],
+    Data_BPM: Optional[List[dict]] = None,
+) -> List[dict]:
+    """
+    Store the results of load_file_and_find_peaks jobs into Data_BPM (created if None) and fill
+    DataInfo.framerate, measurement_time and io_stats. Returns Data_BPM.
+    """
+    n_files = len(DataInfo.file_names)
+    Data_BPM = init_Data_BPM(Data_BPM, n_files, len(DataInfo.MEA_columns))
+    profiler = get_profiler()
+    framerates = np.full(n_files, np.nan)
+    bytes_read = np.zeros(n_files, dtype=np.int64)
+    bytes_in_file = np.zeros(n_files, dtype=np.int64)
+    for job, res in zip(jobs, results):
+        ii = job["file_index"] - 1
+        framerates[ii] = res["framerate"]
+        bytes_read[ii] = res["bytes_read"]
+        bytes_in_file[ii] = res["bytes_in_file"]
+        for (col, polarity), (pks, locs_1based, w) in res["peaks"].items():
+            store_peaks_to_Data_BPM(Data_BPM, ii, col, pks, locs_1based, w, polarity)
+        if profiler is not None:
+            # Workers see a one-file DataInfo; attribute their records to the real file
+            for record in res.get("profile_records", []):
+                record["file_index"] = job["file_index"]
+            profiler.records.extend(res.get("profile_records", []))
+    set_DataInfo_of_read_files(DataInfo, framerates, bytes_read, bytes_in_file)
+    return Data_BPM
+
+
+def find_peaks_in_files_parallel(
+    DataInfo: Any,
+    Rule_in: Optional[Rule] = None,
+    filenumbers: Optional[List[int]] = None,
+    datacolumns: Optional[List[int]] = None,
+    data_multiply: int = -1,
+    Data_BPM: Optional[List[dict]] = None,
+    workers: Optional[int] = None,
+) -> List[dict]:
+    """
+    Load and peak-detect the files of DataInfo (from create_DataInfo_of_folder) with a process pool.
+    Same arguments and Data_BPM structure as find_peaks_in_loop, but no Data is needed:
+    each worker reads its own file. workers: number of processes (default os.cpu_count();
+    1 = run in this process). Results are merged in file order, so they do not depend on
+    the worker count. DataInfo.framerate, measurement_time and io_stats are filled in.
+    """
+    if Rule_in is None:
+        Rule_in = DataInfo.Rule
+    n_files = len(DataInfo.file_names)
+    if filenumbers is None:
+        filenumbers = list(range(1, n_files + 1))
+    if datacolumns is None:
+        datacolumns = list(range(1, len(DataInfo.MEA_columns) + 1))
+    if workers is None:
+        workers = os.cpu_count() or 1
+
+    jobs = make_peak_finding_jobs(
+        DataInfo, get_peak_finding_parameters(Rule_in), filenumbers, datacolumns, data_multiply,
+        get_peak_engine(Rule_in), Rule_in,
+    )
+    if workers <= 1 or len(jobs) <= 1:
+        results = [load_file_and_find_peaks(job) for job in jobs]
+    else:
+        with ProcessPoolExecutor(max_workers=min(workers, len(jobs))) as executor:
+            results = list(executor.map(load_file_and_find_peaks, jobs, chunksize=1))
+
+    Data_BPM = merge_peak_finding_results(DataInfo, jobs, results, Data_BPM)
+    DataInfo.Rule = Rule_in
+    return Data_BPM
@@ -0,0 +1,169 @@
+"""
+Persistent on-disk cache of per-file, per-column peak results (values, locations, widths).
+
+Entries are keyed by the file identity (path, size, mtime; optionally a content hash), the
+ChannelData column, the peak-finding Rule fields (with any filter settings) and data_multiply, so an unchanged re-run
+with LazyData skips both reading the .h5 file and peak detection.
+"""
+
+from pathlib import Path
+from typing import Optional, Tuple
+import hashlib
+import json
+import os
+import numpy as np
+
+from datanalyzer.models import Rule
+from datanalyzer.part1_raw_data_handling.filtering import get_filter_settings
+from .peak_signals import get_peak_finding_parameters
+
+CACHE_FORMAT_VERSION = 1
+# Eviction goes down to this fraction of max_bytes, so the cache folder is scanned once per
+# ~10% of max_bytes stored rather than on every put of a full cache
+PEAK_CACHE_LOW_WATER = 0.9
+
+
+class PeakCache:
+    """
+    Peak results stored as one .npz per (file, column, rule) under cache_dir.
+    max_bytes: size limit; when it is exceeded, least recently used entries (file mtime,
+    refreshed on hit) are removed down to PEAK_CACHE_LOW_WATER * max_bytes. use_content_hash: identify files by SHA-1 of their content
+    instead of size + mtime (slower, but survives copies and touch).
+    """
+
+    def __init__(
+        self,
+        cache_dir: str,
+        max_bytes: int = 256 * 2 ** 20,
+        use_content_hash: bool = False,
+    ):
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.use_content_hash = use_content_hash
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+        self._file_ids = {}
+        self.cache_bytes = sum(p.stat().st_size for p in self.cache_dir.glob("*.npz"))
+        if self.cache_bytes > self.max_bytes:
+            self._evict()
+
+    def file_identity(self, path: str) -> dict:
+        """Identity of a raw data file: resolved path, size, mtime_ns (and sha1 if enabled)."""
+        st = os.stat(path)
+        memo_key = (os.path.abspath(path), st.st_size, st.st_mtime_ns)
+        if memo_key not in self._file_ids:
+            ident = {"path": memo_key[0], "size": st.st_size, "mtime_ns": st.st_mtime_ns}
+            if self.use_content_hash:
+                sha = hashlib.sha1()
+                with open(path, "rb") as f:
+                    for block in iter(lambda: f.read(2 ** 20), b""):
+                        sha.update(block)
+                ident = {"size": st.st_size, "sha1": sha.hexdigest()}
+            self._file_ids[memo_key] = ident
+        return self._file_ids[memo_key]
+
+    def make_key(
+        self,
+        path: str,
+        mea_column: int,
+        Rule_in: Rule,
+        data_multiply: int,
+        storage: str = "float64",
+        segment: Tuple[int, int] = (0, 0),
+    ) -> str:
+        """
+        Cache key for peaks of ChannelData column mea_column (1-based) of file path;
+        segment: (recording, stream) of the data (see read_h5.get_mea_segment).
+        """
+        min_peak_distance, min_peak_value, min_peak_width = get_peak_finding_parameters(Rule_in)
+        fields = {
+            "version": CACHE_FORMAT_VERSION,
+            "file": self.file_identity(path),
+            "mea_column": int(mea_column),
+            "frame_rate": float(Rule_in.frame_rate),
+            "max_bpm": float(Rule_in.max_bpm),
+            "min_peak_distance": float(min_peak_distance),
+            "min_peak_value": float(min_peak_value),
+            "minimum_peak_width": float(min_peak_width),
+            "data_multiply": int(data_multiply),
+            "storage": storage,
+        }
+        if tuple(segment) != (0, 0):
+            fields["segment"] = [int(n) for n in segment]
+        filter_settings = get_filter_settings(Rule_in)
+        if filter_settings is not None:
+            fields["filter"] = filter_settings
+        return hashlib.sha1(json.dumps(fields, sort_keys=True).encode()).hexdigest()
+
+    def _path(self, key: str) -> Path:
+        return self.cache_dir / (key + ".npz")
+
+    def get(self, key: str) -> Optional[Tuple[np.ndarray, np.ndarray, np.ndarray]]:
+        """Return cached (peak values, 1-based locations, widths) or None."""
+        path = self._path(key)
+        try:
+            with np.load(path) as z:
+                result = (z["pks"], z["locs"], z["widths"])
+        except (OSError, KeyError, ValueError):
+            self.misses += 1
+            return None
+        os.utime(path)
+        self.hits += 1
+        return result
+
+    def put(self, key: str, pks: np.ndarray, locs_1based: np.ndarray, w: np.ndarray) -> None:
+        """Store peak results; evicts least recently used entries when above max_bytes."""
+        path = self._path(key)
+        tmp = path.with_name("%s.%d.tmp" % (path.name, os.getpid()))
+        with open(tmp, "wb") as f:
+            np.savez(f, pks=pks, locs=locs_1based, widths=w)
+        old_size = path.stat().st_size if path.exists() else 0
+        os.replace(tmp, path)
+        self.cache_bytes += path.stat().st_size - old_size
+        self.stores += 1
+        if self.cache_bytes > self.max_bytes:
+            self._evict()
+
+    def _evict(self) -> None:
+        # The folder is rescanned here, not indexed, as other processes may share it
+        entries = []
+        for p in self.cache_dir.glob("*.npz"):
+            try:
+                st = p.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((st.st_mtime_ns, st.st_size, p))
+        entries.sort(key=lambda e: e[0])
+        self.cache_bytes = sum(e[1] for e in entries)
+        target = int(PEAK_CACHE_LOW_WATER * self.max_bytes)
+        for _, size, p in entries:
+            if self.cache_bytes <= target:
+                break
+            try:
+                p.unlink()
+            except FileNotFoundError:
+                pass
+            self.cache_bytes -= size
+            self.evictions += 1
+
+    def stats(self) -> dict:
+        """Counters: hits, misses, stores, evictions, entries and bytes on disk."""
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "stores": self.stores,
+            "evictions": self.evictions,
+            "entries": len(list(self.cache_dir.glob("*.npz"))),
+            "cache_bytes": self.cache_bytes,
+            "max_bytes": self.max_bytes,
+        }
+
+    def clear(self) -> None:
+        """Remove all cached entries."""
+        for p in self.cache_dir.glob("*.npz"):
+            p.unlink()
+        self.cache_bytes = 0
+
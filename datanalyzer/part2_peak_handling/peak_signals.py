@@ -0,0 +1,120 @@
+"""
+Per-signal peak-finding helpers shared by the scipy and vectorized engines: Rule parameters,
+the (inverted and clipped) signals to check, scipy.signal.find_peaks on one signal and the
+greedy minimum-distance selection.
+"""
+
+from typing import List, Optional, Any, Tuple
+import numpy as np
+from scipy.signal import find_peaks as scipy_find_peaks
+
+from datanalyzer.models import Rule
+
+
+
+def get_peak_finding_parameters(Rule_in: Rule) -> Tuple[float, float, int]:
+    """Return (min_peak_distance in frames, min_peak_value, min_peak_width) from Rule."""
+    min_peak_distance = Rule_in.frame_rate * 60.0 / Rule_in.max_bpm
+    min_peak_value = getattr(Rule_in, "MinPeakValue", Rule_in.min_peak_value)
+    min_peak_width = getattr(Rule_in, "minimum_peak_width", 50)
+    return min_peak_distance, min_peak_value, min_peak_width
+
+def find_peaks_in_signal(
+    data_to_check: np.ndarray,
+    min_peak_value: float,
+    min_peak_distance: float,
+    min_peak_width: float,
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Find peaks in one (already inverted and clipped) 1-D signal.
+    Returns (peak values, 1-based peak locations, peak widths).
+    """
+    locs, props = scipy_find_peaks(
+        data_to_check,
+        height=min_peak_value,
+        distance=int(min_peak_distance),
+        width=min_peak_width,
+    )
+    pks = data_to_check[locs]
+    w = props.get("widths", np.full(len(locs), np.nan))
+    if not np.iterable(w):
+        w = np.full(len(locs), w)
+    return pks, locs + 1, w
+
+def get_polarities(data_multiply: int) -> Tuple[int, ...]:
+    """data_multiply values to run: 0 = both low (-1) and high (1) peaks, else (data_multiply,)."""
+    return (-1, 1) if data_multiply == 0 else (data_multiply,)
+
+def read_signal_column(
+    entry: Any,
+    col: int,
+    out: Optional[np.ndarray] = None,
+) -> Tuple[np.ndarray, float]:
+    """
+    Column col (1-based) of a Data entry as float64 (raw ADC storage: minus the column offset)
+    and the scale that converts it to Volts (1.0 unless raw). out: optional buffer to reuse.
+    """
+    data = entry["data"]
+    if out is None:
+        out = np.empty(data.shape[0], dtype=np.float64)
+    if "scale" in entry:
+        np.subtract(data[:, col - 1], entry["offset"][col - 1], out=out, dtype=np.float64)
+        return out, float(entry["scale"][col - 1])
+    out[:] = data[:, col - 1]
+    return out, 1.0
+
+def get_signal_to_check(
+    entry: Any,
+    col: int,
+    data_multiply: int,
+    out: Optional[np.ndarray] = None,
+) -> Tuple[np.ndarray, float]:
+    """
+    Column col (1-based) of a Data entry multiplied by data_multiply, negatives set to 0.
+    For raw ADC storage (entry has "scale"/"offset") the signal stays in ADC units and the
+    returned scale converts it to Volts; otherwise the scale is 1.0.
+    out: optional float64 buffer of the column length (reused between columns).
+    """
+    signal, scale = read_signal_column(entry, col, out=out)
+    signal *= data_multiply
+    signal[signal < 0] = 0
+    return signal, scale
+
+def get_signals_to_check(
+    entry: Any,
+    col: int,
+    polarities: Tuple[int, ...],
+    buffers: List[np.ndarray],
+) -> Tuple[List[np.ndarray], float]:
+    """
+    get_signal_to_check for each data_multiply of polarities, reading column col only once.
+    buffers: one float64 array of the column length per polarity, reused between columns.
+    """
+    # The column is read into the last buffer, which is turned into the last signal at the end
+    column, scale = read_signal_column(entry, col, out=buffers[-1])
+    for data_multiply, out in zip(polarities, buffers):
+        np.multiply(column, data_multiply, out=out)
+        out[out < 0] = 0
+    return buffers[:len(polarities)], scale
+
+def select_by_peak_distance(
+    peaks: np.ndarray,
+    priority: np.ndarray,
+    distance: float,
+) -> np.ndarray:
+    """
+    Greedy minimum-distance selection as in scipy.signal.find_peaks: starting from the
+    highest priority, drop sorted peaks closer than ceil(distance). Returns keep mask.
+    """
+    peaks = np.asarray(peaks)
+    distance_ = np.ceil(distance)
+    keep = np.ones(peaks.shape[0], dtype=bool)
+    lo = np.searchsorted(peaks, peaks - distance_, side="right")
+    hi = np.searchsorted(peaks, peaks + distance_, side="left")
+    priority_to_position = np.argsort(priority)
+    for j in priority_to_position[::-1]:
+        if not keep[j]:
+            continue
+        keep[lo[j]:j] = False
+        keep[j + 1:hi[j]] = False
+    return keep
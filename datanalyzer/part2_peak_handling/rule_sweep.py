@@ -0,0 +1,142 @@
+"""
+Rule parameter sweep: find candidate peaks once per signal with the loosest settings, then
+derive the peaks of every Rule in a grid by filtering on height, distance and width.
+
+scipy.signal.find_peaks applies height, distance and width in that order, and a peak's
+width depends only on the signal around it (not on the other peaks), so filtering the
+candidates in the same order gives exactly the peaks of an independent find_peaks_in_loop run.
+"""
+
+from dataclasses import replace
+from itertools import product
+from typing import Any, Dict, List, Optional, Tuple, Union
+import numpy as np
+import pandas as pd
+from scipy.signal import find_peaks as scipy_find_peaks, peak_prominences, peak_widths
+
+from datanalyzer.models import Rule
+from .find_peaks import init_Data_BPM, store_peaks_to_Data_BPM
+from .peak_signals import get_peak_finding_parameters, get_polarities, get_signals_to_check, select_by_peak_distance
+
+SWEEP_RULE_FIELDS = ("max_bpm", "min_peak_value", "minimum_peak_width")
+
+
+def make_rule_grid(base_rule: Rule, grid: Dict[str, List[Any]]) -> List[Rule]:
+    """All combinations of grid values (e.g. {"max_bpm": [40, 60], "min_peak_value": [2e-5, 5e-5]}) on base_rule."""
+    keys = list(grid)
+    return [
+        replace(base_rule, min_dist_sec=None, min_dist_frames=None, **dict(zip(keys, values)))
+        for values in product(*(grid[key] for key in keys))
+    ]
+
+
+def find_candidate_peaks(
+    data_to_check: np.ndarray,
+    min_peak_value: float,
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Peaks above min_peak_value before distance and width rules: (0-based locations, heights, widths)."""
+    locs, props = scipy_find_peaks(data_to_check, height=min_peak_value)
+    if locs.size == 0:
+        return locs, props["peak_heights"], np.array([])
+    prominence_data = peak_prominences(data_to_check, locs)
+    widths = peak_widths(data_to_check, locs, rel_height=0.5, prominence_data=prominence_data)[0]
+    return locs, props["peak_heights"], widths
+
+
+def filter_candidate_peaks(
+    locs: np.ndarray,
+    heights: np.ndarray,
+    widths: np.ndarray,
+    min_peak_value: float,
+    min_peak_distance: float,
+    min_peak_width: float,
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Apply height, distance and width rules in find_peaks order: (peak values, 1-based locations, widths)."""
+    keep = heights >= min_peak_value
+    locs, heights, widths = locs[keep], heights[keep], widths[keep]
+    keep = select_by_peak_distance(locs, heights, int(min_peak_distance))
+    locs, heights, widths = locs[keep], heights[keep], widths[keep]
+    keep = widths >= min_peak_width
+    return heights[keep], locs[keep] + 1, widths[keep]
+
+
+def sweep_peak_finding_rules(
+    Data: List[dict],
+    DataInfo: Any,
+    rule_grid: Union[List[Rule], Dict[str, List[Any]]],
+    filenumbers: Optional[List[int]] = None,
+    datacolumns: Optional[List[int]] = None,
+    data_multiply: int = -1,
+    return_Data_BPM: bool = False,
+) -> Union[pd.DataFrame, Tuple[pd.DataFrame, List[List[dict]]]]:
+    """
+    Peak finding for every Rule of rule_grid with one scan of each signal.
+    rule_grid: list of Rules, or {field: values} combined on DataInfo.Rule (see make_rule_grid).
+    Other arguments as in find_peaks_in_loop. Returns a table with one row per
+    (setting, file, datacolumn, data_multiply): the setting's max_bpm, min_peak_value and minimum_peak_width,
+    Amount_of_peaks, BPM_avg and peak distance mean/std in ms (as update_Data_BPM computes them)
+    and Amplitude_avg. With return_Data_BPM, also the Data_BPM of each setting, equal to
+    find_peaks_in_loop(Data, DataInfo, Rule_in=rule, ...).
+    """
+    if isinstance(rule_grid, dict):
+        rule_grid = make_rule_grid(DataInfo.Rule, rule_grid)
+    parameters = [get_peak_finding_parameters(rule) for rule in rule_grid]
+    loosest_peak_value = min(p[1] for p in parameters)
+
+    n_files = len(Data)
+    n_cols_data = getattr(Data, "n_columns", None) or Data[0]["data"].shape[1]
+    if filenumbers is None:
+        filenumbers = list(range(1, n_files + 1))
+    if datacolumns is None:
+        datacolumns = list(range(1, n_cols_data + 1))
+    Data_BPM_of_rules = [init_Data_BPM(None, n_files, n_cols_data) for _ in rule_grid] if return_Data_BPM else None
+
+    polarities = get_polarities(data_multiply)
+    buffers = []
+    rows = []
+    for file_idx in filenumbers:
+        if file_idx < 1 or file_idx > n_files:
+            continue
+        ii = file_idx - 1
+        entry = Data[ii]
+        try:
+            fs = float(DataInfo.framerate[ii, 0])
+        except (IndexError, TypeError):
+            fs = float(DataInfo.framerate.flat[0])
+        for col in datacolumns:
+            if col < 1 or col > n_cols_data:
+                continue
+            n_rows = entry["data"].shape[0]
+            if not buffers or buffers[0].shape[0] != n_rows:
+                buffers = [np.empty(n_rows, dtype=np.float64) for _ in polarities]
+            signals, scale = get_signals_to_check(entry, col, polarities, buffers)
+            for polarity, data_to_check in zip(polarities, signals):
+                candidates = find_candidate_peaks(data_to_check, loosest_peak_value / scale)
+                for setting, (rule, (min_peak_distance, min_peak_value, min_peak_width)) in enumerate(
+                    zip(rule_grid, parameters)
+                ):
+                    pks, locs_1based, w = filter_candidate_peaks(
+                        *candidates, min_peak_value / scale, min_peak_distance, min_peak_width
+                    )
+                    pks = pks * scale
+                    if return_Data_BPM:
+                        store_peaks_to_Data_BPM(Data_BPM_of_rules[setting], ii, col, pks, locs_1based, w, polarity)
+                    dist_ms = np.diff((locs_1based - 1) / fs) * 1e3
+                    dist_avg = np.mean(dist_ms) if dist_ms.size else np.nan
+                    dist_std = np.std(dist_ms) if dist_ms.size else np.nan
+                    rows.append({
+                        "setting": setting,
+                        **{field: getattr(rule, field) for field in SWEEP_RULE_FIELDS},
+                        "file_index": file_idx,
+                        "datacolumn": col,
+                        "data_multiply": polarity,
+                        "Amount_of_peaks": len(pks),
+                        "BPM_avg": 60.0 / (dist_avg / 1000.0),
+                        "peak_distance_avg_ms": dist_avg,
+                        "peak_distance_std_ms": dist_std,
+                        "Amplitude_avg": np.mean(pks * polarity) if len(pks) else np.nan,
+                    })
+    table = pd.DataFrame(rows)
+    if return_Data_BPM:
+        return table, Data_BPM_of_rules
+    return table
@@ -0,0 +1,216 @@
+"""
+Streaming peak finding: walk each .h5 ChannelData in fixed-size time blocks instead of
+holding the whole converted matrix in memory.
+
+Blocks are joined at samples where the clipped signal (data * data_multiply, negatives set
+to 0) is exactly 0. A peak's prominence and width never look past such a sample, so
+candidate peaks, prominences and widths found between two zeros equal those of the whole
+signal. Only the tail after the last zero is carried over to the next block. The
+minimum-distance rule is applied at the end over the (small) candidate list, so results
+match find_peaks_in_loop: same locations and values; widths are computed from crossing
+points shifted to file coordinates and agree to the last bit except in rare double-rounding cases.
+
+A column that does not reach 0 for a long time (e.g. a DC offset opposite to the chosen
+polarity, or an unfiltered trace) would make the tail grow up to the whole file. The tail is
+therefore capped at max_tail_frames (STREAM_MAX_TAIL_BLOCKS blocks by default): past it,
+blocks are joined at the lowest sample of the last max_tail_frames, at least one minimum
+peak distance before the end. Prominences and widths of peaks whose bases reach past such
+a join are approximate, as are the peaks of a flat (e.g. saturated) stretch there, so the
+minimum-width rule may keep or drop other peaks than find_peaks_in_loop. Such forced joins
+are counted per file in DataInfo.io_stats["stream_forced_joins"] and reported with a
+warning; max_tail_frames=0 turns the cap off (exact, but a column may be held whole).
+"""
+
+from typing import List, Optional, Any
+import warnings
+import h5py
+import numpy as np
+from scipy.signal import find_peaks as scipy_find_peaks, peak_prominences, peak_widths
+
+from datanalyzer.models import Rule
+from datanalyzer.part1_raw_data_handling.filtering import BlockFilter, get_filter_settings, get_filter_sos
+from datanalyzer.part1_raw_data_handling.load_mea import set_DataInfo_of_read_files
+from datanalyzer.part1_raw_data_handling.signal_pyramid import SignalPyramidBuilder
+from datanalyzer.part1_raw_data_handling.read_h5 import (
+    convert_mea_data_to_volts,
+    get_mea_segment,
+    get_mea_stream_path,
+    read_mea_columns,
+    read_mea_duration,
+    read_mea_info_channel,
+)
+from .find_peaks import init_Data_BPM, store_peaks_to_Data_BPM
+from .peak_signals import get_peak_finding_parameters, get_polarities, select_by_peak_distance
+
+STREAM_MAX_TAIL_BLOCKS = 2
+
+
+class ColumnPeakStream:
+    """
+    Candidate peaks of one clipped column, fed block by block with push().
+    max_tail: most samples carried between blocks (None: no cap); a join forced by the cap
+    is searched before the last margin samples.
+    """
+
+    def __init__(self, min_peak_value: float, max_tail: Optional[int] = None, margin: int = 0):
+        self.min_peak_value = min_peak_value
+        self.max_tail = max_tail
+        self.margin = 0 if max_tail is None else max(0, min(int(margin), max_tail // 2))
+        self.tail = np.empty(0)
+        self.tail_start = 0
+        self.forced_joins = 0
+        self.locations = []
+        self.heights = []
+        self.widths = []
+
+    def push(self, x_block: np.ndarray, final: bool = False) -> None:
+        """Add the next block of the clipped signal; final=True flushes the remaining tail."""
+        buf = np.concatenate((self.tail, x_block))
+        if final:
+            end = buf.size
+        else:
+            zeros = np.flatnonzero(buf == 0)
+            end = zeros[-1] + 1 if zeros.size and zeros[-1] > 0 else 0
+            if self.max_tail is not None and buf.size - max(end - 1, 0) > self.max_tail:
+                # No 0 recent enough: join at the lowest sample that keeps the tail within max_tail
+                lo = buf.size - self.max_tail
+                hi = max(lo + 1, buf.size - self.margin)
+                end = lo + int(np.argmin(buf[lo:hi])) + 1
+                self.forced_joins += 1
+            if end <= 1:
+                self.tail = buf
+                return
+        self._find_candidates(buf[:end], self.tail_start)
+        if final:
+            self.tail = np.empty(0)
+            self.tail_start += buf.size
+        else:
+            self.tail = buf[end - 1:].copy()
+            self.tail_start += end - 1
+
+    def _find_candidates(self, seg: np.ndarray, offset: int) -> None:
+        peaks, props = scipy_find_peaks(seg, height=self.min_peak_value)
+        if peaks.size == 0:
+            return
+        prominence_data = peak_prominences(seg, peaks)
+        self.locations.append(peaks + offset)
+        self.heights.append(props["peak_heights"])
+        _, _, left_ips, right_ips = peak_widths(seg, peaks, rel_height=0.5, prominence_data=prominence_data)
+        # Shift crossing points to file coordinates before subtracting, as the whole-signal path does
+        self.widths.append((right_ips + offset) - (left_ips + offset))
+
+    def result(self, min_peak_distance: float, min_peak_width: float):
+        """Apply distance and width rules; returns (peak values, 1-based locations, widths)."""
+        if not self.locations:
+            return np.array([]), np.array([], dtype=np.intp), np.array([])
+        locs = np.concatenate(self.locations)
+        pks = np.concatenate(self.heights)
+        w = np.concatenate(self.widths)
+        keep = select_by_peak_distance(locs, pks, int(min_peak_distance))
+        locs, pks, w = locs[keep], pks[keep], w[keep]
+        keep = w >= min_peak_width
+        return pks[keep], locs[keep] + 1, w[keep]
+
+
+def find_peaks_streaming(
+    DataInfo: Any,
+    Rule_in: Optional[Rule] = None,
+    filenumbers: Optional[List[int]] = None,
+    datacolumns: Optional[List[int]] = None,
+    data_multiply: int = -1,
+    Data_BPM: Optional[List[dict]] = None,
+    block_frames: int = 2 ** 18,
+    pyramids: Optional[dict] = None,
+    max_tail_frames: Optional[int] = None,
+) -> List[dict]:
+    """
+    Find peaks directly from the .h5 files of DataInfo (from create_DataInfo_of_folder),
+    reading block_frames rows of the chosen electrodes at a time.
+    Same arguments and Data_BPM output as find_peaks_in_loop, but no Data is needed.
+    DataInfo.framerate, measurement_time and io_stats are filled in.
+    pyramids: dict to fill with {file_index: SignalPyramid} of the datacolumns (in that order),
+    built from the same blocks.
+    max_tail_frames: most frames carried per electrode between blocks (default
+    STREAM_MAX_TAIL_BLOCKS * block_frames, 0 = no cap); see the module docstring.
+    Rule_in filter_* settings are applied causally to the blocks (BlockFilter, state carried
+    between blocks); filter_zero_phase needs whole files and raises ValueError here.
+    """
+    if Rule_in is None:
+        Rule_in = DataInfo.Rule
+    n_files = len(DataInfo.file_names)
+    if filenumbers is None:
+        filenumbers = list(range(1, n_files + 1))
+    n_cols_data = len(DataInfo.MEA_columns)
+    if datacolumns is None:
+        datacolumns = list(range(1, n_cols_data + 1))
+    datacolumns = [col for col in datacolumns if 1 <= col <= n_cols_data]
+    cols = np.asarray(DataInfo.MEA_columns, dtype=int)[np.asarray(datacolumns, dtype=int) - 1] - 1
+
+    min_peak_distance, min_peak_value, min_peak_width = get_peak_finding_parameters(Rule_in)
+    filter_settings = get_filter_settings(Rule_in)
+    if filter_settings is not None and filter_settings["zero_phase"]:
+        raise ValueError("Zero-phase filtering is not possible when streaming; set filter_zero_phase=False")
+    polarities = get_polarities(data_multiply)
+    if max_tail_frames is None:
+        max_tail_frames = STREAM_MAX_TAIL_BLOCKS * block_frames
+    elif max_tail_frames <= 0:
+        max_tail_frames = None
+    Data_BPM = init_Data_BPM(Data_BPM, n_files, n_cols_data)
+    framerates = np.full(n_files, np.nan)
+    bytes_read = np.zeros(n_files, dtype=np.int64)
+    bytes_in_file = np.zeros(n_files, dtype=np.int64)
+    forced_joins = np.zeros(n_files, dtype=np.int64)
+
+    for file_idx in filenumbers:
+        if file_idx < 1 or file_idx > n_files:
+            continue
+        ii = file_idx - 1
+        path = DataInfo.folder_raw_files + DataInfo.file_names[ii]
+        streams = {
+            (col, polarity): ColumnPeakStream(min_peak_value, max_tail_frames, int(min_peak_distance))
+            for polarity in polarities for col in datacolumns
+        }
+        recording, stream = get_mea_segment(DataInfo, file_idx)
+        with h5py.File(path, "r") as f:
+            duration = read_mea_duration(f, recording)
+            inf = read_mea_info_channel(f, recording, stream)
+            ds = f[get_mea_stream_path(recording, stream) + "/ChannelData"]
+            n_rows = ds.shape[0]
+            framerates[ii] = n_rows / duration
+            bytes_in_file[ii] = ds.id.get_storage_size()
+            builder = SignalPyramidBuilder(framerates[ii]) if pyramids is not None else None
+            if filter_settings is not None:
+                block_filter = BlockFilter(get_filter_sos(filter_settings, framerates[ii]))
+            for r0 in range(0, n_rows, block_frames):
+                r1 = min(r0 + block_frames, n_rows)
+                raw, nbytes = read_mea_columns(ds, cols, r0, r1)
+                bytes_read[ii] += nbytes
+                volts = convert_mea_data_to_volts(raw, inf, cols)
+                if filter_settings is not None:
+                    volts = block_filter.process(volts)
+                if builder is not None:
+                    builder.append(volts)
+                for polarity in polarities:
+                    block = volts * polarity
+                    block[block < 0] = 0
+                    for jj, col in enumerate(datacolumns):
+                        streams[col, polarity].push(block[:, jj], final=r1 == n_rows)
+        if builder is not None:
+            pyramids[file_idx] = builder.finish()
+        for (col, polarity), stream in streams.items():
+            forced_joins[ii] += stream.forced_joins
+            pks, locs_1based, w = stream.result(min_peak_distance, min_peak_width)
+            store_peaks_to_Data_BPM(Data_BPM, ii, col, pks, locs_1based, w, polarity)
+
+    set_DataInfo_of_read_files(DataInfo, framerates, bytes_read, bytes_in_file)
+    DataInfo.io_stats["stream_forced_joins"] = forced_joins
+    if forced_joins.any():
+        names = [DataInfo.file_names[ii] for ii in np.flatnonzero(forced_joins)]
+        warnings.warn(
+            "%d block joins away from 0 (max_tail_frames=%d) in %s: widths of peaks near them are "
+            "approximate; use max_tail_frames=0 for results identical to find_peaks_in_loop"
+            % (forced_joins.sum(), max_tail_frames, ", ".join(names)),
+            stacklevel=2,
+        )
+    DataInfo.Rule = Rule_in
+    return Data_BPM
@@ -0,0 +1,273 @@
+"""
+Vectorized multi-channel peak engine (Rule.peak_engine = "vectorized").
+
+Instead of one scipy.signal.find_peaks call per column and polarity, a block of columns
+(samples x channels) is searched at once: samples above min_peak_value are found with one
+comparison per polarity, local maxima (with scipy's plateau midpoints) are taken among them,
+then greedy minimum-distance suppression and prominence/width estimation run on the
+surviving peaks only. The prominence bases and the half-prominence crossings are searched in
+growing windows around each peak. Results are identical to find_peaks_in_signal (same
+locations, values and widths) for min_peak_value > 0; otherwise the scipy engine is used.
+"""
+
+from typing import Any, Dict, List, Optional, Tuple
+import numpy as np
+from scipy.signal import peak_prominences, peak_widths
+
+from .peak_signals import find_peaks_in_signal, get_signals_to_check, select_by_peak_distance
+
+PEAK_ENGINES = ("scipy", "vectorized")
+VECTOR_BLOCK_BYTES = 64 * 2**20
+# First window (samples per side) for the base and crossing searches; grows 8x per round
+FIRST_WINDOW = 256
+# Peaks still unresolved when a window round would gather more values go to scipy
+MAX_WINDOW_VALUES = 2**23
+
+
+def get_peak_engine(Rule_in: Any) -> str:
+    """Rule_in.peak_engine ("scipy" if not set); ValueError for an unknown engine."""
+    engine = getattr(Rule_in, "peak_engine", "scipy")
+    if engine not in PEAK_ENGINES:
+        raise ValueError(f"Unknown peak_engine {engine!r}, expected one of {PEAK_ENGINES}")
+    return engine
+
+
+def read_signal_block(entry: Any, cols: List[int]) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Columns cols (1-based) of a Data entry as a float64 (samples x len(cols)) block, as
+    read_signal_column per column (raw ADC storage: minus the column offsets), and the scales.
+    """
+    data = entry["data"]
+    idx = np.asarray(cols, dtype=np.intp) - 1
+    if "scale" in entry:
+        block = np.subtract(data[:, idx], np.asarray(entry["offset"])[idx], dtype=np.float64)
+        return block, np.asarray(entry["scale"], dtype=np.float64)[idx]
+    if isinstance(data, np.ndarray) and data.dtype == np.float64 and np.array_equal(idx, np.arange(data.shape[1])):
+        return data, np.ones(idx.size)
+    return np.asarray(data[:, idx], dtype=np.float64), np.ones(idx.size)
+
+
+def _clipped(values: np.ndarray, polarity: int) -> np.ndarray:
+    """values * polarity with negatives set to 0 (the signal find_peaks_in_signal sees)."""
+    out = values * polarity
+    out[out < 0] = 0
+    return out
+
+
+def _gather(block: np.ndarray, rows: np.ndarray, cols: np.ndarray, step: int, window: int,
+            polarity: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Clipped samples rows + step*k, k = 0..window, of each peak and the mask of samples inside the signal."""
+    idx = rows[:, None] + step * np.arange(window + 1)
+    valid = (idx >= 0) & (idx < block.shape[0])
+    np.clip(idx, 0, block.shape[0] - 1, out=idx)
+    return _clipped(block[idx, cols[:, None]], polarity), valid
+
+
+def _column_minima(block: np.ndarray, polarity: int) -> np.ndarray:
+    """Minimum of each clipped column (no base search can go below it)."""
+    extreme = block.min(axis=0) if polarity > 0 else block.max(axis=0)
+    return _clipped(extreme, polarity)
+
+
+def get_base_minima(
+    block: np.ndarray,
+    rows: np.ndarray,
+    cols: np.ndarray,
+    heights: np.ndarray,
+    polarity: int,
+    step: int,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Minimum of the clipped signal from each peak towards step (-1 left, 1 right) up to the first
+    higher sample or the signal edge, as scipy's prominence base search. A window is resolved
+    when it contains that sample or edge, or reaches the column minimum.
+    Returns (minima, indexes of the peaks left unresolved within MAX_WINDOW_VALUES).
+    """
+    minima = np.empty(rows.size)
+    todo = np.arange(rows.size)
+    window = FIRST_WINDOW
+    col_min = None
+    while todo.size and (window == FIRST_WINDOW or todo.size * (window + 1) <= MAX_WINDOW_VALUES):
+        values, valid = _gather(block, rows[todo], cols[todo], step, window, polarity)
+        higher = valid & (values > heights[todo, None])
+        has_higher = higher.any(axis=1)
+        stop = np.where(has_higher, higher.argmax(axis=1), window + 1)
+        region = valid & (np.arange(window + 1) < stop[:, None])
+        found = np.where(region, values, np.inf).min(axis=1)
+        resolved = has_higher | ~valid[:, -1]
+        if not resolved.all():
+            if col_min is None:
+                col_min = _column_minima(block, polarity)
+            resolved |= found == col_min[cols[todo]]
+        minima[todo[resolved]] = found[resolved]
+        todo = todo[~resolved]
+        window *= 8
+    return minima, todo
+
+
+def get_crossings(
+    block: np.ndarray,
+    rows: np.ndarray,
+    cols: np.ndarray,
+    width_heights: np.ndarray,
+    polarity: int,
+    step: int,
+) -> np.ndarray:
+    """
+    Interpolated position of the first sample from each peak towards step at or below
+    width_heights (the left_ips / right_ips of scipy.signal.peak_widths). Such a sample lies
+    before the base minimum, so the search always ends.
+    """
+    positions = np.empty(rows.size)
+    todo = np.arange(rows.size)
+    window = FIRST_WINDOW
+    while todo.size:
+        values, valid = _gather(block, rows[todo], cols[todo], step, window, polarity)
+        below = valid & (values <= width_heights[todo, None])
+        found = below.any(axis=1)
+        k = below.argmax(axis=1)[found]
+        done = todo[found]
+        x_i = values[found, k]
+        x_prev = values[found, k - 1]
+        pos = (rows[done] + step * k).astype(np.float64)
+        inter = x_i < width_heights[done]
+        shift = (width_heights[done][inter] - x_i[inter]) / (x_prev[inter] - x_i[inter])
+        if step < 0:
+            pos[inter] += shift
+        else:
+            pos[inter] -= shift
+        positions[done] = pos
+        todo = todo[~found]
+        window *= 8
+    return positions
+
+
+def get_peak_widths(
+    block: np.ndarray,
+    rows: np.ndarray,
+    cols: np.ndarray,
+    heights: np.ndarray,
+    polarity: int,
+) -> np.ndarray:
+    """Widths at half prominence of the peaks (rows, cols) of block, as scipy.signal.find_peaks."""
+    widths = np.empty(rows.size)
+    left_min, left_todo = get_base_minima(block, rows, cols, heights, polarity, -1)
+    right_min, right_todo = get_base_minima(block, rows, cols, heights, polarity, 1)
+    fallback = np.zeros(rows.size, dtype=bool)
+    fallback[left_todo] = True
+    fallback[right_todo] = True
+    fast = np.flatnonzero(~fallback)
+    if fast.size:
+        prominences = heights[fast] - np.maximum(left_min[fast], right_min[fast])
+        width_heights = heights[fast] - prominences * 0.5
+        left_ips = get_crossings(block, rows[fast], cols[fast], width_heights, polarity, -1)
+        right_ips = get_crossings(block, rows[fast], cols[fast], width_heights, polarity, 1)
+        widths[fast] = right_ips - left_ips
+    # Peaks without a base within MAX_WINDOW_VALUES: scipy on their whole column
+    for col in np.unique(cols[fallback]):
+        sel = np.flatnonzero(fallback & (cols == col))
+        signal = _clipped(block[:, col], polarity)
+        prominence_data = peak_prominences(signal, rows[sel])
+        widths[sel] = peak_widths(signal, rows[sel], 0.5, prominence_data)[0]
+    return widths
+
+
+def find_peaks_in_columns(
+    block: np.ndarray,
+    polarity: int,
+    thresholds: np.ndarray,
+    min_peak_distance: float,
+    min_peak_width: Optional[float],
+) -> List[Tuple[np.ndarray, np.ndarray, np.ndarray]]:
+    """
+    find_peaks_in_signal for every column of block (samples x channels) multiplied by polarity
+    and clipped at 0; thresholds: min_peak_value per column (> 0).
+    Returns per column (peak values, 0-based peak locations, peak widths).
+    """
+    n_rows, n_cols = block.shape
+    mask = block >= thresholds if polarity > 0 else block <= -thresholds
+    flat = np.flatnonzero(mask)
+    # Column-major order of the candidate samples
+    flat = flat[np.argsort(flat % n_cols, kind="stable")]
+    rows, cols = np.divmod(flat, n_cols)
+    values = block[rows, cols] * polarity
+
+    # Runs of equal adjacent samples; a run is a local maximum if both neighbours are lower
+    same = (cols[1:] == cols[:-1]) & (rows[1:] == rows[:-1] + 1) & (values[1:] == values[:-1])
+    starts = np.flatnonzero(np.r_[rows.size > 0, ~same])
+    ends = np.r_[starts[1:], rows.size][:starts.size] - 1
+    first, last = rows[starts], rows[ends]
+    cols = cols[starts]
+    values = values[starts]
+    before = block[np.maximum(first - 1, 0), cols] * polarity
+    after = block[np.minimum(last + 1, n_rows - 1), cols] * polarity
+    is_peak = (first > 0) & (before < values) & (last < n_rows - 1) & (after < values)
+    rows = (first[is_peak] + last[is_peak]) // 2
+    cols = cols[is_peak]
+    values = values[is_peak]
+
+    # Greedy distance suppression, only in columns with peaks closer than the distance
+    keep = np.ones(rows.size, dtype=bool)
+    bounds = np.searchsorted(cols, np.arange(n_cols + 1))
+    close = (cols[1:] == cols[:-1]) & (np.diff(rows) < np.ceil(min_peak_distance))
+    for col in np.unique(cols[1:][close]):
+        seg = slice(bounds[col], bounds[col + 1])
+        keep[seg] = select_by_peak_distance(rows[seg], values[seg], min_peak_distance)
+    rows, cols, values = rows[keep], cols[keep], values[keep]
+
+    if min_peak_width is None:
+        widths = np.full(rows.size, np.nan)
+    else:
+        widths = get_peak_widths(block, rows, cols, values, polarity)
+        keep = min_peak_width <= widths
+        rows, cols, values, widths = rows[keep], cols[keep], values[keep], widths[keep]
+
+    bounds = np.searchsorted(cols, np.arange(n_cols + 1))
+    return [
+        (values[bounds[j]:bounds[j + 1]], rows[bounds[j]:bounds[j + 1]], widths[bounds[j]:bounds[j + 1]])
+        for j in range(n_cols)
+    ]
+
+
+def find_peaks_in_block(
+    entry: Any,
+    datacolumns: List[int],
+    polarities: Tuple[int, ...],
+    min_peak_value: float,
+    min_peak_distance: float,
+    min_peak_width: Optional[float],
+    block_bytes: int = VECTOR_BLOCK_BYTES,
+) -> Dict[Tuple[int, int], Tuple[np.ndarray, np.ndarray, np.ndarray]]:
+    """
+    Peaks of datacolumns (1-based) of a Data entry for each polarity with the vectorized engine,
+    columns processed in float64 blocks of at most block_bytes.
+    Returns {(col, polarity): (values in Volts, 1-based locations, widths)} as find_peaks_in_loop stores them.
+    """
+    data = entry["data"]
+    n_rows, n_cols = data.shape
+    cols = [col for col in datacolumns if 1 <= col <= n_cols]
+    distance = int(min_peak_distance)
+    peaks = {}
+    if min_peak_value <= 0:
+        # Clipped zeros can be peaks: no candidate preselection, use scipy
+        buffers = [np.empty(n_rows, dtype=np.float64) for _ in polarities]
+        for col in cols:
+            signals, scale = get_signals_to_check(entry, col, polarities, buffers)
+            for polarity, signal in zip(polarities, signals):
+                pks, locs_1based, w = find_peaks_in_signal(signal, min_peak_value / scale, min_peak_distance, min_peak_width)
+                peaks[col, polarity] = (pks * scale, locs_1based, w)
+        return peaks
+    if distance < 1:
+        raise ValueError("`distance` must be greater or equal to 1")
+
+    group = max(1, block_bytes // max(1, n_rows * 8))
+    for start in range(0, len(cols), group):
+        group_cols = cols[start:start + group]
+        block, scales = read_signal_block(entry, group_cols)
+        # Raw ADC data: scale the threshold instead of the signal
+        thresholds = min_peak_value / scales
+        for polarity in polarities:
+            found = find_peaks_in_columns(block, polarity, thresholds, distance, min_peak_width)
+            for col, scale, (pks, locs, w) in zip(group_cols, scales, found):
+                peaks[col, polarity] = (pks * scale, locs + 1, w)
+    return peaks
@@ -1,6 +1,20 @@
-"""Data handling and analyses: BPM update, BPM summary."""
+"""Data handling and analyses: BPM update, BPM summary (also vectorized), columnar peak store,
+incremental watch-folder analysis, checkpointed multi-experiment batches, columnar export/import,
+per-beat features, memory-budget execution planning, manual peak editing."""
 
 from .update_bpm import update_Data_BPM
 from .create_bpm_summary import create_BPM_summary
+from .create_bpm_summary_vectorized import create_BPM_summary_vectorized
+from .peak_store import PeakStore
+from .watch_folder import IncrementalAnalysis, start_incremental_analysis_of_folder
+from .batch_runner import read_batch_manifest, run_batch
+from .results_io import export_results, read_peak_table, read_summary, read_peak_store
+from .beat_features import compute_beat_features
+from .memory_plan import plan_analysis_memory, run_analysis_with_memory_plan, format_memory_plan, parse_memory_size
+from .peak_editing import PeakEditor
 
-__all__ = ["update_Data_BPM", "create_BPM_summary"]
+__all__ = ["update_Data_BPM", "create_BPM_summary", "create_BPM_summary_vectorized", "PeakStore",
+           "IncrementalAnalysis", "start_incremental_analysis_of_folder", "read_batch_manifest", "run_batch",
+           "export_results", "read_peak_table", "read_summary", "read_peak_store", "compute_beat_features",
+           "plan_analysis_memory", "run_analysis_with_memory_plan", "format_memory_plan", "parse_memory_size",
+           "PeakEditor"]
@@ -0,0 +1,302 @@
+"""
+Batch analysis of many experiments with checkpoint/resume.
+
+A manifest lists jobs (exp_name, meas_name, folder, electrodes). The files of all jobs are
+loaded and peak-detected in one worker pool (load_file_and_find_peaks). The peaks of each
+finished file are written at once to checkpoint_dir/<job name>/<file name>.npz, so a crashed
+or interrupted batch continues with only the unfinished files. A job's Data_BPM and
+Data_BPM_summary are built from its checkpoints when all of its files are done. A file whose
+load or peak finding raises is reported and skipped: the other files go on, and the failed
+one is tried again on the next run.
+"""
+
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+import csv
+import hashlib
+import json
+import os
+import re
+import numpy as np
+
+from datanalyzer.part1_raw_data_handling.load_mea import create_DataInfo_of_folder
+from datanalyzer.part1_raw_data_handling.filtering import get_filter_settings
+from datanalyzer.part1_raw_data_handling.read_h5 import read_mea_file_framerate
+from datanalyzer.part2_peak_handling.peak_signals import get_peak_finding_parameters
+from datanalyzer.part2_peak_handling.parallel_peaks import (
+    load_file_and_find_peaks,
+    make_peak_finding_jobs,
+    merge_peak_finding_results,
+)
+from datanalyzer.part2_peak_handling.vector_peaks import get_peak_engine
+from datanalyzer.part2_peak_handling.rules import set_default_filetype_rules_for_peak_finding
+from .update_bpm import update_Data_BPM
+from .create_bpm_summary import create_BPM_summary
+
+CHECKPOINT_FORMAT_VERSION = 1
+
+BATCH_JOB_DEFAULTS = {
+    "meas_date": None,
+    "electrodes": None,
+    "max_bpm": 40.0,
+    "min_peak_value": 5e-5,
+    "data_multiply": -1,
+    "using_high_peaks": -1,
+    "peak_engine": "scipy",
+    "filter_highpass": None,
+    "filter_lowpass": None,
+    "filter_notch": None,
+    "filter_zero_phase": False,
+}
+
+
+def read_batch_manifest(path: str) -> List[dict]:
+    """
+    Jobs from a .json manifest (list of objects, or {"jobs": [...]}) or a .csv manifest with a
+    header row. Fields: exp_name, meas_name, folder (required); meas_date, electrodes (list, or
+    space separated in .csv), max_bpm, min_peak_value, data_multiply, using_high_peaks,
+    peak_engine, filter_highpass, filter_lowpass, filter_notch (Hz), filter_zero_phase, name.
+    """
+    if str(path).lower().endswith(".csv"):
+        with open(path, newline="") as f:
+            rows = [{k: v for k, v in row.items() if v not in (None, "")} for row in csv.DictReader(f)]
+        for row in rows:
+            if "electrodes" in row:
+                row["electrodes"] = [int(e) for e in row["electrodes"].split()]
+            for key in ("max_bpm", "min_peak_value", "filter_highpass", "filter_lowpass", "filter_notch"):
+                if key in row:
+                    row[key] = float(row[key])
+            for key in ("data_multiply", "using_high_peaks"):
+                if key in row:
+                    row[key] = int(row[key])
+            if "filter_zero_phase" in row:
+                row["filter_zero_phase"] = row["filter_zero_phase"].lower() in ("1", "true", "yes")
+        jobs = rows
+    else:
+        with open(path) as f:
+            jobs = json.load(f)
+        if isinstance(jobs, dict):
+            jobs = jobs["jobs"]
+    for job in jobs:
+        missing = [key for key in ("exp_name", "meas_name", "folder") if key not in job]
+        if missing:
+            raise ValueError("Batch job %r is missing %s" % (job, ", ".join(missing)))
+    return [{**BATCH_JOB_DEFAULTS, **job} for job in jobs]
+
+
+def get_batch_job_name(job: dict) -> str:
+    """Job name (job["name"] or exp_name_meas_name) usable as a folder name."""
+    name = job.get("name") or "%s_%s" % (job["exp_name"], job["meas_name"])
+    return re.sub(r"[^\w.-]+", "_", str(name))
+
+
+def file_checkpoint_key(path: str, peak_job: dict) -> str:
+    """Identity of one file's peak results: file size and mtime, electrodes and peak-finding settings."""
+    st = os.stat(path)
+    fields = {
+        "version": CHECKPOINT_FORMAT_VERSION,
+        "size": st.st_size,
+        "mtime_ns": st.st_mtime_ns,
+        "mea_columns": [int(c) for c in peak_job["info"].MEA_columns],
+        "datacolumns": [int(c) for c in peak_job["datacolumns"]],
+        "data_multiply": int(peak_job["data_multiply"]),
+        "peak_parameters": [float(p) for p in peak_job["peak_parameters"]],
+    }
+    filter_settings = get_filter_settings(peak_job.get("rule"))
+    if filter_settings is not None:
+        fields["filter"] = filter_settings
+    return hashlib.sha1(json.dumps(fields, sort_keys=True).encode()).hexdigest()
+
+
+def save_file_checkpoint(path: Path, key: str, result: dict) -> None:
+    """Write one load_file_and_find_peaks result atomically (tmp file + os.replace)."""
+    peaks = sorted(result["peaks"].items())
+    arrays = {
+        "key": np.array(key),
+        "framerate": np.array(result["framerate"], dtype=float),
+        "bytes_read": np.array(result["bytes_read"], dtype=np.int64),
+        "bytes_in_file": np.array(result["bytes_in_file"], dtype=np.int64),
+        "columns": np.array([col for (col, _), _ in peaks], dtype=np.int64),
+        "polarities": np.array([polarity for (_, polarity), _ in peaks], dtype=np.int64),
+        "counts": np.array([len(pks) for _, (pks, _, _) in peaks], dtype=np.int64),
+    }
+    for ii, name in enumerate(("pks", "locs", "widths")):
+        parts = [np.asarray(p[ii]) for _, p in peaks]
+        arrays[name] = np.concatenate(parts) if parts else np.array([])
+    tmp = path.with_name("%s.%d.tmp" % (path.name, os.getpid()))
+    with open(tmp, "wb") as f:
+        np.savez(f, **arrays)
+    os.replace(tmp, path)
+
+
+def load_file_checkpoint(path: Path, key: str) -> Optional[dict]:
+    """The checkpointed result stored by save_file_checkpoint, or None if missing or stale."""
+    try:
+        with np.load(path) as z:
+            if str(z["key"]) != key:
+                return None
+            ends = np.cumsum(z["counts"])
+            starts = ends - z["counts"]
+            pks, locs, widths = z["pks"], z["locs"], z["widths"]
+            return {
+                "framerate": float(z["framerate"]),
+                "bytes_read": int(z["bytes_read"]),
+                "bytes_in_file": int(z["bytes_in_file"]),
+                "peaks": {
+                    (int(col), int(polarity)): (pks[a:b], locs[a:b], widths[a:b])
+                    for col, polarity, a, b in zip(z["columns"], z["polarities"], starts, ends)
+                },
+            }
+    except (OSError, KeyError, ValueError):
+        return None
+
+
+def prepare_batch_job(job: dict, checkpoint_dir: str) -> dict:
+    """DataInfo, Rule and per-file peak jobs of one manifest job; files with a valid checkpoint are loaded."""
+    DataInfo = create_DataInfo_of_folder(
+        exp_name=job["exp_name"],
+        meas_name=job["meas_name"],
+        meas_date=job["meas_date"],
+        file_type=".h5",
+        folder_of_files=job["folder"],
+        manually_chosen_mea_electrodes=job["electrodes"],
+    )
+    state = {"name": get_batch_job_name(job), "job": job, "DataInfo": DataInfo, "results": {}, "peak_jobs": []}
+    if not DataInfo.file_names:
+        return state
+    n_files = len(DataInfo.file_names)
+    # From the first readable file; unreadable ones fail (and are reported) in run_batch
+    frame_rate = 25e3
+    for idx in range(1, n_files + 1):
+        try:
+            frame_rate = read_mea_file_framerate(DataInfo, idx)
+            break
+        except (OSError, KeyError, ValueError, ZeroDivisionError):
+            continue
+    Rule = set_default_filetype_rules_for_peak_finding(frame_rate=frame_rate)
+    Rule.max_bpm = job["max_bpm"]
+    Rule.min_peak_value = job["min_peak_value"]
+    Rule.peak_engine = job["peak_engine"]
+    for key in ("filter_highpass", "filter_lowpass", "filter_notch", "filter_zero_phase"):
+        setattr(Rule, key, job[key])
+    DataInfo.Rule = Rule
+    peak_jobs = make_peak_finding_jobs(
+        DataInfo,
+        get_peak_finding_parameters(Rule),
+        list(range(1, n_files + 1)),
+        list(range(1, len(DataInfo.MEA_columns) + 1)),
+        job["data_multiply"],
+        get_peak_engine(Rule),
+        Rule,
+    )
+    folder = Path(checkpoint_dir) / state["name"]
+    folder.mkdir(parents=True, exist_ok=True)
+    for peak_job in peak_jobs:
+        file_name = DataInfo.file_names[peak_job["file_index"] - 1]
+        peak_job["checkpoint"] = folder / (file_name + ".npz")
+        peak_job["checkpoint_key"] = file_checkpoint_key(DataInfo.folder_raw_files + file_name, peak_job)
+        cached = load_file_checkpoint(peak_job["checkpoint"], peak_job["checkpoint_key"])
+        if cached is not None:
+            state["results"][peak_job["file_index"]] = cached
+    state["peak_jobs"] = peak_jobs
+    state["files_from_checkpoint"] = len(state["results"])
+    return state
+
+
+def finish_batch_job(state: dict) -> dict:
+    """Data_BPM and Data_BPM_summary of a job whose files are all done."""
+    DataInfo = state["DataInfo"]
+    jobs = state["peak_jobs"]
+    Data_BPM = merge_peak_finding_results(DataInfo, jobs, [state["results"][job["file_index"]] for job in jobs])
+    Data_BPM = update_Data_BPM(DataInfo, Data_BPM, using_high_peaks=state["job"]["using_high_peaks"])
+    return {
+        "DataInfo": DataInfo,
+        "Data_BPM": Data_BPM,
+        "Data_BPM_summary": create_BPM_summary(DataInfo, Data_BPM),
+        "files_from_checkpoint": state["files_from_checkpoint"],
+    }
+
+
+def run_batch(
+    jobs: List[dict],
+    checkpoint_dir: str,
+    workers: Optional[int] = None,
+    progress: Optional[Callable[[str, str, int, int], None]] = None,
+    on_job_done: Optional[Callable[[str, dict], None]] = None,
+    failed: Optional[Dict[str, Dict[str, str]]] = None,
+) -> Dict[str, dict]:
+    """
+    Analyze all jobs (from read_batch_manifest) with one process pool of workers processes
+    (default os.cpu_count(); 1 = in this process). Each finished file is checkpointed under
+    checkpoint_dir before the next result is handled; on a re-run, files whose checkpoint
+    matches (same file size/mtime, electrodes and Rule) are not read again.
+    progress(job name, file name, files done, files in job) is called per finished file,
+    on_job_done(job name, result) as soon as a job is complete.
+    failed: dict to fill with {job name: {file name: error}} of files whose load or peak
+    finding raised; the other files go on, and the failed ones are not checkpointed, so
+    their jobs are not finished in this run and they are tried again on the next.
+    Returns {job name: {"DataInfo", "Data_BPM", "Data_BPM_summary", "files_from_checkpoint"}};
+    jobs without .h5 files or with failed files are left out.
+    """
+    if workers is None:
+        workers = os.cpu_count() or 1
+    states = [prepare_batch_job({**BATCH_JOB_DEFAULTS, **job}, checkpoint_dir) for job in jobs]
+    names = [state["name"] for state in states]
+    if len(set(names)) != len(names):
+        raise ValueError("Batch job names must be unique (set 'name' in the manifest): %s" % names)
+    out = {}
+
+    def file_done(state: dict, peak_job: dict, result: dict) -> None:
+        save_file_checkpoint(peak_job["checkpoint"], peak_job["checkpoint_key"], result)
+        state["results"][peak_job["file_index"]] = result
+        if progress is not None:
+            file_name = state["DataInfo"].file_names[peak_job["file_index"] - 1]
+            progress(state["name"], file_name, len(state["results"]), len(state["peak_jobs"]))
+        if len(state["results"]) == len(state["peak_jobs"]):
+            job_done(state)
+
+    def file_failed(state: dict, peak_job: dict, error: Exception) -> None:
+        if failed is not None:
+            file_name = state["DataInfo"].file_names[peak_job["file_index"] - 1]
+            failed.setdefault(state["name"], {})[file_name] = "%s: %s" % (type(error).__name__, error)
+
+    def job_done(state: dict) -> None:
+        out[state["name"]] = finish_batch_job(state)
+        if on_job_done is not None:
+            on_job_done(state["name"], out[state["name"]])
+
+    todo = []
+    for state in states:
+        if not state["peak_jobs"]:
+            continue
+        if len(state["results"]) == len(state["peak_jobs"]):
+            job_done(state)
+        todo.extend((state, pj) for pj in state["peak_jobs"] if pj["file_index"] not in state["results"])
+
+    if workers <= 1 or len(todo) <= 1:
+        for state, peak_job in todo:
+            try:
+                result = load_file_and_find_peaks(peak_job)
+            except Exception as e:
+                file_failed(state, peak_job, e)
+                continue
+            file_done(state, peak_job, result)
+    else:
+        with ProcessPoolExecutor(max_workers=min(workers, len(todo))) as executor:
+            futures = {executor.submit(load_file_and_find_peaks, pj): (state, pj) for state, pj in todo}
+            try:
+                for future in as_completed(futures):
+                    state, peak_job = futures[future]
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        file_failed(state, peak_job, e)
+                        continue
+                    file_done(state, peak_job, result)
+            except BaseException:
+                # Finished files are checkpointed; do not start the queued ones
+                for future in futures:
+                    future.cancel()
+                raise
+    return {name: out[name] for name in names if name in out}
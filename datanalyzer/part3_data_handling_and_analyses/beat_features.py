@@ -0,0 +1,195 @@
+"""
+Per-beat features of the active peaks (update_Data_BPM) of every file and electrode.
+
+A beat is the window of pre_ms before to fpd_max_ms after its peak. All windows of a signal
+column are rows of one sliding_window_view, a strided view that copies nothing; the rows of
+the beats are gathered BEAT_BLOCK_BYTES at a time and every feature is computed for all of
+them with row-wise NumPy reductions:
+
+- FPD: field potential duration (ms), from the peak to the repolarization peak
+- repolarization_amplitude: repolarization peak minus the pre-beat baseline (V)
+- depolarization_slope: largest |dV/dt| within slope_ms of the peak (V/s)
+- template_correlation: Pearson correlation of the beat with the mean beat of the electrode
+
+Features are stored in Data_BPM[kk][feature][col], aligned with peak_locations (NaN for beats
+whose window does not fit in the signal), and averaged per file by create_BPM_summary.
+"""
+
+from typing import Any, Dict, Iterator, List, Optional
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+from datanalyzer.profiling import profile_stage
+from .update_bpm import get_file_framerate
+
+BEAT_FEATURE_KEYS = ("FPD", "repolarization_amplitude", "depolarization_slope", "template_correlation")
+BEAT_BLOCK_BYTES = 64 * 2**20
+
+
+def get_beat_windows(signal: np.ndarray, pre: int, post: int) -> np.ndarray:
+    """
+    Strided (no copy) view of 1-D signal with one row per window of pre + post + 1 samples;
+    row r is the beat window of a peak at 0-based sample r + pre.
+    """
+    width = pre + post + 1
+    if signal.shape[0] < width:
+        return np.empty((0, width), dtype=signal.dtype)
+    return sliding_window_view(signal, width)
+
+
+def iter_beat_chunks(n_beats: int, width: int, block_bytes: int = BEAT_BLOCK_BYTES) -> Iterator[slice]:
+    """Slices of at most block_bytes of float64 beat windows of width samples."""
+    step = max(1, block_bytes // (8 * width))
+    for b0 in range(0, n_beats, step):
+        yield slice(b0, min(b0 + step, n_beats))
+
+
+def gather_beats(windows: np.ndarray, starts: np.ndarray, scale: float = 1.0, offset: float = 0.0) -> np.ndarray:
+    """float64 Volts of the beat windows starting at 0-based rows starts (raw ADC: (x - offset) * scale)."""
+    beats = windows[starts].astype(np.float64)
+    if scale != 1.0 or offset != 0.0:
+        beats -= offset
+        beats *= scale
+    return beats
+
+
+def get_beat_features(
+    windows: np.ndarray,
+    starts: np.ndarray,
+    framerate: float,
+    pre: int,
+    fpd_min: int,
+    slope: int,
+    repolarization_polarity: int = 0,
+    scale: float = 1.0,
+    offset: float = 0.0,
+    block_bytes: int = BEAT_BLOCK_BYTES,
+) -> Dict[str, np.ndarray]:
+    """
+    BEAT_FEATURE_KEYS of the beats at window rows starts (see get_beat_windows). pre, fpd_min
+    and slope are in samples. repolarization_polarity: 1 = positive repolarization peak,
+    -1 = negative, 0 = largest deviation from the baseline of either sign.
+    The mean beat is needed for template_correlation, so when the beats do not fit in one
+    chunk they are gathered twice.
+    """
+    n_beats = starts.size
+    width = windows.shape[1]
+    out = {key: np.full(n_beats, np.nan) for key in BEAT_FEATURE_KEYS}
+    if n_beats == 0:
+        return out
+    chunks = list(iter_beat_chunks(n_beats, width, block_bytes))
+    kept = None
+    total = np.zeros(width)
+    for sl in chunks:
+        beats = gather_beats(windows, starts[sl], scale, offset)
+        total += beats.sum(axis=0)
+        if len(chunks) == 1:
+            kept = beats
+    template = total / n_beats
+    template -= template.mean()
+    template_norm = np.sqrt(template @ template)
+
+    rows = np.arange(width - pre - fpd_min)
+    for sl in chunks:
+        beats = kept if kept is not None else gather_beats(windows, starts[sl], scale, offset)
+        baseline = beats[:, :pre].mean(axis=1) if pre > 0 else beats[:, 0]
+        around = beats[:, max(0, pre - slope):pre + slope + 1]
+        out["depolarization_slope"][sl] = np.abs(np.diff(around, axis=1)).max(axis=1) * framerate
+        repolarization = beats[:, pre + fpd_min:] - baseline[:, None]
+        if repolarization_polarity > 0:
+            idx = repolarization.argmax(axis=1)
+        elif repolarization_polarity < 0:
+            idx = repolarization.argmin(axis=1)
+        else:
+            idx = np.abs(repolarization).argmax(axis=1)
+        out["repolarization_amplitude"][sl] = repolarization[np.arange(idx.size), idx]
+        out["FPD"][sl] = (fpd_min + rows[idx]) / framerate * 1e3
+        beats -= beats.mean(axis=1)[:, None]
+        with np.errstate(invalid="ignore", divide="ignore"):
+            out["template_correlation"][sl] = (beats @ template) / (np.sqrt(np.einsum("ij,ij->i", beats, beats)) * template_norm)
+    return out
+
+
+def get_beat_features_of_column(
+    entry: Any,
+    col: int,
+    locations: np.ndarray,
+    framerate: float,
+    pre_ms: float = 5.0,
+    fpd_min_ms: float = 50.0,
+    fpd_max_ms: float = 600.0,
+    slope_ms: float = 1.0,
+    repolarization_polarity: int = 0,
+    block_bytes: int = BEAT_BLOCK_BYTES,
+) -> Dict[str, np.ndarray]:
+    """
+    BEAT_FEATURE_KEYS of the peaks at 1-based locations of data column col (1-based) of a Data
+    entry (float64, float32 or raw ADC storage), aligned with locations; NaN where the window
+    pre_ms before to fpd_max_ms after the peak does not fit in the signal.
+    """
+    pre = int(round(pre_ms * 1e-3 * framerate))
+    post = int(round(fpd_max_ms * 1e-3 * framerate))
+    fpd_min = min(int(round(fpd_min_ms * 1e-3 * framerate)), post)
+    slope = max(1, int(round(slope_ms * 1e-3 * framerate)))
+    locations = np.atleast_1d(np.asarray(locations, dtype=np.int64))
+    data = entry["data"]
+    windows = get_beat_windows(data[:, col - 1], pre, post)
+    starts = locations - 1 - pre
+    valid = (starts >= 0) & (starts < windows.shape[0])
+    scale, offset = 1.0, 0.0
+    if "scale" in entry:
+        scale, offset = float(entry["scale"][col - 1]), float(entry["offset"][col - 1])
+    features = get_beat_features(
+        windows, starts[valid], framerate, pre, fpd_min, slope, repolarization_polarity, scale, offset, block_bytes
+    )
+    out = {}
+    for key, values in features.items():
+        out[key] = np.full(locations.size, np.nan)
+        out[key][valid] = values
+    return out
+
+
+def compute_beat_features(
+    Data: List[dict],
+    DataInfo: Any,
+    Data_BPM: List[dict],
+    filenumbers: Optional[List[int]] = None,
+    datacolumns: Optional[List[int]] = None,
+    pre_ms: float = 5.0,
+    fpd_min_ms: float = 50.0,
+    fpd_max_ms: float = 600.0,
+    slope_ms: float = 1.0,
+    repolarization_polarity: int = 0,
+) -> List[dict]:
+    """
+    Compute BEAT_FEATURE_KEYS for the active peaks (peak_locations, after update_Data_BPM) of
+    each file and datacolumn and store them in Data_BPM[kk][feature][col].
+    Window: pre_ms before to fpd_max_ms after each peak; the repolarization peak is searched
+    from fpd_min_ms on (repolarization_polarity: 1 positive, -1 negative, 0 either);
+    depolarization_slope within slope_ms of the peak.
+    """
+    n_files = len(Data_BPM)
+    if filenumbers is None:
+        filenumbers = list(range(1, n_files + 1))
+    for file_idx in filenumbers:
+        if file_idx < 1 or file_idx > n_files:
+            continue
+        d = Data_BPM[file_idx - 1]
+        if "peak_locations" not in d:
+            continue
+        with profile_stage("beat_features", file_idx):
+            entry = Data[file_idx - 1]
+            fs = get_file_framerate(DataInfo, file_idx - 1)
+            cols = datacolumns if datacolumns is not None else sorted(d["peak_locations"])
+            for key in BEAT_FEATURE_KEYS:
+                d.setdefault(key, {})
+            for col in cols:
+                locs = d["peak_locations"].get(col)
+                if locs is None:
+                    continue
+                features = get_beat_features_of_column(
+                    entry, col, locs, fs, pre_ms, fpd_min_ms, fpd_max_ms, slope_ms, repolarization_polarity
+                )
+                for key, values in features.items():
+                    d[key][col] = values
+    return Data_BPM
@@ -2,9 +2,56 @@
 Create Data_BPM_summary from Data_BPM and DataInfo.
 """
 
-from typing import List, Optional, Any
+from typing import List, Optional, Any, Tuple
 import numpy as np
 
+from datanalyzer.profiling import profile_stage
+from .beat_features import BEAT_FEATURE_KEYS
+from .update_bpm import get_file_framerate
+
+
+def get_normalizing_indexes(DataInfo: Any) -> List[int]:
+    """Default normalizing indexes: last (up to 3) files before hypoxia start, else [0]."""
+    try:
+        start_sec = DataInfo.hypoxia["start_time_sec"]
+        idx_before = np.where(DataInfo.measurement_time["time_sec"] <= start_sec)[0]
+        if len(idx_before) >= 3:
+            return [idx_before[-3], idx_before[-2], idx_before[-1]]
+        elif len(idx_before) == 2:
+            return [idx_before[-2], idx_before[-1]]
+        return [0]
+    except (AttributeError, KeyError, TypeError):
+        return [0]
+
+
+def get_BPM_summary_baseline(out: dict, normalizing_indexes: List[int], n_files: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Per-column (Amplitude, BPM) baseline: mean of the normalizing_indexes rows (all rows if none is valid)."""
+    norm_idx = np.array(normalizing_indexes)
+    norm_idx = norm_idx[norm_idx < n_files]
+    if norm_idx.size > 0:
+        return (
+            np.nanmean(out["Amplitude_avg"][norm_idx, :], axis=0),
+            np.nanmean(out["BPM_avg"][norm_idx, :], axis=0),
+        )
+    return (
+        np.nanmean(out["Amplitude_avg"], axis=0) + 1e-12,
+        np.nanmean(out["BPM_avg"], axis=0) + 1e-12,
+    )
+
+
+def normalize_BPM_summary(out: dict, normalizing_indexes: List[int], n_files: int) -> dict:
+    """Amplitude_norm and BPM_norm of a summary, normalized by the mean of normalizing_indexes rows."""
+    amplitude_baseline, bpm_baseline = get_BPM_summary_baseline(out, normalizing_indexes, n_files)
+    return {
+        "Amplitude_norm": out["Amplitude_avg"] / amplitude_baseline,
+        "BPM_norm": out["BPM_avg"] / bpm_baseline,
+    }
+
+
+def get_beat_feature_keys(Data_BPM: List[dict], n_files: int) -> List[str]:
+    """BEAT_FEATURE_KEYS computed (compute_beat_features) for any of the first n_files files."""
+    return [key for key in BEAT_FEATURE_KEYS if any(key in Data_BPM[kk] for kk in range(n_files))]
+
 
 def create_BPM_summary(
     DataInfo: Any,
@@ -15,6 +62,7 @@ def create_BPM_summary(
     """
     Build summary: Amount_of_peaks, BPM_avg, BPM_avg_stdpros, peak_values, peak_locations,
     Amplitude_avg, Amplitude_std_pros, peak_width_avg, normalizing, peak_distances.
+    If compute_beat_features was run, also <feature>_avg and <feature>_std of each beat feature.
     """
     n_files = DataInfo.files_amount
     if chosen_datacol_indexes is None:
@@ -23,25 +71,15 @@ def create_BPM_summary(
     n_cols = len(DataInfo.datacol_numbers)
 
     if normalizing_indexes is None:
-        try:
-            start_sec = DataInfo.hypoxia["start_time_sec"]
-            idx_before = np.where(DataInfo.measurement_time["time_sec"] <= start_sec)[0]
-            if len(idx_before) >= 3:
-                normalizing_indexes = [idx_before[-3], idx_before[-2], idx_before[-1]]
-            elif len(idx_before) == 2:
-                normalizing_indexes = [idx_before[-2], idx_before[-1]]
-            else:
-                normalizing_indexes = [0]
-        except (AttributeError, KeyError, TypeError):
-            normalizing_indexes = [0]
+        normalizing_indexes = get_normalizing_indexes(DataInfo)
 
     out = {}
     out["Amount_of_peaks"] = np.full((n_files, n_cols), np.nan)
     out["BPM_avg"] = np.full((n_files, n_cols), np.nan)
     out["BPM_avg_stdpros"] = np.full((n_files, n_cols), np.nan)
-    out["peak_values"] = {kk: Data_BPM[kk].get("peak_values", {}) for kk in range(n_files)}
-    out["peak_locations"] = {kk: Data_BPM[kk].get("peak_locations", {}) for kk in range(n_files)}
-    out["peak_widths"] = {kk: Data_BPM[kk].get("peak_widths", {}) for kk in range(n_files)}
+    out["peak_values"] = {}
+    out["peak_locations"] = {}
+    out["peak_widths"] = {}
     out["Amplitude_avg"] = np.full((n_files, len(ind_col)), np.nan)
     out["Amplitude_std_pros"] = np.full((n_files, len(ind_col)), np.nan)
     out["peak_width_avg"] = np.full((n_files, len(ind_col)), np.nan)
@@ -50,11 +88,32 @@ def create_BPM_summary(
     out["peak_distances"] = {}
     out["peak_distances_avg"] = np.full((n_files, n_cols), np.nan)
     out["peak_distances_std"] = np.full((n_files, n_cols), np.nan)
+    for key in get_beat_feature_keys(Data_BPM, n_files):
+        out[key + "_avg"] = np.full((n_files, len(ind_col)), np.nan)
+        out[key + "_std"] = np.full((n_files, len(ind_col)), np.nan)
 
     for kk in range(n_files):
-        d = Data_BPM[kk]
-        if "Amount_of_peaks" not in d:
-            continue
+        with profile_stage("create_BPM_summary", kk + 1):
+            set_BPM_summary_of_file(out, DataInfo, Data_BPM, kk, ind_col, n_cols)
+
+    out.update(normalize_BPM_summary(out, normalizing_indexes, n_files))
+    return out
+
+
+def set_BPM_summary_of_file(
+    out: dict,
+    DataInfo: Any,
+    Data_BPM: List[dict],
+    kk: int,
+    ind_col: List[int],
+    n_cols: int,
+) -> dict:
+    """Fill row kk (0-based file) of summary out from Data_BPM[kk]; normalization is not touched."""
+    d = Data_BPM[kk]
+    out["peak_values"][kk] = d.get("peak_values", {})
+    out["peak_locations"][kk] = d.get("peak_locations", {})
+    out["peak_widths"][kk] = d.get("peak_widths", {})
+    if "Amount_of_peaks" in d:
         out["Amount_of_peaks"][kk, :] = d["Amount_of_peaks"]
         out["BPM_avg"][kk, :] = d["BPM_avg"]
         dt = d.get("peak_avg_distance_in_ms", np.full((n_cols, 2), np.nan))
@@ -62,52 +121,64 @@ def create_BPM_summary(
             stdp = np.where(dt[:, 0] > 0, dt[:, 1] / dt[:, 0] * 100, np.nan)
             out["BPM_avg_stdpros"][kk, :] = stdp
 
-    for kk in range(n_files):
-        for ii, ind in enumerate(ind_col):
-            pv = out["peak_values"].get(kk, {}).get(ind, np.array([np.nan]))
-            pv = np.atleast_1d(pv)
-            out["Amplitude_avg"][kk, ii] = np.nanmean(pv)
-            if np.nanmean(pv) != 0:
-                out["Amplitude_std_pros"][kk, ii] = np.nanstd(pv) / np.nanmean(pv) * 100
-            pw = out["peak_widths"].get(kk, {}).get(ind, np.array([np.nan]))
-            pw = np.atleast_1d(pw)
-            out["peak_width_avg"][kk, ii] = np.nanmean(pw)
-            if np.nanmean(pw) != 0:
-                out["peak_width_std_pros"][kk, ii] = np.nanstd(pw) / np.nanmean(pw) * 100
+    fs = get_file_framerate(DataInfo, kk)
+    out["peak_distances"][kk] = {}
+    for ii, ind in enumerate(ind_col):
+        set_BPM_summary_of_column(out, d, kk, ii, ind, fs)
+    return out
 
-    norm_idx = np.array(normalizing_indexes)
-    norm_idx = norm_idx[norm_idx < n_files]
-    if norm_idx.size > 0:
-        out["Amplitude_norm"] = out["Amplitude_avg"] / np.nanmean(out["Amplitude_avg"][norm_idx, :], axis=0)
-        out["BPM_norm"] = out["BPM_avg"] / np.nanmean(out["BPM_avg"][norm_idx, :], axis=0)
-    else:
-        out["Amplitude_norm"] = out["Amplitude_avg"] / (np.nanmean(out["Amplitude_avg"], axis=0) + 1e-12)
-        out["BPM_norm"] = out["BPM_avg"] / (np.nanmean(out["BPM_avg"], axis=0) + 1e-12)
-
-    for file_index in range(n_files):
-        try:
-            fs = float(DataInfo.framerate[file_index, 0])
-        except (IndexError, TypeError):
-            fs = float(DataInfo.framerate.flat[0])
-        out["peak_distances"][file_index] = {}
-        for kk, col_index in enumerate(chosen_datacol_indexes):
-            try:
-                locs = Data_BPM[file_index]["peak_locations"].get(col_index, np.array([]))
-                locs = np.atleast_1d(locs)
-                if locs.size < 2:
-                    out["peak_distances"][file_index][col_index] = np.array([np.nan])
-                else:
-                    out["peak_distances"][file_index][col_index] = np.diff(locs) / fs * 1e3
-            except Exception:
-                out["peak_distances"][file_index][col_index] = np.array([np.nan])
-            arr = out["peak_distances"][file_index][col_index]
-            arr = np.atleast_1d(arr)
-            arr = arr[~np.isnan(arr)]
-            if arr.size > 0:
-                out["peak_distances_avg"][file_index, col_index - 1] = np.mean(arr)
-                out["peak_distances_std"][file_index, col_index - 1] = np.std(arr)
-            else:
-                out["peak_distances_avg"][file_index, col_index - 1] = np.nan
-                out["peak_distances_std"][file_index, col_index - 1] = np.nan
 
+def set_BPM_summary_rates_of_column(out: dict, d: dict, kk: int, col: int) -> dict:
+    """Amount_of_peaks, BPM_avg and BPM_avg_stdpros of row kk, 1-based column col from Data_BPM[kk] d."""
+    if "Amount_of_peaks" not in d:
+        return out
+    out["Amount_of_peaks"][kk, col - 1] = d["Amount_of_peaks"][col - 1]
+    out["BPM_avg"][kk, col - 1] = d["BPM_avg"][col - 1]
+    dt = d.get("peak_avg_distance_in_ms")
+    if dt is not None and dt.shape[0] >= out["BPM_avg_stdpros"].shape[1]:
+        out["BPM_avg_stdpros"][kk, col - 1] = dt[col - 1, 1] / dt[col - 1, 0] * 100 if dt[col - 1, 0] > 0 else np.nan
+    return out
+
+
+def set_BPM_summary_of_column(out: dict, d: dict, kk: int, ii: int, ind: int, fs: float) -> dict:
+    """
+    Amplitude, peak width, beat feature and peak distance statistics of row kk, summary
+    column ii (data column ind, 1-based) from Data_BPM[kk] d; fs: the file's framerate.
+    """
+    pv = out["peak_values"].get(kk, {}).get(ind, np.array([np.nan]))
+    pv = np.atleast_1d(pv)
+    out["Amplitude_avg"][kk, ii] = np.nanmean(pv)
+    if np.nanmean(pv) != 0:
+        out["Amplitude_std_pros"][kk, ii] = np.nanstd(pv) / np.nanmean(pv) * 100
+    pw = out["peak_widths"].get(kk, {}).get(ind, np.array([np.nan]))
+    pw = np.atleast_1d(pw)
+    out["peak_width_avg"][kk, ii] = np.nanmean(pw)
+    if np.nanmean(pw) != 0:
+        out["peak_width_std_pros"][kk, ii] = np.nanstd(pw) / np.nanmean(pw) * 100
+
+    for key in BEAT_FEATURE_KEYS:
+        if key + "_avg" not in out:
+            continue
+        values = np.atleast_1d(d.get(key, {}).get(ind, np.array([np.nan])))
+        out[key + "_avg"][kk, ii] = np.nanmean(values)
+        out[key + "_std"][kk, ii] = np.nanstd(values)
+
+    try:
+        locs = d["peak_locations"].get(ind, np.array([]))
+        locs = np.atleast_1d(locs)
+        if locs.size < 2:
+            out["peak_distances"][kk][ind] = np.array([np.nan])
+        else:
+            out["peak_distances"][kk][ind] = np.diff(locs) / fs * 1e3
+    except Exception:
+        out["peak_distances"][kk][ind] = np.array([np.nan])
+    arr = out["peak_distances"][kk][ind]
+    arr = np.atleast_1d(arr)
+    arr = arr[~np.isnan(arr)]
+    if arr.size > 0:
+        out["peak_distances_avg"][kk, ind - 1] = np.mean(arr)
+        out["peak_distances_std"][kk, ind - 1] = np.std(arr)
+    else:
+        out["peak_distances_avg"][kk, ind - 1] = np.nan
+        out["peak_distances_std"][kk, ind - 1] = np.nan
     return out
@@ -0,0 +1,160 @@
+"""
+Vectorized create_BPM_summary: the per-file, per-electrode statistics are computed with a few
+segmented reductions over concatenated peak arrays instead of nested loops of np.nanmean calls.
+"""
+
+from typing import List, Optional, Any, Tuple, Union
+import numpy as np
+
+from .create_bpm_summary import get_beat_feature_keys, get_normalizing_indexes, normalize_BPM_summary
+from .peak_store import PeakStore, PeakStoreView, get_framerates, segment_lengths_to_offsets, segment_nanmean_nanstd
+
+
+def gather_Data_BPM_segments(
+    Data_BPM: List[dict],
+    key: str,
+    n_files: int,
+    ind_col: List[int],
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Concatenate Data_BPM[kk][key][col] for all files kk and columns of ind_col.
+    Returns (values, offsets) with segment kk * len(ind_col) + ii; missing columns are empty.
+    """
+    arrays = []
+    lengths = np.zeros(n_files * len(ind_col), dtype=np.int64)
+    for kk in range(n_files):
+        cols = Data_BPM[kk].get(key, {})
+        for ii, ind in enumerate(ind_col):
+            arr = cols.get(ind)
+            if arr is None:
+                continue
+            arr = np.atleast_1d(arr)
+            lengths[kk * len(ind_col) + ii] = arr.size
+            arrays.append(arr)
+    values = np.concatenate(arrays) if arrays else np.array([])
+    return values, segment_lengths_to_offsets(lengths)
+
+
+def gather_PeakStore_segments(
+    store: PeakStore,
+    field: str,
+    n_files: int,
+    ind_col: List[int],
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Same as gather_Data_BPM_segments for the active polarity of a PeakStore (one fancy index)."""
+    kk = np.repeat(np.arange(n_files), len(ind_col))
+    cols = np.tile(np.asarray(ind_col, dtype=np.int64), n_files)
+    seg = ((kk * store.n_cols + cols - 1) * 2 + store.use_high[kk, cols - 1]).astype(np.int64)
+    starts = store.offsets[seg]
+    lengths = store.offsets[seg + 1] - starts
+    offsets = segment_lengths_to_offsets(lengths)
+    rows = np.repeat(starts - offsets[:-1], lengths) + np.arange(offsets[-1])
+    return getattr(store, field)[rows], offsets
+
+
+def create_BPM_summary_vectorized(
+    DataInfo: Any,
+    Data_BPM: Union[List[dict], PeakStore, PeakStoreView],
+    normalizing_indexes: Optional[List[int]] = None,
+    chosen_datacol_indexes: Optional[List[int]] = None,
+) -> dict:
+    """
+    Same output as create_BPM_summary (identical values), computed with segmented reductions.
+    Data_BPM may be the list of dicts from update_Data_BPM, or a PeakStore (or its
+    as_Data_BPM() view) after update_bpm, in which case peaks are gathered without Python loops.
+    """
+    store = None
+    if isinstance(Data_BPM, PeakStoreView):
+        store = Data_BPM.store
+    elif isinstance(Data_BPM, PeakStore):
+        store = Data_BPM
+    if store is not None:
+        Data_BPM = store.as_Data_BPM()
+        if store.bpm is None:
+            # No active peak set yet: read the (empty) view like a Data_BPM list
+            store = None
+
+    n_files = DataInfo.files_amount
+    if chosen_datacol_indexes is None:
+        chosen_datacol_indexes = list(range(1, len(DataInfo.datacol_numbers) + 1))
+    ind_col = list(chosen_datacol_indexes)
+    n_cols = len(DataInfo.datacol_numbers)
+    n_ind = len(ind_col)
+    if normalizing_indexes is None:
+        normalizing_indexes = get_normalizing_indexes(DataInfo)
+
+    out = {}
+    out["Amount_of_peaks"] = np.full((n_files, n_cols), np.nan)
+    out["BPM_avg"] = np.full((n_files, n_cols), np.nan)
+    out["BPM_avg_stdpros"] = np.full((n_files, n_cols), np.nan)
+    out["peak_values"] = {kk: Data_BPM[kk].get("peak_values", {}) for kk in range(n_files)}
+    out["peak_locations"] = {kk: Data_BPM[kk].get("peak_locations", {}) for kk in range(n_files)}
+    out["peak_widths"] = {kk: Data_BPM[kk].get("peak_widths", {}) for kk in range(n_files)}
+    out["normalizing_indexes"] = normalizing_indexes
+    out["peak_distances"] = {}
+    out["peak_distances_avg"] = np.full((n_files, n_cols), np.nan)
+    out["peak_distances_std"] = np.full((n_files, n_cols), np.nan)
+
+    if store is not None:
+        high = store.use_high[:n_files]
+        out["Amount_of_peaks"][:] = np.where(high, store.amount_of_peaks[:n_files, :, 1],
+                                             store.amount_of_peaks[:n_files, :, 0])
+        out["BPM_avg"][:] = np.where(high, store.bpm[:n_files, :, 1], store.bpm[:n_files, :, 0])
+        dt = np.where(high[:, :, None], store.avg_distance[:n_files, :, 1, :], store.avg_distance[:n_files, :, 0, :])
+        with np.errstate(invalid="ignore", divide="ignore"):
+            out["BPM_avg_stdpros"][:] = np.where(dt[:, :, 0] > 0, dt[:, :, 1] / dt[:, :, 0] * 100, np.nan)
+    else:
+        for kk in range(n_files):
+            d = Data_BPM[kk]
+            if "Amount_of_peaks" not in d:
+                continue
+            out["Amount_of_peaks"][kk, :] = d["Amount_of_peaks"]
+            out["BPM_avg"][kk, :] = d["BPM_avg"]
+            dt = d.get("peak_avg_distance_in_ms", np.full((n_cols, 2), np.nan))
+            if dt.shape[0] >= n_cols:
+                with np.errstate(invalid="ignore", divide="ignore"):
+                    out["BPM_avg_stdpros"][kk, :] = np.where(dt[:, 0] > 0, dt[:, 1] / dt[:, 0] * 100, np.nan)
+
+    if store is not None:
+        values, value_offsets = gather_PeakStore_segments(store, "values", n_files, ind_col)
+        widths, width_offsets = gather_PeakStore_segments(store, "widths", n_files, ind_col)
+        locs, loc_offsets = gather_PeakStore_segments(store, "locations", n_files, ind_col)
+    else:
+        values, value_offsets = gather_Data_BPM_segments(Data_BPM, "peak_values", n_files, ind_col)
+        widths, width_offsets = gather_Data_BPM_segments(Data_BPM, "peak_widths", n_files, ind_col)
+        locs, loc_offsets = gather_Data_BPM_segments(Data_BPM, "peak_locations", n_files, ind_col)
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        amp_avg, amp_std = segment_nanmean_nanstd(values.astype(float), value_offsets)
+        out["Amplitude_avg"] = amp_avg.reshape(n_files, n_ind)
+        out["Amplitude_std_pros"] = np.where(amp_avg != 0, amp_std / amp_avg * 100, np.nan).reshape(n_files, n_ind)
+        width_avg, width_std = segment_nanmean_nanstd(widths.astype(float), width_offsets)
+        out["peak_width_avg"] = width_avg.reshape(n_files, n_ind)
+        out["peak_width_std_pros"] = np.where(width_avg != 0, width_std / width_avg * 100, np.nan).reshape(n_files, n_ind)
+        for key in get_beat_feature_keys(Data_BPM, n_files):
+            feature, feature_offsets = gather_Data_BPM_segments(Data_BPM, key, n_files, ind_col)
+            feature_avg, feature_std = segment_nanmean_nanstd(feature.astype(float), feature_offsets)
+            out[key + "_avg"] = feature_avg.reshape(n_files, n_ind)
+            out[key + "_std"] = feature_std.reshape(n_files, n_ind)
+
+    out.update(normalize_BPM_summary(out, normalizing_indexes, n_files))
+
+    # Peak distances: diff over all concatenated locations, then drop differences across segments
+    loc_lengths = np.diff(loc_offsets)
+    seg_of_row = np.repeat(np.arange(n_files * n_ind), loc_lengths)
+    fs_of_row = get_framerates(DataInfo, n_files)[seg_of_row // n_ind] if n_ind else np.array([])
+    within = seg_of_row[1:] == seg_of_row[:-1]
+    dist = np.diff(locs)[within] / fs_of_row[1:][within] * 1e3
+    dist_offsets = segment_lengths_to_offsets(np.maximum(loc_lengths - 1, 0))
+    dist_avg, dist_std = segment_nanmean_nanstd(dist, dist_offsets)
+    nan_arr = np.array([np.nan])
+    for kk in range(n_files):
+        out["peak_distances"][kk] = {}
+        for ii, col_index in enumerate(ind_col):
+            s = kk * n_ind + ii
+            a, b = dist_offsets[s], dist_offsets[s + 1]
+            out["peak_distances"][kk][col_index] = dist[a:b] if b > a else nan_arr.copy()
+    cols = np.asarray(ind_col, dtype=np.int64) - 1
+    out["peak_distances_avg"][:, cols] = dist_avg.reshape(n_files, n_ind)
+    out["peak_distances_std"][:, cols] = dist_std.reshape(n_files, n_ind)
+    return out
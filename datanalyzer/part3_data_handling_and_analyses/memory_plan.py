@@ -0,0 +1,336 @@
+"""
+Memory-budget execution planner for the load -> find_peaks_in_loop -> update_Data_BPM ->
+create_BPM_summary chain.
+
+plan_analysis_memory estimates, from the file shapes and dtypes in DataInfo.file_metadata
+(no samples are read) and the number of chosen electrodes, how much memory each way of
+running the chain needs, and picks the fastest one that fits in max_memory:
+
+- "parallel": find_peaks_in_files_parallel with as many of the requested workers as fit
+- "resident": all files loaded at once (float64, then raw ADC, then float32 storage)
+- "lazy": LazyData with an LRU cache of the remaining budget and up to PLAN_MAX_PREFETCH
+  files read ahead (PrefetchReader)
+- "streaming": find_peaks_streaming with the largest block that fits, when even one file
+  does not fit in memory
+
+The vectorized peak engine is replaced by scipy (identical results) when its blocks do not
+fit. run_analysis_with_memory_plan runs the chain as planned; format_memory_plan reports it.
+Estimates are upper bounds of the arrays the chain allocates, not of the whole process:
+reserve_bytes (get_memory_reserve: a fraction of the budget, at least
+MEMORY_PLAN_MIN_RESERVE_BYTES) is kept for the interpreter, libraries and the peak results.
+"""
+
+from dataclasses import replace
+from typing import Any, List, Optional, Tuple, Union
+import re
+import numpy as np
+
+from datanalyzer.models import Rule
+from datanalyzer.part1_raw_data_handling.filtering import FILTER_BLOCK_ROWS, get_filter_settings
+from datanalyzer.part1_raw_data_handling.folder_index import get_folder_metadata
+from datanalyzer.part1_raw_data_handling.load_mea import load_Data_of_DataInfo, set_DataInfo_from_folder_metadata
+from datanalyzer.part2_peak_handling.find_peaks import find_peaks_in_loop
+from datanalyzer.part2_peak_handling.peak_signals import get_polarities
+from datanalyzer.part2_peak_handling.parallel_peaks import find_peaks_in_files_parallel
+from datanalyzer.part2_peak_handling.stream_peaks import STREAM_MAX_TAIL_BLOCKS, find_peaks_streaming
+from datanalyzer.part2_peak_handling.vector_peaks import VECTOR_BLOCK_BYTES, get_peak_engine
+from .beat_features import BEAT_BLOCK_BYTES, compute_beat_features
+from .create_bpm_summary import create_BPM_summary
+from .update_bpm import update_Data_BPM
+
+MEMORY_PLAN_RESERVE_FRACTION = 0.1
+MEMORY_PLAN_MIN_RESERVE_BYTES = 32 * 2 ** 20
+WORKER_OVERHEAD_BYTES = 128 * 2 ** 20
+PLAN_MAX_PREFETCH = 2
+STREAM_MIN_BLOCK_FRAMES = 2 ** 10
+STREAM_MAX_BLOCK_FRAMES = 2 ** 20
+
+_MEMORY_UNITS = {"": 1, "K": 2 ** 10, "M": 2 ** 20, "G": 2 ** 30, "T": 2 ** 40}
+
+
+def parse_memory_size(size: Union[str, int, float]) -> int:
+    """Bytes of a size such as 4G, 512M, 1.5GB, 2GiB or 1000000 (binary units)."""
+    if isinstance(size, (int, float)):
+        return int(size)
+    match = re.fullmatch(r"\s*([0-9]*\.?[0-9]+)\s*([KMGT]?)(?:I?B)?\s*", size.upper())
+    if match is None:
+        raise ValueError(f"Invalid memory size {size!r}, expected e.g. 4G or 512M")
+    return int(float(match.group(1)) * _MEMORY_UNITS[match.group(2)])
+
+
+def format_bytes(n_bytes: float) -> str:
+    """n_bytes as B, KiB, MiB or GiB with one decimal."""
+    for unit, factor in (("GiB", 2 ** 30), ("MiB", 2 ** 20), ("KiB", 2 ** 10)):
+        if n_bytes >= factor:
+            return "%.1f %s" % (n_bytes / factor, unit)
+    return "%d B" % n_bytes
+
+
+def get_memory_reserve(max_memory: int) -> int:
+    """Bytes of max_memory kept outside the plan: MEMORY_PLAN_RESERVE_FRACTION of it, at least MEMORY_PLAN_MIN_RESERVE_BYTES."""
+    return max(MEMORY_PLAN_MIN_RESERVE_BYTES, int(MEMORY_PLAN_RESERVE_FRACTION * max_memory))
+
+
+def estimate_file_memory(
+    n_rows: int,
+    n_columns: int,
+    raw_itemsize: int,
+    storage: str = "float64",
+    peak_engine: str = "scipy",
+    n_polarities: int = 1,
+    filtered: bool = False,
+    beat_features: bool = False,
+) -> dict:
+    """
+    Bytes of one file of n_rows x n_columns chosen electrodes (ADC itemsize raw_itemsize):
+    stored (converted Data entry), load (peak while reading and converting, entry included),
+    work (peak finding and beat features on top of the entry) and peak (max of both phases).
+    """
+    n = n_rows * n_columns
+    itemsize = raw_itemsize if storage == "raw" else np.dtype(storage).itemsize
+    stored = n * itemsize
+    raw = n * raw_itemsize
+    if storage == "float64":
+        # The conversion may hold a float64 temporary next to its result
+        load = raw + 2 * stored
+    elif storage == "float32":
+        load = raw + stored + 2 * n_rows * 8
+    else:
+        load = raw + stored
+    if filtered:
+        load += 2 * min(n_rows, FILTER_BLOCK_ROWS) * n_columns * 8
+    if peak_engine == "vectorized":
+        group = min(n_columns, max(1, VECTOR_BLOCK_BYTES // max(1, n_rows * 8)))
+        # The float64 block, its candidate mask and the candidate arrays
+        work = 3 * group * n_rows * 8
+    else:
+        work = (n_polarities + 2) * n_rows * 8
+    if beat_features:
+        work = max(work, 2 * BEAT_BLOCK_BYTES)
+    return {"stored": stored, "load": load, "work": work, "peak": max(load, stored + work)}
+
+
+def get_stream_frame_bytes(n_columns: int, raw_itemsize: int, filtered: bool = False, n_polarities: int = 1) -> int:
+    """
+    Bytes per frame of a find_peaks_streaming block: ADC values (read and reordered), Volts
+    and a conversion temporary, the clipped block and the column pieces pushed to the peak
+    streams, plus the tails carried per electrode and polarity at their cap
+    (STREAM_MAX_TAIL_BLOCKS blocks, reached by columns that do not return to 0).
+    """
+    tails = n_columns * n_polarities * STREAM_MAX_TAIL_BLOCKS * 8
+    return n_columns * (2 * raw_itemsize + 32 + (8 if filtered else 0)) + tails
+
+
+def plan_analysis_memory(
+    DataInfo: Any,
+    max_memory: Union[str, int],
+    Rule_in: Optional[Rule] = None,
+    data_multiply: int = -1,
+    workers: int = 1,
+    storage: Optional[str] = None,
+    beat_features: bool = False,
+    reserve_bytes: Optional[int] = None,
+    max_prefetch: Optional[int] = None,
+) -> dict:
+    """
+    Plan how to run the analysis of the files of DataInfo (from create_DataInfo_of_folder;
+    file_metadata is read from the folder if missing) within max_memory bytes (or a size
+    string, see parse_memory_size).
+    workers: most worker processes to use; storage: keep this Data storage instead of
+    choosing one; beat_features: the chain also runs compute_beat_features (needs whole
+    files in this process, so no "parallel" or "streaming"); reserve_bytes: bytes of
+    max_memory kept outside the plan (default get_memory_reserve(max_memory)); max_prefetch:
+    most files read ahead in the "lazy" mode (default PLAN_MAX_PREFETCH).
+    Returns a dict: mode, storage, peak_engine, workers, cache_max_bytes, prefetch_depth,
+    prefetch_max_bytes, block_frames, estimated_bytes (planned peak of the chain's arrays),
+    the budget and file shapes it was planned for, and notes.
+    ValueError if the chain cannot run within the budget.
+    """
+    max_memory = parse_memory_size(max_memory)
+    if reserve_bytes is None:
+        reserve_bytes = get_memory_reserve(max_memory)
+    usable = max_memory - reserve_bytes
+    if usable <= 0:
+        raise ValueError(f"max_memory {format_bytes(max_memory)} is less than the reserve {format_bytes(reserve_bytes)}")
+    if Rule_in is None:
+        Rule_in = DataInfo.Rule
+    n_files = len(DataInfo.file_names)
+    if len(DataInfo.file_metadata) != n_files:
+        set_DataInfo_from_folder_metadata(DataInfo, get_folder_metadata(DataInfo))
+    n_columns = len(DataInfo.MEA_columns)
+    shapes = [(meta["n_rows"], np.dtype(meta["dtype"]).itemsize) for meta in DataInfo.file_metadata]
+    if not shapes:
+        shapes = [(0, 4)]
+    filter_settings = get_filter_settings(Rule_in)
+    filtered = filter_settings is not None
+    zero_phase = filtered and filter_settings["zero_phase"]
+    n_polarities = len(get_polarities(data_multiply))
+    engine = get_peak_engine(Rule_in)
+    engines = [engine] + (["scipy"] if engine != "scipy" else [])
+    if storage is None:
+        storages = ["float64"] + ([] if filtered else ["raw"]) + ["float32"]
+    elif storage == "raw" and filtered:
+        raise ValueError("Filtering needs float storage ('float64' or 'float32'), not 'raw'")
+    else:
+        storages = [storage]
+
+    plan = {
+        "max_memory": max_memory,
+        "reserve_bytes": reserve_bytes,
+        "n_files": n_files,
+        "n_electrodes": n_columns,
+        "max_rows": max(n_rows for n_rows, _ in shapes),
+        "raw_itemsize": max(itemsize for _, itemsize in shapes),
+        "storage": "float64",
+        "peak_engine": engine,
+        "workers": 1,
+        "cache_max_bytes": 0,
+        "prefetch_depth": 0,
+        "prefetch_max_bytes": 0,
+        "block_frames": None,
+        "notes": [],
+    }
+
+    def estimates(storage_i: str, engine_i: str) -> List[dict]:
+        return [
+            estimate_file_memory(n_rows, n_columns, itemsize, storage_i, engine_i, n_polarities, filtered, beat_features)
+            for n_rows, itemsize in shapes
+        ]
+
+    def chosen(mode: str, estimated_bytes: int, **fields) -> dict:
+        plan.update(fields, mode=mode, estimated_bytes=int(estimated_bytes))
+        if plan["peak_engine"] != engine:
+            plan["notes"].append("the %s engine's blocks do not fit; scipy gives identical peaks" % engine)
+        if plan["storage"] == "float32":
+            plan["notes"].append("float32 storage: peaks agree with float64 to ~6e-8 relative")
+        return plan
+
+    if workers > 1 and n_files > 1:
+        if beat_features:
+            plan["notes"].append("beat features need the loaded files: running in one process")
+        else:
+            for engine_i in engines:
+                per_worker = max(e["peak"] for e in estimates("float64", engine_i)) + WORKER_OVERHEAD_BYTES
+                n_workers = min(workers, n_files, int(usable // per_worker))
+                if n_workers >= 2:
+                    if n_workers < workers:
+                        plan["notes"].append("%d of %d workers fit" % (n_workers, workers))
+                    return chosen("parallel", n_workers * per_worker, peak_engine=engine_i, workers=n_workers)
+            plan["notes"].append("%d workers do not fit: running in one process" % workers)
+
+    for storage_i in storages:
+        for engine_i in engines:
+            est = estimates(storage_i, engine_i)
+            total = sum(e["stored"] for e in est) + max(e["peak"] - e["stored"] for e in est)
+            if total <= usable:
+                return chosen("resident", total, storage=storage_i, peak_engine=engine_i)
+
+    for storage_i in storages:
+        for engine_i in engines:
+            est = estimates(storage_i, engine_i)
+            stored, load, work = (max(e[key] for e in est) for key in ("stored", "load", "work"))
+            for depth in range(PLAN_MAX_PREFETCH if max_prefetch is None else max_prefetch, -1, -1):
+                # The cache keeps the current file while the next ones are loaded
+                if depth:
+                    in_flight = work + load + (depth - 1) * stored
+                else:
+                    in_flight = max(work, load)
+                if stored + in_flight <= usable:
+                    if max_prefetch is not None and depth < max_prefetch:
+                        plan["notes"].append("read-ahead of %d files does not fit: reading %d ahead" % (max_prefetch, depth))
+                    return chosen(
+                        "lazy", usable, storage=storage_i, peak_engine=engine_i,
+                        cache_max_bytes=int(usable - in_flight), prefetch_depth=depth,
+                        prefetch_max_bytes=int(max(1, depth) * stored),
+                    )
+
+    if beat_features:
+        raise ValueError(f"One file does not fit in {format_bytes(max_memory)}, and beat features need whole files")
+    if zero_phase:
+        raise ValueError(f"One file does not fit in {format_bytes(max_memory)}, and zero-phase filtering needs whole files")
+    frame_bytes = max(get_stream_frame_bytes(n_columns, itemsize, filtered, n_polarities) for _, itemsize in shapes)
+    frames = STREAM_MAX_BLOCK_FRAMES
+    while frames > STREAM_MIN_BLOCK_FRAMES and frames * frame_bytes > usable:
+        frames //= 2
+    if frames * frame_bytes > usable:
+        raise ValueError(f"Not even {frames} frames of {n_columns} electrodes fit in {format_bytes(max_memory)}")
+    plan["notes"].append("one file does not fit: peaks are found block by block")
+    return chosen("streaming", frames * frame_bytes, block_frames=frames)
+
+
+def format_memory_plan(plan: dict) -> str:
+    """Report of a plan_analysis_memory plan, one item per line."""
+    lines = [
+        "Memory plan: %s (max %s, %s reserved), estimated peak %s" % (
+            plan["mode"], format_bytes(plan["max_memory"]), format_bytes(plan["reserve_bytes"]),
+            format_bytes(plan["estimated_bytes"])),
+        "  %d files, up to %d rows x %d electrodes, %d-byte ADC values" % (
+            plan["n_files"], plan["max_rows"], plan["n_electrodes"], plan["raw_itemsize"]),
+    ]
+    if plan["mode"] == "parallel":
+        lines.append("  %d worker processes, each loading one float64 file, %s engine" % (plan["workers"], plan["peak_engine"]))
+    elif plan["mode"] == "resident":
+        lines.append("  all files kept in memory as %s, %s engine" % (plan["storage"], plan["peak_engine"]))
+    elif plan["mode"] == "lazy":
+        lines.append("  %s storage, LRU cache %s, read-ahead %d files (%s), %s engine" % (
+            plan["storage"], format_bytes(plan["cache_max_bytes"]), plan["prefetch_depth"],
+            format_bytes(plan["prefetch_max_bytes"]), plan["peak_engine"]))
+    else:
+        lines.append("  blocks of %d frames read from the .h5 files" % plan["block_frames"])
+    lines.extend("  note: %s" % note for note in plan["notes"])
+    return "\n".join(lines)
+
+
+def run_analysis_with_memory_plan(
+    DataInfo: Any,
+    plan: dict,
+    Rule_in: Optional[Rule] = None,
+    data_multiply: int = -1,
+    using_high_peaks: int = -1,
+    beat_features: bool = False,
+    peak_cache: Optional[Any] = None,
+    cache_dir: Optional[str] = None,
+) -> Tuple[List[dict], List[dict], dict]:
+    """
+    Run load -> find_peaks_in_loop -> update_Data_BPM (-> compute_beat_features) ->
+    create_BPM_summary for the files of DataInfo as planned by plan_analysis_memory.
+    peak_cache and cache_dir (ChannelDataCache folder) are used when files are loaded in this
+    process ("resident" and "lazy"). Rule_in (default DataInfo.Rule) is not changed; the plan's
+    peak engine is used. Returns (Data, Data_BPM, Data_BPM_summary); Data is [] when the
+    files are not loaded in this process ("parallel" and "streaming").
+    """
+    if Rule_in is None:
+        Rule_in = DataInfo.Rule
+    Rule_in = replace(Rule_in, peak_engine=plan["peak_engine"])
+    Data = []
+    if plan["mode"] == "parallel":
+        Data_BPM = find_peaks_in_files_parallel(
+            DataInfo, Rule_in=Rule_in, data_multiply=data_multiply, workers=plan["workers"]
+        )
+    elif plan["mode"] == "streaming":
+        Data_BPM = find_peaks_streaming(
+            DataInfo, Rule_in=Rule_in, data_multiply=data_multiply, block_frames=plan["block_frames"]
+        )
+    else:
+        DataInfo.Rule = Rule_in
+        Data = load_Data_of_DataInfo(
+            DataInfo,
+            lazy=plan["mode"] == "lazy",
+            cache_max_bytes=plan["cache_max_bytes"],
+            storage=plan["storage"],
+            cache_dir=cache_dir,
+            Rule_in=Rule_in,
+        )
+        Data_BPM = find_peaks_in_loop(
+            Data,
+            DataInfo,
+            Rule_in=Rule_in,
+            data_multiply=data_multiply,
+            peak_cache=peak_cache,
+            prefetch_depth=plan["prefetch_depth"],
+            prefetch_max_bytes=plan["prefetch_max_bytes"],
+        )
+    Data_BPM = update_Data_BPM(DataInfo, Data_BPM, using_high_peaks=using_high_peaks)
+    if beat_features and len(Data):
+        Data_BPM = compute_beat_features(Data, DataInfo, Data_BPM)
+    return Data, Data_BPM, create_BPM_summary(DataInfo, Data_BPM)
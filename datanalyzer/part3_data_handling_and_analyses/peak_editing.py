@@ -0,0 +1,242 @@
+"""
+Manual peak corrections: add, remove and move peaks of Data_BPM after update_Data_BPM.
+
+An edit marks only its (file, electrode, polarity) dirty. update(), run after every edit
+unless auto_update=False, recomputes for the dirty polarities only the peak distances,
+peak_avg_distance_in_ms, BPM_avg and Amount_of_peaks (update_Data_BPM_of_column), chooses
+again between low and high peaks for their (file, electrode), and refills those electrodes
+in the summary rows of the edited files (set_BPM_summary_of_column). The normalized summary
+columns are recomputed in full only when an edited file is one of the normalizing files, so
+an edit costs the same in a session of 10 or 1000 files.
+"""
+
+from typing import Any, List, Optional, Set, Tuple
+import warnings
+import numpy as np
+from scipy.signal import peak_widths
+
+from datanalyzer.part2_peak_handling.peak_signals import get_signal_to_check
+from .beat_features import BEAT_FEATURE_KEYS, compute_beat_features
+from .create_bpm_summary import (
+    get_BPM_summary_baseline,
+    normalize_BPM_summary,
+    set_BPM_summary_of_column,
+    set_BPM_summary_rates_of_column,
+)
+from .update_bpm import choose_low_or_high_peaks_of_column, get_file_framerate, update_Data_BPM_of_column
+
+PEAK_POLARITIES = {-1: "low", 1: "high"}
+
+
+class PeakEditor:
+    """
+    Edit the peaks of Data_BPM (after update_Data_BPM) in place, keeping Data_BPM_summary
+    (from create_BPM_summary, optional) up to date.
+    Data: the loaded Data (list or LazyData), optional; with it, added and moved peaks get
+    their value and width from the signal as find_peaks_in_loop computes them, and beat
+    features (compute_beat_features, with beat_feature_options) of edited electrodes are
+    recomputed. Without it, values must be given and widths and beat features become NaN.
+    using_high_peaks and chosen_datacol_indexes as in update_Data_BPM and create_BPM_summary.
+    Peaks are addressed by 1-based file_index, 1-based column, polarity -1 (low peaks) or
+    1 (high peaks) and 1-based sample location, as stored in Data_BPM.
+    """
+
+    def __init__(
+        self,
+        DataInfo: Any,
+        Data_BPM: List[dict],
+        Data_BPM_summary: Optional[dict] = None,
+        Data: Optional[Any] = None,
+        using_high_peaks: int = -1,
+        chosen_datacol_indexes: Optional[List[int]] = None,
+        beat_feature_options: Optional[dict] = None,
+        auto_update: bool = True,
+    ):
+        self.DataInfo = DataInfo
+        self.Data_BPM = Data_BPM
+        self.Data_BPM_summary = Data_BPM_summary
+        self.Data = Data
+        self.using_high_peaks = using_high_peaks
+        self.n_cols = len(DataInfo.datacol_numbers)
+        if chosen_datacol_indexes is None:
+            chosen_datacol_indexes = list(range(1, self.n_cols + 1))
+        self.ind_col = list(chosen_datacol_indexes)
+        self.beat_feature_options = beat_feature_options or {}
+        self.auto_update = auto_update
+        self.dirty: Set[Tuple[int, int, int]] = set()
+
+    def _check(self, file_index: int, col: int, polarity: int) -> str:
+        if not 1 <= file_index <= len(self.Data_BPM):
+            raise IndexError(f"file_index {file_index} out of range 1..{len(self.Data_BPM)}")
+        if not 1 <= col <= self.n_cols:
+            raise IndexError(f"Column {col} out of range 1..{self.n_cols}")
+        if polarity not in PEAK_POLARITIES:
+            raise ValueError(f"polarity must be -1 (low peaks) or 1 (high peaks), got {polarity}")
+        return PEAK_POLARITIES[polarity]
+
+    def get_peaks(self, file_index: int, col: int, polarity: int = -1) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """(1-based locations, values, widths) of one electrode's low or high peaks."""
+        suffix = self._check(file_index, col, polarity)
+        d = self.Data_BPM[file_index - 1]
+        locs = np.asarray(d[f"peak_locations_{suffix}"].get(col, np.empty(0, dtype=np.intp)))
+        if locs.size == 0:
+            locs = np.empty(0, dtype=np.intp)
+        values = np.asarray(d[f"peak_values_{suffix}"].get(col, np.empty(0)), dtype=float)
+        widths = np.asarray(d[f"peak_widths_{suffix}"].get(col, np.empty(0)), dtype=float)
+        return locs, values, widths
+
+    def _set_peaks(self, file_index: int, col: int, polarity: int, locs, values, widths) -> None:
+        suffix = PEAK_POLARITIES[polarity]
+        d = self.Data_BPM[file_index - 1]
+        d[f"peak_locations_{suffix}"][col] = locs
+        d[f"peak_values_{suffix}"][col] = values
+        d[f"peak_widths_{suffix}"][col] = widths
+        self.dirty.add((file_index, col, polarity))
+        if self.auto_update:
+            self.update()
+
+    def get_peak_from_signal(self, file_index: int, col: int, location: int, polarity: int = -1) -> Tuple[float, float]:
+        """(value in Volts, width in samples) of a peak at location of Data, as find_peaks_in_loop stores them."""
+        if self.Data is None:
+            raise ValueError("Without Data, give the peak value")
+        signal, scale = get_signal_to_check(self.Data[file_index - 1], col, polarity)
+        if not 1 <= location <= signal.size:
+            raise IndexError(f"Location {location} out of range 1..{signal.size}")
+        with warnings.catch_warnings():
+            # Not a local maximum: peak_widths warns and gives width 0
+            warnings.simplefilter("ignore", RuntimeWarning)
+            width = peak_widths(signal, [location - 1], rel_height=0.5)[0][0]
+        return polarity * signal[location - 1] * scale, float(width)
+
+    def add_peak(
+        self,
+        file_index: int,
+        col: int,
+        location: int,
+        polarity: int = -1,
+        value: Optional[float] = None,
+        width: Optional[float] = None,
+    ) -> int:
+        """
+        Add a peak at 1-based location. value (Volts, negative for low peaks) and width
+        (samples) default to the signal's (see get_peak_from_signal; width NaN without Data).
+        Returns the peak's 0-based index; ValueError if the electrode already has a peak there.
+        """
+        locs, values, widths = self.get_peaks(file_index, col, polarity)
+        pos = int(np.searchsorted(locs, location))
+        if pos < locs.size and locs[pos] == location:
+            raise ValueError(f"File {file_index} column {col} already has a peak at {location}")
+        if value is None:
+            value, signal_width = self.get_peak_from_signal(file_index, col, location, polarity)
+            width = signal_width if width is None else width
+        if width is None:
+            width = self.get_peak_from_signal(file_index, col, location, polarity)[1] if self.Data is not None else np.nan
+        self._set_peaks(
+            file_index, col, polarity,
+            np.insert(locs, pos, location), np.insert(values, pos, value), np.insert(widths, pos, width),
+        )
+        return pos
+
+    def remove_peak(self, file_index: int, col: int, location: int, polarity: int = -1) -> Tuple[float, float]:
+        """Remove the peak at 1-based location; returns its (value, width). ValueError if there is none."""
+        locs, values, widths = self.get_peaks(file_index, col, polarity)
+        pos = int(np.searchsorted(locs, location))
+        if pos == locs.size or locs[pos] != location:
+            raise ValueError(f"File {file_index} column {col} has no peak at {location}")
+        removed = (float(values[pos]), float(widths[pos]))
+        self._set_peaks(
+            file_index, col, polarity, np.delete(locs, pos), np.delete(values, pos), np.delete(widths, pos)
+        )
+        return removed
+
+    def move_peak(
+        self,
+        file_index: int,
+        col: int,
+        location: int,
+        new_location: int,
+        polarity: int = -1,
+        value: Optional[float] = None,
+        width: Optional[float] = None,
+    ) -> int:
+        """
+        Move the peak at location to new_location (one update). value and width default to
+        the signal's at new_location, or without Data to the moved peak's.
+        Returns the peak's new 0-based index.
+        """
+        auto_update = self.auto_update
+        self.auto_update = False
+        try:
+            old_value, old_width = self.remove_peak(file_index, col, location, polarity)
+            if self.Data is None:
+                value = old_value if value is None else value
+                width = old_width if width is None else width
+            try:
+                pos = self.add_peak(file_index, col, new_location, polarity, value, width)
+            except Exception:
+                self.add_peak(file_index, col, location, polarity, old_value, old_width)
+                raise
+        finally:
+            self.auto_update = auto_update
+        if auto_update:
+            self.update()
+        return pos
+
+    def update(self) -> List[Tuple[int, int, int]]:
+        """
+        Recompute what the edits since the last update touched; returns the dirty
+        (file_index, column, polarity) that were updated.
+        """
+        dirty = sorted(self.dirty)
+        self.dirty.clear()
+        columns = sorted({(file_index, col) for file_index, col, _ in dirty})
+        for file_index, col, polarity in dirty:
+            kk = file_index - 1
+            fs = get_file_framerate(self.DataInfo, kk)
+            update_Data_BPM_of_column(self.Data_BPM, kk, col, PEAK_POLARITIES[polarity], fs, self.n_cols)
+        for file_index, col in columns:
+            choose_low_or_high_peaks_of_column(self.Data_BPM, file_index - 1, col, self.using_high_peaks)
+            self._update_beat_features(file_index, col)
+        if self.Data_BPM_summary is not None and columns:
+            self._update_summary(columns)
+        return dirty
+
+    def _update_beat_features(self, file_index: int, col: int) -> None:
+        d = self.Data_BPM[file_index - 1]
+        if not any(col in d.get(key, {}) for key in BEAT_FEATURE_KEYS):
+            return
+        if self.Data is not None:
+            compute_beat_features(
+                self.Data, self.DataInfo, self.Data_BPM, filenumbers=[file_index], datacolumns=[col],
+                **self.beat_feature_options,
+            )
+            return
+        n_peaks = np.size(d["peak_locations"].get(col, []))
+        for key in BEAT_FEATURE_KEYS:
+            if key in d:
+                d[key][col] = np.full(n_peaks, np.nan)
+
+    def _update_summary(self, columns: List[Tuple[int, int]]) -> None:
+        out = self.Data_BPM_summary
+        n_files = self.DataInfo.files_amount
+        for file_index, col in columns:
+            kk = file_index - 1
+            d = self.Data_BPM[kk]
+            out["peak_values"][kk] = d.get("peak_values", {})
+            out["peak_locations"][kk] = d.get("peak_locations", {})
+            out["peak_widths"][kk] = d.get("peak_widths", {})
+            out["peak_distances"].setdefault(kk, {})
+            set_BPM_summary_rates_of_column(out, d, kk, col)
+            if col in self.ind_col:
+                fs = get_file_framerate(self.DataInfo, kk)
+                set_BPM_summary_of_column(out, d, kk, self.ind_col.index(col), col, fs)
+        files = sorted({file_index - 1 for file_index, _ in columns})
+        norm_idx = np.asarray(out["normalizing_indexes"])
+        norm_idx = norm_idx[norm_idx < n_files]
+        if norm_idx.size == 0 or any(kk in norm_idx for kk in files):
+            out.update(normalize_BPM_summary(out, out["normalizing_indexes"], n_files))
+            return
+        amplitude_baseline, bpm_baseline = get_BPM_summary_baseline(out, out["normalizing_indexes"], n_files)
+        for kk in files:
+            out["Amplitude_norm"][kk] = out["Amplitude_avg"][kk] / amplitude_baseline
+            out["BPM_norm"][kk] = out["BPM_avg"][kk] / bpm_baseline
@@ -0,0 +1,321 @@
+"""
+Columnar peak store for Data_BPM: all peaks of all files, columns and polarities in flat
+arrays with CSR-style offsets, instead of dicts of many small numpy arrays.
+
+Segment s = ((file_index - 1) * n_cols + (column - 1)) * 2 + polarity (0 = low, 1 = high)
+holds rows offsets[s]:offsets[s + 1] of locations / values / widths. The active low/high
+choice per (file, column) is the boolean mask use_high, not a copy of the peaks.
+as_Data_BPM() gives a read-only view that supports Data_BPM[kk]["peak_locations"][col] etc.
+"""
+
+from collections.abc import Mapping, Sequence
+from typing import Any, Iterator, List, Optional, Tuple
+import numpy as np
+
+from .update_bpm import should_high_peak_data_be_used
+
+POLARITIES = ("low", "high")
+
+
+def segment_lengths_to_offsets(lengths: np.ndarray) -> np.ndarray:
+    """CSR offsets (len(lengths) + 1) from segment lengths."""
+    offsets = np.zeros(len(lengths) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=offsets[1:])
+    return offsets
+
+
+def get_framerates(DataInfo: Any, n_files: int) -> Optional[np.ndarray]:
+    """Framerate per file from DataInfo.framerate (one value is used for all files), or None."""
+    framerate = getattr(DataInfo, "framerate", None)
+    if framerate is None or np.size(framerate) == 0:
+        return None
+    framerate = np.asarray(framerate, dtype=float)
+    if framerate.ndim == 2 and framerate.shape[0] >= n_files:
+        return framerate[:n_files, 0].copy()
+    if framerate.size >= n_files and framerate.ndim <= 1:
+        return framerate[:n_files].copy()
+    return np.full(n_files, framerate.flat[0])
+
+
+def segment_nanmean_nanstd(
+    values: np.ndarray,
+    offsets: np.ndarray,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    np.nanmean and np.nanstd of every segment values[offsets[s]:offsets[s + 1]].
+    Segments of equal length are stacked and reduced row-wise, which uses the same
+    summation order as calling the numpy functions on each segment, so results are
+    bit-identical. Empty or all-NaN segments give NaN.
+    """
+    n_seg = len(offsets) - 1
+    lengths = np.diff(offsets)
+    mean = np.full(n_seg, np.nan)
+    std = np.full(n_seg, np.nan)
+    for length in np.unique(lengths):
+        if length == 0:
+            continue
+        seg = np.nonzero(lengths == length)[0]
+        rows = values[offsets[seg][:, None] + np.arange(length)]
+        mask = np.isnan(rows)
+        rows[mask] = 0
+        cnt = np.sum(~mask, axis=1)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            avg = np.sum(rows, axis=1) / cnt
+            dev = rows - avg[:, None]
+            dev[mask] = 0
+            var = np.sum(dev * dev, axis=1) / cnt
+        mean[seg] = avg
+        std[seg] = np.sqrt(var)
+    return mean, std
+
+
+class PeakStore:
+    """
+    Columnar Data_BPM. locations are 1-based frame indexes (as in Data_BPM), values and
+    widths float64; framerate (n_files,) is used for peak distances and BPM.
+    Fill with from_Data_BPM, then update_bpm (the update_Data_BPM equivalent).
+    """
+
+    def __init__(
+        self,
+        n_files: int,
+        n_cols: int,
+        offsets: np.ndarray,
+        locations: np.ndarray,
+        values: np.ndarray,
+        widths: np.ndarray,
+        framerate: Optional[np.ndarray] = None,
+    ):
+        self.n_files = n_files
+        self.n_cols = n_cols
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        self.locations = np.asarray(locations, dtype=np.int64)
+        self.values = np.asarray(values, dtype=np.float64)
+        self.widths = np.asarray(widths, dtype=np.float64)
+        self.framerate = None if framerate is None else np.asarray(framerate, dtype=float).reshape(-1)
+        self.use_high = np.zeros((n_files, n_cols), dtype=bool)
+        self.distances = None
+        self.distance_offsets = None
+        self.avg_distance = None
+        self.bpm = None
+
+    @classmethod
+    def from_Data_BPM(cls, Data_BPM: List[dict], DataInfo: Any = None) -> "PeakStore":
+        """Build from list-of-dicts Data_BPM (output of find_peaks_in_loop)."""
+        n_files = len(Data_BPM)
+        try:
+            n_cols = len(DataInfo.datacol_numbers)
+        except (AttributeError, TypeError):
+            n_cols = len(Data_BPM[0]["Amount_of_peaks_low"]) if n_files else 0
+        parts = {"locations": [], "values": [], "widths": []}
+        lengths = np.zeros(n_files * n_cols * 2, dtype=np.int64)
+        empty = np.array([])
+        for kk in range(n_files):
+            d = Data_BPM[kk]
+            for pp in range(1, n_cols + 1):
+                for pol, suffix in enumerate(POLARITIES):
+                    locs = np.atleast_1d(d.get(f"peak_locations_{suffix}", {}).get(pp, empty))
+                    lengths[((kk * n_cols) + pp - 1) * 2 + pol] = locs.size
+                    parts["locations"].append(locs)
+                    parts["values"].append(np.atleast_1d(d.get(f"peak_values_{suffix}", {}).get(pp, empty)))
+                    parts["widths"].append(np.atleast_1d(d.get(f"peak_widths_{suffix}", {}).get(pp, empty)))
+        framerate = get_framerates(DataInfo, n_files)
+
+        def _cat(arrays, dtype):
+            return np.concatenate(arrays).astype(dtype, copy=False) if arrays else np.array([], dtype=dtype)
+
+        return cls(
+            n_files,
+            n_cols,
+            segment_lengths_to_offsets(lengths),
+            _cat(parts["locations"], np.int64),
+            _cat(parts["values"], np.float64),
+            _cat(parts["widths"], np.float64),
+            framerate=framerate,
+        )
+
+    def segment(self, file_index: int, col: int, polarity: int) -> int:
+        """Segment number of 1-based file_index, 1-based col and polarity (0 low, 1 high)."""
+        return ((file_index - 1) * self.n_cols + col - 1) * 2 + polarity
+
+    def active_polarity(self, file_index: int, col: int) -> int:
+        """1 if high peaks are active for (file_index, col), else 0."""
+        return int(self.use_high[file_index - 1, col - 1])
+
+    def get(self, file_index: int, col: int, polarity: int, field: str = "locations") -> np.ndarray:
+        """View of one segment of field ("locations", "values", "widths" or "distances")."""
+        s = self.segment(file_index, col, polarity)
+        if field == "distances":
+            if self.distances is None:
+                raise ValueError("Peak distances not computed yet; call update_bpm first.")
+            return self.distances[self.distance_offsets[s]:self.distance_offsets[s + 1]]
+        return getattr(self, field)[self.offsets[s]:self.offsets[s + 1]]
+
+    @property
+    def amount_of_peaks(self) -> np.ndarray:
+        """Peak counts, shape (n_files, n_cols, 2) [low, high]."""
+        return np.diff(self.offsets).reshape(self.n_files, self.n_cols, 2)
+
+    def set_polarity(self, file_index: int, col: int, low_or_high_peaks: str) -> None:
+        """Select low or high peaks for (file_index, col); nothing is copied."""
+        self.use_high[file_index - 1, col - 1] = low_or_high_peaks == "high"
+
+    def update_bpm(self, DataInfo: Any = None, using_high_peaks: int = -1) -> "PeakStore":
+        """
+        Peak distances (ms), their mean/std and BPM_avg for every segment, then the active
+        polarity per (file, column); same values as update_Data_BPM.
+        using_high_peaks: -1 = auto (should_high_peak_data_be_used), 0 = always low, 1 = always high.
+        """
+        framerate = get_framerates(DataInfo, self.n_files)
+        if framerate is not None:
+            self.framerate = framerate
+        if self.framerate is None:
+            raise ValueError("framerate is needed for peak distances (pass DataInfo).")
+        n_seg = self.n_files * self.n_cols * 2
+        lengths = np.diff(self.offsets)
+        seg_of_row = np.repeat(np.arange(n_seg), lengths)
+        fs_of_row = self.framerate[seg_of_row // (2 * self.n_cols)]
+        peak_times = (self.locations - 1) / fs_of_row
+        dist_ms = np.diff(peak_times) * 1e3
+        within = seg_of_row[1:] == seg_of_row[:-1]
+        self.distances = dist_ms[within]
+        self.distance_offsets = segment_lengths_to_offsets(np.maximum(lengths - 1, 0))
+
+        mean, std = segment_nanmean_nanstd(self.distances, self.distance_offsets)
+        self.avg_distance = np.stack([mean, std], axis=-1).reshape(self.n_files, self.n_cols, 2, 2)
+        self.bpm = (60.0 / (mean / 1000.0)).reshape(self.n_files, self.n_cols, 2)
+
+        if using_high_peaks >= 0:
+            self.use_high[:] = bool(using_high_peaks)
+        else:
+            view = self.as_Data_BPM()
+            for kk in range(self.n_files):
+                file_view = view[kk]
+                for pp in range(1, self.n_cols + 1):
+                    self.use_high[kk, pp - 1] = bool(should_high_peak_data_be_used(file_view, pp))
+        return self
+
+    def as_Data_BPM(self) -> "PeakStoreView":
+        """Read-only list-like view with the Data_BPM keys (no peak data is copied)."""
+        return PeakStoreView(self)
+
+    def to_Data_BPM(self) -> List[dict]:
+        """Materialize a list-of-dicts Data_BPM (copies), e.g. for code that edits it in place."""
+        out = []
+        for file_view in self.as_Data_BPM():
+            d = {}
+            for key, value in file_view.items():
+                if isinstance(value, ColumnView):
+                    d[key] = {col: arr.copy() for col, arr in value.items()}
+                elif isinstance(value, np.ndarray):
+                    d[key] = value.copy()
+                else:
+                    d[key] = value
+            out.append(d)
+        return out
+
+
+class ColumnView(Mapping):
+    """{col: array} of one file / field / polarity (polarity None = active one) backed by PeakStore."""
+
+    def __init__(self, store: PeakStore, kk: int, field: str, polarity: Optional[int]):
+        self._store = store
+        self._kk = kk
+        self._field = field
+        self._polarity = polarity
+
+    def __getitem__(self, col: int) -> np.ndarray:
+        if not isinstance(col, (int, np.integer)) or col < 1 or col > self._store.n_cols:
+            raise KeyError(col)
+        pol = self._polarity
+        if pol is None:
+            pol = self._store.active_polarity(self._kk + 1, col)
+        return self._store.get(self._kk + 1, col, pol, self._field)
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(range(1, self._store.n_cols + 1))
+
+    def __len__(self) -> int:
+        return self._store.n_cols
+
+
+class PeakStoreFileView(Mapping):
+    """Data_BPM[kk]-like read-only mapping of one file of a PeakStore."""
+
+    _column_fields = {
+        "peak_values": "values",
+        "peak_locations": "locations",
+        "peak_widths": "widths",
+        "peak_distances_in_ms": "distances",
+    }
+
+    def __init__(self, store: PeakStore, kk: int):
+        self._store = store
+        self._kk = kk
+
+    def _keys(self) -> List[str]:
+        keys = ["file_index"]
+        bpm_done = self._store.bpm is not None
+        for suffix in POLARITIES:
+            keys += [f"peak_values_{suffix}", f"peak_locations_{suffix}", f"peak_widths_{suffix}",
+                     f"Amount_of_peaks_{suffix}"]
+            if bpm_done:
+                keys += [f"peak_distances_in_ms_{suffix}", f"peak_avg_distance_in_ms_{suffix}", f"BPM_avg_{suffix}"]
+        if bpm_done:
+            keys += ["peak_locations", "peak_values", "Amount_of_peaks", "BPM_avg",
+                     "peak_avg_distance_in_ms", "peak_distances_in_ms", "peak_widths"]
+        return keys
+
+    def __getitem__(self, key: str) -> Any:
+        if key not in self._keys():
+            raise KeyError(key)
+        store = self._store
+        kk = self._kk
+        if key == "file_index":
+            return kk + 1
+        base, _, suffix = key.rpartition("_")
+        if suffix in POLARITIES:
+            pol = POLARITIES.index(suffix)
+            if base in self._column_fields:
+                return ColumnView(store, kk, self._column_fields[base], pol)
+            if base == "Amount_of_peaks":
+                return store.amount_of_peaks[kk, :, pol].astype(float)
+            if base == "peak_avg_distance_in_ms":
+                return store.avg_distance[kk, :, pol, :]
+            if base == "BPM_avg":
+                return store.bpm[kk, :, pol]
+        if key in self._column_fields:
+            return ColumnView(store, kk, self._column_fields[key], None)
+        high = store.use_high[kk]
+        if key == "Amount_of_peaks":
+            return np.where(high, store.amount_of_peaks[kk, :, 1], store.amount_of_peaks[kk, :, 0]).astype(float)
+        if key == "BPM_avg":
+            return np.where(high, store.bpm[kk, :, 1], store.bpm[kk, :, 0])
+        if key == "peak_avg_distance_in_ms":
+            return np.where(high[:, None], store.avg_distance[kk, :, 1, :], store.avg_distance[kk, :, 0, :])
+        raise KeyError(key)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._keys())
+
+    def __len__(self) -> int:
+        return len(self._keys())
+
+
+class PeakStoreView(Sequence):
+    """List-like Data_BPM view of a PeakStore: view[kk] is a PeakStoreFileView."""
+
+    def __init__(self, store: PeakStore):
+        self.store = store
+
+    def __len__(self) -> int:
+        return self.store.n_files
+
+    def __getitem__(self, kk):
+        if isinstance(kk, slice):
+            return [self[ii] for ii in range(*kk.indices(len(self)))]
+        if kk < 0:
+            kk += len(self)
+        if kk < 0 or kk >= len(self):
+            raise IndexError(kk)
+        return PeakStoreFileView(self.store, kk)
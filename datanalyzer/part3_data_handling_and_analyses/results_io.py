@@ -0,0 +1,385 @@
+"""
+Columnar export/import of Data_BPM and Data_BPM_summary (HDF5 or Parquet).
+
+Every peak is one row of a flat table: file_index, datacolumn, electrode, polarity
+(-1 = low, 1 = high peaks, as data_multiply), location (1-based frame), value, width and
+distance_ms (to the previous peak of the same file, column and polarity; NaN for the first).
+Rows are ordered by file, column and polarity, so one file or a run of columns is a
+contiguous slice (PeakStore segment offsets). The per-file summary matrices (BPM_avg,
+Amplitude_avg, BPM_norm, ...) are stored as well.
+
+HDF5 (h5py): /peaks/<column> and /peaks/offsets, /summary/<matrix> (files x columns),
+/info/... (file names, framerate, electrodes); gzip compressed and chunked, partial reads
+slice the datasets. Parquet (optional pyarrow): a folder with peaks.parquet (one row group
+per file), summary.parquet (one row per file and column) and info.json.
+"""
+
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple, Union
+import json
+import h5py
+import numpy as np
+import pandas as pd
+
+from .peak_store import PeakStore, get_framerates
+
+RESULTS_FORMAT_VERSION = 1
+PEAK_TABLE_COLUMNS = ("file_index", "datacolumn", "electrode", "polarity", "location", "value", "width", "distance_ms")
+
+
+def _as_peak_store(Data_BPM: Union[List[dict], PeakStore], DataInfo: Any) -> PeakStore:
+    if isinstance(Data_BPM, PeakStore):
+        return Data_BPM
+    return PeakStore.from_Data_BPM(Data_BPM, DataInfo)
+
+
+def _electrode_numbers(DataInfo: Any, n_cols: int) -> np.ndarray:
+    electrodes = getattr(DataInfo, "MEA_electrode_numbers", None)
+    if electrodes is None or len(electrodes) != n_cols:
+        return np.arange(1, n_cols + 1)
+    return np.asarray(electrodes, dtype=np.int64)
+
+
+def get_peak_table(
+    Data_BPM: Union[List[dict], PeakStore],
+    DataInfo: Any,
+) -> Dict[str, np.ndarray]:
+    """Flat peak table {column: array} (PEAK_TABLE_COLUMNS) of Data_BPM or a PeakStore."""
+    store = _as_peak_store(Data_BPM, DataInfo)
+    n_cols = store.n_cols
+    n_seg = store.n_files * n_cols * 2
+    seg_of_row = np.repeat(np.arange(n_seg), np.diff(store.offsets))
+    kk = seg_of_row // (2 * n_cols)
+    col = (seg_of_row // 2) % n_cols
+    framerate = get_framerates(DataInfo, store.n_files)
+    if framerate is None:
+        framerate = store.framerate
+    distance_ms = np.full(len(seg_of_row), np.nan)
+    if framerate is not None and len(seg_of_row) > 1:
+        # Same arithmetic as update_Data_BPM, so distances are bit-identical
+        peak_times = (store.locations - 1) / framerate[kk]
+        within = seg_of_row[1:] == seg_of_row[:-1]
+        distance_ms[1:][within] = (np.diff(peak_times) * 1e3)[within]
+    return {
+        "file_index": (kk + 1).astype(np.int32),
+        "datacolumn": (col + 1).astype(np.int32),
+        "electrode": _electrode_numbers(DataInfo, n_cols)[col].astype(np.int32),
+        "polarity": np.where(seg_of_row % 2 == 1, 1, -1).astype(np.int8),
+        "location": store.locations,
+        "value": store.values,
+        "width": store.widths,
+        "distance_ms": distance_ms,
+    }
+
+
+def get_summary_matrices(Data_BPM_summary: dict, n_files: int) -> Dict[str, np.ndarray]:
+    """The (files x columns) matrices of a Data_BPM_summary (BPM_avg, Amplitude_avg, BPM_norm, ...)."""
+    return {
+        key: np.asarray(value)
+        for key, value in Data_BPM_summary.items()
+        if isinstance(value, np.ndarray) and value.ndim == 2 and value.shape[0] == n_files
+    }
+
+
+def get_results_info(DataInfo: Any, n_files: int, n_cols: int, Data_BPM_summary: Optional[dict]) -> dict:
+    """Per-file and per-column metadata stored with the tables."""
+    framerate = get_framerates(DataInfo, n_files)
+    time_sec = getattr(DataInfo, "measurement_time", {}).get("time_sec")
+    normalizing = (Data_BPM_summary or {}).get("normalizing_indexes", [])
+    return {
+        "format_version": RESULTS_FORMAT_VERSION,
+        "experiment_name": getattr(DataInfo, "experiment_name", ""),
+        "measurement_name": getattr(DataInfo, "measurement_name", ""),
+        "file_names": list(getattr(DataInfo, "file_names", []))[:n_files],
+        "framerate": [] if framerate is None else [float(f) for f in framerate],
+        "time_sec": [] if time_sec is None else [float(t) for t in np.asarray(time_sec)[:n_files]],
+        "electrodes": [int(e) for e in _electrode_numbers(DataInfo, n_cols)],
+        "normalizing_indexes": [int(i) for i in normalizing],
+    }
+
+
+def export_results(
+    path: str,
+    DataInfo: Any,
+    Data_BPM: Union[List[dict], PeakStore, None] = None,
+    Data_BPM_summary: Optional[dict] = None,
+    chosen_datacol_indexes: Optional[List[int]] = None,
+) -> None:
+    """
+    Write peaks of Data_BPM (list of dicts or PeakStore) and the Data_BPM_summary matrices to
+    path: .h5/.hdf5 gives one HDF5 file, anything else a Parquet folder (needs pyarrow).
+    chosen_datacol_indexes: the columns create_BPM_summary was given (default all); they
+    label the columns of Amplitude_avg, peak_width_avg etc.
+    """
+    if str(path).lower().endswith((".h5", ".hdf5")):
+        export_results_hdf5(path, DataInfo, Data_BPM, Data_BPM_summary, chosen_datacol_indexes)
+    else:
+        export_results_parquet(path, DataInfo, Data_BPM, Data_BPM_summary, chosen_datacol_indexes)
+
+
+def _prepare_export(DataInfo, Data_BPM, Data_BPM_summary, chosen_datacol_indexes):
+    if isinstance(Data_BPM, PeakStore):
+        n_files = Data_BPM.n_files
+    elif Data_BPM is not None:
+        n_files = len(Data_BPM)
+    else:
+        n_files = DataInfo.files_amount
+    n_cols = len(DataInfo.datacol_numbers)
+    store = _as_peak_store(Data_BPM, DataInfo) if Data_BPM is not None else None
+    matrices = get_summary_matrices(Data_BPM_summary, n_files) if Data_BPM_summary is not None else {}
+    if chosen_datacol_indexes is None:
+        chosen_datacol_indexes = list(range(1, n_cols + 1))
+    info = get_results_info(DataInfo, n_files, n_cols, Data_BPM_summary)
+    info["summary_datacolumns"] = {
+        key: list(range(1, n_cols + 1)) if m.shape[1] == n_cols else [int(c) for c in chosen_datacol_indexes]
+        for key, m in matrices.items()
+    }
+    return n_files, n_cols, store, matrices, info
+
+
+def export_results_hdf5(
+    path: str,
+    DataInfo: Any,
+    Data_BPM: Union[List[dict], PeakStore, None] = None,
+    Data_BPM_summary: Optional[dict] = None,
+    chosen_datacol_indexes: Optional[List[int]] = None,
+    compression: Optional[str] = "gzip",
+    compression_level: int = 1,
+    chunk_rows: int = 2 ** 16,
+) -> None:
+    """
+    HDF5 export (see export_results); datasets are chunked and compressed with shuffle + gzip
+    (level 1: about as small as the default level 4 at two thirds of the time).
+    """
+    opts = compression_level if compression == "gzip" else None
+    n_files, n_cols, store, matrices, info = _prepare_export(
+        DataInfo, Data_BPM, Data_BPM_summary, chosen_datacol_indexes
+    )
+    with h5py.File(path, "w") as f:
+        f.attrs["format_version"] = RESULTS_FORMAT_VERSION
+        f.attrs["n_files"] = n_files
+        f.attrs["n_cols"] = n_cols
+        grp = f.create_group("info")
+        for key in ("experiment_name", "measurement_name"):
+            grp.attrs[key] = info[key]
+        grp["file_names"] = np.array(info["file_names"], dtype=h5py.string_dtype())
+        grp["framerate"] = np.array(info["framerate"], dtype=float)
+        grp["time_sec"] = np.array(info["time_sec"], dtype=float)
+        grp["electrodes"] = np.array(info["electrodes"], dtype=np.int64)
+        grp["normalizing_indexes"] = np.array(info["normalizing_indexes"], dtype=np.int64)
+        grp = f.create_group("summary")
+        for key, matrix in matrices.items():
+            dset = grp.create_dataset(
+                key, data=matrix, compression=compression, compression_opts=opts, shuffle=compression is not None,
+                chunks=(max(1, min(n_files, 1024)), max(1, matrix.shape[1])),
+            )
+            dset.attrs["datacolumns"] = info["summary_datacolumns"][key]
+        if store is not None:
+            grp = f.create_group("peaks")
+            grp["offsets"] = store.offsets
+            for key, column in get_peak_table(store, DataInfo).items():
+                if not len(column):
+                    grp[key] = column
+                    continue
+                grp.create_dataset(
+                    key, data=column, compression=compression, compression_opts=opts, shuffle=compression is not None,
+                    chunks=(min(len(column), chunk_rows),),
+                )
+
+
+def export_results_parquet(
+    folder: str,
+    DataInfo: Any,
+    Data_BPM: Union[List[dict], PeakStore, None] = None,
+    Data_BPM_summary: Optional[dict] = None,
+    chosen_datacol_indexes: Optional[List[int]] = None,
+    compression: str = "zstd",
+) -> None:
+    """Parquet export (see export_results) into folder: peaks.parquet, summary.parquet, info.json."""
+    pa, pq = _import_pyarrow()
+    n_files, n_cols, store, matrices, info = _prepare_export(
+        DataInfo, Data_BPM, Data_BPM_summary, chosen_datacol_indexes
+    )
+    folder = Path(folder)
+    folder.mkdir(parents=True, exist_ok=True)
+    if store is not None:
+        table = pa.table(get_peak_table(store, DataInfo))
+        # One row group per file, so readers skip other files by row-group statistics
+        file_ends = store.offsets[np.arange(1, n_files + 1) * n_cols * 2]
+        with pq.ParquetWriter(folder / "peaks.parquet", table.schema, compression=compression) as writer:
+            start = 0
+            for end in file_ends:
+                if end > start:
+                    writer.write_table(table.slice(start, end - start))
+                start = end
+            if table.num_rows == 0:
+                writer.write_table(table)
+    if matrices:
+        kk, col = np.meshgrid(np.arange(n_files), np.arange(n_cols), indexing="ij")
+        columns = {"file_index": (kk + 1).ravel().astype(np.int32), "datacolumn": (col + 1).ravel().astype(np.int32)}
+        columns["electrode"] = np.asarray(info["electrodes"], dtype=np.int32)[col.ravel()]
+        for key, matrix in matrices.items():
+            full = np.full((n_files, n_cols), np.nan)
+            full[:, np.asarray(info["summary_datacolumns"][key]) - 1] = matrix
+            columns[key] = full.ravel()
+        pq.write_table(pa.table(columns), folder / "summary.parquet", compression=compression,
+                       row_group_size=max(1, n_cols) * 1024)
+    with open(folder / "info.json", "w") as f:
+        json.dump({**info, "n_files": n_files, "n_cols": n_cols}, f, indent=1)
+
+
+def _import_pyarrow():
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError as e:
+        raise ImportError("Parquet export/import needs pyarrow (pip install pyarrow), or use a .h5 path") from e
+    return pa, pq
+
+
+def _is_hdf5(path: str) -> bool:
+    return Path(path).is_file() and h5py.is_hdf5(path)
+
+
+def read_results_info(path: str) -> dict:
+    """Metadata of an exported results file/folder (file names, framerate, electrodes, ...)."""
+    if _is_hdf5(path):
+        with h5py.File(path, "r") as f:
+            grp = f["info"]
+            info = {key: grp.attrs[key] for key in grp.attrs}
+            info.update({key: grp[key][()].tolist() for key in grp})
+            info["file_names"] = [n.decode() if isinstance(n, bytes) else n for n in info["file_names"]]
+            info["n_files"] = int(f.attrs["n_files"])
+            info["n_cols"] = int(f.attrs["n_cols"])
+            info["format_version"] = int(f.attrs["format_version"])
+        return info
+    with open(Path(path) / "info.json") as f:
+        return json.load(f)
+
+
+def _selected_datacolumns(info: dict, electrode_range: Optional[Tuple[int, int]]) -> np.ndarray:
+    """1-based data columns whose electrode number is within electrode_range (inclusive)."""
+    electrodes = np.asarray(info["electrodes"])
+    if electrode_range is None:
+        return np.arange(1, len(electrodes) + 1)
+    lo, hi = electrode_range
+    return np.nonzero((electrodes >= lo) & (electrodes <= hi))[0] + 1
+
+
+def _selected_files(info: dict, file_range: Optional[Tuple[int, int]]) -> np.ndarray:
+    """1-based file indexes within file_range (inclusive)."""
+    n_files = info["n_files"]
+    if file_range is None:
+        return np.arange(1, n_files + 1)
+    return np.arange(max(1, file_range[0]), min(n_files, file_range[1]) + 1)
+
+
+def read_peak_table(
+    path: str,
+    file_range: Optional[Tuple[int, int]] = None,
+    electrode_range: Optional[Tuple[int, int]] = None,
+    columns: Optional[List[str]] = None,
+) -> pd.DataFrame:
+    """
+    Peaks of an exported results file as a DataFrame, reading only the requested rows.
+    file_range: (first, last) 1-based file indexes, inclusive; electrode_range: (lowest, highest)
+    MEA electrode number, inclusive; columns: subset of PEAK_TABLE_COLUMNS (default all).
+    """
+    columns = list(columns or PEAK_TABLE_COLUMNS)
+    info = read_results_info(path)
+    if not _is_hdf5(path):
+        pa, pq = _import_pyarrow()
+        filters = []
+        if file_range is not None:
+            filters += [("file_index", ">=", file_range[0]), ("file_index", "<=", file_range[1])]
+        if electrode_range is not None:
+            filters += [("electrode", ">=", electrode_range[0]), ("electrode", "<=", electrode_range[1])]
+        table = pq.read_table(Path(path) / "peaks.parquet", columns=columns, filters=filters or None)
+        return table.to_pandas()
+
+    files = _selected_files(info, file_range)
+    datacolumns = _selected_datacolumns(info, electrode_range)
+    n_cols = info["n_cols"]
+    with h5py.File(path, "r") as f:
+        grp = f["peaks"]
+        offsets = grp["offsets"][()]
+        # Row slices of the chosen (file, column) segments; adjacent ones are merged
+        slices = []
+        for kk in files - 1:
+            for col in datacolumns - 1:
+                start = offsets[(kk * n_cols + col) * 2]
+                stop = offsets[(kk * n_cols + col) * 2 + 2]
+                if stop == start:
+                    continue
+                if slices and slices[-1][1] == start:
+                    slices[-1][1] = stop
+                else:
+                    slices.append([start, stop])
+        out = {}
+        for key in columns:
+            dset = grp[key]
+            parts = [dset[start:stop] for start, stop in slices]
+            out[key] = np.concatenate(parts) if parts else np.array([], dtype=dset.dtype)
+    return pd.DataFrame(out)
+
+
+def read_summary(
+    path: str,
+    file_range: Optional[Tuple[int, int]] = None,
+    electrode_range: Optional[Tuple[int, int]] = None,
+    keys: Optional[List[str]] = None,
+) -> Dict[str, np.ndarray]:
+    """
+    Summary matrices of an exported results file (rows = files, columns = data columns of the
+    matrix), reading only the requested files and electrodes. Also returns "file_index" and,
+    per matrix, "<key>_datacolumns" (the 1-based data columns of its columns).
+    """
+    info = read_results_info(path)
+    files = _selected_files(info, file_range)
+    datacolumns = _selected_datacolumns(info, electrode_range)
+    out = {"file_index": files}
+    if not _is_hdf5(path):
+        pa, pq = _import_pyarrow()
+        filters = [("file_index", ">=", int(files[0]) if files.size else 1),
+                   ("file_index", "<=", int(files[-1]) if files.size else 0)]
+        if electrode_range is not None:
+            filters += [("electrode", ">=", electrode_range[0]), ("electrode", "<=", electrode_range[1])]
+        names = keys or list(info["summary_datacolumns"])
+        table = pq.read_table(Path(path) / "summary.parquet", columns=["file_index", "datacolumn"] + names,
+                              filters=filters).to_pandas()
+        for key in names:
+            wide = table.pivot(index="file_index", columns="datacolumn", values=key)
+            keep = [c for c in info["summary_datacolumns"][key] if c in set(datacolumns)]
+            out[key] = wide.reindex(index=files, columns=keep).to_numpy()
+            out[key + "_datacolumns"] = np.array(keep, dtype=int)
+        return out
+
+    with h5py.File(path, "r") as f:
+        grp = f["summary"]
+        for key in keys or list(grp):
+            dset = grp[key]
+            cols = np.asarray(dset.attrs["datacolumns"])
+            keep = np.nonzero(np.isin(cols, datacolumns))[0]
+            if files.size and keep.size:
+                block = dset[int(files[0]) - 1:int(files[-1]), int(keep[0]):int(keep[-1]) + 1]
+                out[key] = block[:, keep - keep[0]]
+            else:
+                out[key] = np.empty((files.size, keep.size))
+            out[key + "_datacolumns"] = cols[keep]
+    return out
+
+
+def read_peak_store(path: str) -> PeakStore:
+    """All peaks of an exported HDF5 results file as a PeakStore (call update_bpm for distances and BPM)."""
+    with h5py.File(path, "r") as f:
+        grp = f["peaks"]
+        framerate = f["info/framerate"][()]
+        return PeakStore(
+            int(f.attrs["n_files"]),
+            int(f.attrs["n_cols"]),
+            grp["offsets"][()],
+            grp["location"][()],
+            grp["value"][()],
+            grp["width"][()],
+            framerate=framerate if framerate.size else None,
+        )
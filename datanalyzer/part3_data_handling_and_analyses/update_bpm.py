@@ -2,9 +2,11 @@
 Update Data_BPM with peak distances (ms), BPM_avg, and set active peak set (low/high).
 """
 
-from typing import List, Any
+from typing import List, Optional, Any
 import numpy as np
 
+from datanalyzer.profiling import profile_stage
+
 
 def update_Data_BPM_peaks_with_low_or_high_peaks(
     file_index: int,
@@ -93,69 +95,94 @@ def should_high_peak_data_be_used(
     return use_high
 
 
+def get_file_framerate(DataInfo: Any, kk: int) -> float:
+    """Framerate of 0-based file kk (the first one if DataInfo has a single framerate)."""
+    try:
+        return float(DataInfo.framerate[kk, 0])
+    except (IndexError, TypeError):
+        return float(DataInfo.framerate.flat[0])
+
+
+def update_Data_BPM_of_column(
+    Data_BPM: List[dict],
+    kk: int,
+    pp: int,
+    suffix: str,
+    fs: float,
+    n_cols: int,
+) -> None:
+    """
+    peak_distances_in_ms, peak_avg_distance_in_ms (mean, std), BPM_avg and Amount_of_peaks
+    of the low or high (suffix) peaks of 0-based file kk, 1-based column pp; NaN without peaks.
+    """
+    d = Data_BPM[kk]
+    locs_key = f"peak_locations_{suffix}"
+    dist_key = f"peak_distances_in_ms_{suffix}"
+    avg_dist_key = f"peak_avg_distance_in_ms_{suffix}"
+    bpm_key = f"BPM_avg_{suffix}"
+    amount_key = f"Amount_of_peaks_{suffix}"
+    try:
+        pks = d[locs_key].get(pp, np.array([]))
+    except (TypeError, KeyError):
+        pks = np.array([])
+    if not isinstance(pks, np.ndarray):
+        pks = np.atleast_1d(pks)
+    d.setdefault(dist_key, {})
+    d.setdefault(avg_dist_key, np.full((n_cols, 2), np.nan))
+    d.setdefault(bpm_key, np.full(n_cols, np.nan))
+    d[amount_key][pp - 1] = pks.size
+    if pks.size == 0:
+        d[dist_key][pp] = np.array([])
+        d[avg_dist_key][pp - 1, :] = np.nan
+        d[bpm_key][pp - 1] = np.nan
+        return
+    peak_times = (pks - 1) / fs
+    dist_ms = np.diff(peak_times) * 1e3
+    d[dist_key][pp] = dist_ms
+    if dist_ms.size > 0:
+        dist_avg_ms = np.array([np.mean(dist_ms), np.std(dist_ms)])
+        BPM_avg = 60.0 / (dist_avg_ms[0] / 1000.0)
+    else:
+        dist_avg_ms = np.array([np.nan, np.nan])
+        BPM_avg = np.nan
+    d[avg_dist_key][pp - 1, :] = dist_avg_ms
+    d[bpm_key][pp - 1] = BPM_avg
+
+
+def choose_low_or_high_peaks_of_column(Data_BPM: List[dict], kk: int, pp: int, using_high_peaks: int = -1) -> None:
+    """Set the active peaks of 0-based file kk, 1-based column pp (using_high_peaks as in update_Data_BPM)."""
+    use_high = using_high_peaks
+    if using_high_peaks < 0:
+        use_high = should_high_peak_data_be_used(Data_BPM[kk], pp)
+    update_Data_BPM_peaks_with_low_or_high_peaks(kk + 1, pp, "high" if use_high else "low", Data_BPM)
+
+
 def update_Data_BPM(
     DataInfo: Any,
     Data_BPM: List[dict],
     using_high_peaks: int = -1,
+    filenumbers: Optional[List[int]] = None,
 ) -> List[dict]:
     """
     Compute peak distances (ms), BPM_avg, peak_avg_distance_in_ms for each file/column,
     then set active peak set (low or high) per column.
     using_high_peaks: -1 = auto (should_high_peak_data_be_used), 0 = always low, 1 = always high.
+    filenumbers: 1-based files to update (default: all).
     """
     n_files = len(Data_BPM)
     try:
         n_cols = len(DataInfo.datacol_numbers)
     except (AttributeError, TypeError):
         n_cols = Data_BPM[0]["Amount_of_peaks_low"].shape[0]
+    if filenumbers is None:
+        filenumbers = list(range(1, n_files + 1))
 
-    for kk in range(n_files):
-        Data_BPM[kk]["file_index"] = kk + 1
-        try:
-            fs = float(DataInfo.framerate[kk, 0])
-        except (IndexError, TypeError):
-            fs = float(DataInfo.framerate.flat[0])
-        for pp in range(1, n_cols + 1):
-            for suffix in ("low", "high"):
-                locs_key = f"peak_locations_{suffix}"
-                dist_key = f"peak_distances_in_ms_{suffix}"
-                avg_dist_key = f"peak_avg_distance_in_ms_{suffix}"
-                bpm_key = f"BPM_avg_{suffix}"
-                amount_key = f"Amount_of_peaks_{suffix}"
-                try:
-                    pks = Data_BPM[kk][locs_key].get(pp, np.array([]))
-                except (TypeError, KeyError):
-                    pks = np.array([])
-                if not isinstance(pks, np.ndarray):
-                    pks = np.atleast_1d(pks)
-                if pks.size == 0:
-                    Data_BPM[kk].setdefault(dist_key, {})
-                    Data_BPM[kk][dist_key][pp] = np.array([])
-                    if avg_dist_key not in Data_BPM[kk]:
-                        Data_BPM[kk][avg_dist_key] = np.full((n_cols, 2), np.nan)
-                    if bpm_key not in Data_BPM[kk]:
-                        Data_BPM[kk][bpm_key] = np.full(n_cols, np.nan)
-                    continue
-                peak_times = (pks - 1) / fs
-                dist_ms = np.diff(peak_times) * 1e3
-                Data_BPM[kk].setdefault(dist_key, {})
-                Data_BPM[kk][dist_key][pp] = dist_ms
-                if dist_ms.size > 0:
-                    dist_avg_ms = np.array([np.mean(dist_ms), np.std(dist_ms)])
-                    BPM_avg = 60.0 / (dist_avg_ms[0] / 1000.0)
-                else:
-                    dist_avg_ms = np.array([np.nan, np.nan])
-                    BPM_avg = np.nan
-                Data_BPM[kk].setdefault(avg_dist_key, np.full((n_cols, 2), np.nan))
-                Data_BPM[kk][avg_dist_key][pp - 1, :] = dist_avg_ms
-                Data_BPM[kk].setdefault(bpm_key, np.full(n_cols, np.nan))
-                Data_BPM[kk][bpm_key][pp - 1] = BPM_avg
-                Data_BPM[kk][amount_key][pp - 1] = len(pks)
-
-            use_high = using_high_peaks
-            if using_high_peaks < 0:
-                use_high = should_high_peak_data_be_used(Data_BPM[kk], pp)
-            update_Data_BPM_peaks_with_low_or_high_peaks(
-                kk + 1, pp, "high" if use_high else "low", Data_BPM
-            )
+    for kk in (idx - 1 for idx in filenumbers if 1 <= idx <= n_files):
+        with profile_stage("update_Data_BPM", kk + 1):
+            Data_BPM[kk]["file_index"] = kk + 1
+            fs = get_file_framerate(DataInfo, kk)
+            for pp in range(1, n_cols + 1):
+                for suffix in ("low", "high"):
+                    update_Data_BPM_of_column(Data_BPM, kk, pp, suffix, fs, n_cols)
+                choose_low_or_high_peaks_of_column(Data_BPM, kk, pp, using_high_peaks)
     return Data_BPM
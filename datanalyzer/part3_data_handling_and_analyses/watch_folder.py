@@ -0,0 +1,302 @@
+"""
+Incremental (watch-folder) analysis: poll a measurement folder and process only newly
+arrived .h5 files, appending them to DataInfo, Data_BPM and Data_BPM_summary.
+
+Per-file arrays (framerate, measurement_time, summary rows) live in buffers that double
+their capacity when full, so adding a file costs the same at file 10 and at file 1000.
+The normalization baseline is recomputed only when the new file changes it.
+"""
+
+from pathlib import Path
+from typing import Any, Callable, List, Optional
+import os
+import time
+import numpy as np
+
+from datanalyzer.models import Rule
+from datanalyzer.profiling import profile_stage
+from datanalyzer.part1_raw_data_handling.load_mea import (
+    create_DataInfo_of_folder,
+    load_chosen_mea_electrode_data,
+    read_file_datetime,
+)
+from datanalyzer.part2_peak_handling.find_peaks import init_Data_BPM, store_peaks_to_Data_BPM
+from datanalyzer.part2_peak_handling.peak_signals import (
+    find_peaks_in_signal,
+    get_peak_finding_parameters,
+    get_polarities,
+    get_signals_to_check,
+)
+from datanalyzer.part2_peak_handling.rules import set_default_filetype_rules_for_peak_finding
+from datanalyzer.part2_peak_handling.vector_peaks import find_peaks_in_block, get_peak_engine
+from .update_bpm import update_Data_BPM
+from .create_bpm_summary import get_BPM_summary_baseline, get_normalizing_indexes, set_BPM_summary_of_file
+
+
+class RowBuffer:
+    """Rows of shape row_shape in an array that doubles its capacity; view is the filled part."""
+
+    def __init__(self, row_shape: tuple = (), dtype: Any = float, fill: Any = np.nan, capacity: int = 16):
+        self.fill = fill
+        self.n = 0
+        self._data = np.full((capacity,) + tuple(row_shape), fill, dtype=dtype)
+
+    def append(self, row: Any = None) -> np.ndarray:
+        """Add one row (fill value if None); returns the new view."""
+        if self.n == self._data.shape[0]:
+            grown = np.full((2 * self.n,) + self._data.shape[1:], self.fill, dtype=self._data.dtype)
+            grown[:self.n] = self._data
+            self._data = grown
+        if row is not None:
+            self._data[self.n] = row
+        self.n += 1
+        return self.view
+
+    @property
+    def view(self) -> np.ndarray:
+        return self._data[:self.n]
+
+
+class IncrementalAnalysis:
+    """
+    Analysis state of a growing measurement folder.
+    DataInfo: from create_DataInfo_of_folder (electrodes chosen); files already listed in it
+    are not re-processed by poll(), use process_existing to include them.
+    Rule_in: peak-finding rules (default: set_default_filetype_rules_for_peak_finding with the
+    framerate of the first file). data_multiply, using_high_peaks, normalizing_indexes and
+    chosen_datacol_indexes as in find_peaks_in_loop, update_Data_BPM and create_BPM_summary.
+    settle_sec: a file is processed when its size and mtime did not change between two polls,
+    or it was last modified settle_sec ago (the MEA software may still be writing it).
+    """
+
+    def __init__(
+        self,
+        DataInfo: Any,
+        Rule_in: Optional[Rule] = None,
+        data_multiply: int = -1,
+        using_high_peaks: int = -1,
+        normalizing_indexes: Optional[List[int]] = None,
+        chosen_datacol_indexes: Optional[List[int]] = None,
+        storage: str = "float64",
+        settle_sec: float = 5.0,
+        process_existing: bool = True,
+    ):
+        self.DataInfo = DataInfo
+        self.Rule = Rule_in
+        self.data_multiply = data_multiply
+        self.using_high_peaks = using_high_peaks
+        self.fixed_normalizing_indexes = normalizing_indexes
+        self.n_cols = len(DataInfo.MEA_columns)
+        if chosen_datacol_indexes is None:
+            chosen_datacol_indexes = list(range(1, self.n_cols + 1))
+        self.ind_col = list(chosen_datacol_indexes)
+        self.storage = storage
+        self.settle_sec = settle_sec
+        self.Data_BPM = []
+        self.processed = set()
+        self.failed = {}
+        self._seen = {}
+        self.file_seconds = []
+
+        existing = list(DataInfo.file_names) if process_existing else []
+        if not process_existing:
+            self.processed.update(DataInfo.file_names)
+        DataInfo.file_names = []
+        DataInfo.files_amount = 0
+        n_ind = len(self.ind_col)
+        self._buffers = {
+            "framerate": RowBuffer((1,)),
+            "datetime": RowBuffer(dtype=object, fill=None),
+            "duration": RowBuffer(),
+            "bytes_read": RowBuffer(dtype=np.int64, fill=0),
+            "bytes_in_file": RowBuffer(dtype=np.int64, fill=0),
+        }
+        self._summary_buffers = {
+            key: RowBuffer((n,))
+            for key, n in (
+                ("Amount_of_peaks", self.n_cols),
+                ("BPM_avg", self.n_cols),
+                ("BPM_avg_stdpros", self.n_cols),
+                ("Amplitude_avg", n_ind),
+                ("Amplitude_std_pros", n_ind),
+                ("peak_width_avg", n_ind),
+                ("peak_width_std_pros", n_ind),
+                ("peak_distances_avg", self.n_cols),
+                ("peak_distances_std", self.n_cols),
+                ("Amplitude_norm", n_ind),
+                ("BPM_norm", self.n_cols),
+            )
+        }
+        self.Data_BPM_summary = {key: buf.view for key, buf in self._summary_buffers.items()}
+        self.Data_BPM_summary.update({
+            "peak_values": {},
+            "peak_locations": {},
+            "peak_widths": {},
+            "peak_distances": {},
+            "normalizing_indexes": [],
+        })
+        self._baseline = None
+        DataInfo.measurement_time["names"] = []
+        for name in existing:
+            self.add_file(name)
+
+    def list_new_files(self) -> List[str]:
+        """New files in the folder that are complete (see settle_sec), in name order."""
+        folder = Path(self.DataInfo.folder_raw_files)
+        ready = []
+        now = time.time()
+        for path in sorted(folder.glob(f"*{self.DataInfo.file_type}")):
+            name = path.name
+            if name in self.processed:
+                continue
+            try:
+                st = path.stat()
+            except FileNotFoundError:
+                continue
+            state = (st.st_size, st.st_mtime_ns)
+            settled = self._seen.get(name) == state or now - st.st_mtime >= self.settle_sec
+            self._seen[name] = state
+            if st.st_size > 0 and settled and self.failed.get(name) != state:
+                ready.append(name)
+        return ready
+
+    def add_file(self, file_name: str) -> bool:
+        """Read, peak-detect and summarize one file; False if it could not be read (yet)."""
+        t0 = time.perf_counter()
+        info = self.DataInfo
+        info.file_names.append(file_name)
+        idx = len(info.file_names)
+        try:
+            entry, stats = load_chosen_mea_electrode_data(info, idx, storage=self.storage, Rule_in=self.Rule)
+        except (OSError, KeyError, ValueError):
+            info.file_names.pop()
+            try:
+                st = os.stat(info.folder_raw_files + file_name)
+            except FileNotFoundError:
+                # Removed or renamed meanwhile: list_new_files no longer lists it
+                return False
+            self.failed[file_name] = (st.st_size, st.st_mtime_ns)
+            return False
+        kk = idx - 1
+        info.files_amount = idx
+        self.processed.add(file_name)
+        self.failed.pop(file_name, None)
+
+        dt = read_file_datetime(info, idx)
+        first = dt if kk == 0 else info.measurement_time["datetime"][0]
+        info.framerate = self._buffers["framerate"].append(stats["framerate"])
+        info.measurement_time["datetime"] = self._buffers["datetime"].append(dt)
+        info.measurement_time["duration"] = self._buffers["duration"].append((dt - first).total_seconds())
+        info.measurement_time["time_sec"] = info.measurement_time["duration"]
+        info.measurement_time["names"].append(file_name.replace(".h5", ""))
+        info.io_stats["bytes_read"] = self._buffers["bytes_read"].append(stats["bytes_read"])
+        info.io_stats["bytes_in_file"] = self._buffers["bytes_in_file"].append(stats["bytes_in_file"])
+
+        if self.Rule is None:
+            self.Rule = set_default_filetype_rules_for_peak_finding(frame_rate=float(stats["framerate"]))
+        info.Rule = self.Rule
+        min_peak_distance, min_peak_value, min_peak_width = get_peak_finding_parameters(self.Rule)
+        self.Data_BPM.append(init_Data_BPM(None, 1, self.n_cols)[0])
+        self.Data_BPM[kk]["file_index"] = idx
+        columns = list(range(1, self.n_cols + 1))
+        polarities = get_polarities(self.data_multiply)
+        with profile_stage("find_peaks", idx):
+            if get_peak_engine(self.Rule) == "vectorized":
+                found = find_peaks_in_block(
+                    entry, columns, polarities, min_peak_value, min_peak_distance, min_peak_width
+                )
+            else:
+                found = {}
+                buffers = [np.empty(entry["data"].shape[0], dtype=np.float64) for _ in polarities]
+                for col in columns:
+                    signals, scale = get_signals_to_check(entry, col, polarities, buffers)
+                    for polarity, data_to_check in zip(polarities, signals):
+                        pks, locs_1based, w = find_peaks_in_signal(
+                            data_to_check, min_peak_value / scale, min_peak_distance, min_peak_width
+                        )
+                        found[col, polarity] = (pks * scale, locs_1based, w)
+            for col in columns:
+                for polarity in polarities:
+                    pks, locs_1based, w = found[col, polarity]
+                    store_peaks_to_Data_BPM(self.Data_BPM, kk, col, pks, locs_1based, w, polarity)
+        update_Data_BPM(info, self.Data_BPM, using_high_peaks=self.using_high_peaks, filenumbers=[idx])
+
+        out = self.Data_BPM_summary
+        for key, buf in self._summary_buffers.items():
+            out[key] = buf.append()
+        set_BPM_summary_of_file(out, info, self.Data_BPM, kk, self.ind_col, self.n_cols)
+        self._update_normalization(kk)
+        self.file_seconds.append(time.perf_counter() - t0)
+        return True
+
+    def _normalization_affected(self, kk: int) -> bool:
+        """Whether adding file kk (0-based) changes normalizing_indexes or the baseline."""
+        if self._baseline is None:
+            return True
+        norm_idx = self.Data_BPM_summary["normalizing_indexes"]
+        if self.fixed_normalizing_indexes is not None:
+            # No valid index yet: baseline is the mean over all files
+            return kk in self.fixed_normalizing_indexes or not any(i < kk for i in norm_idx)
+        try:
+            start_sec = self.DataInfo.hypoxia["start_time_sec"]
+        except (KeyError, TypeError):
+            return False
+        return self.DataInfo.measurement_time["time_sec"][kk] <= start_sec
+
+    def _update_normalization(self, kk: int) -> None:
+        out = self.Data_BPM_summary
+        n_files = kk + 1
+        if self._normalization_affected(kk):
+            if self.fixed_normalizing_indexes is not None:
+                out["normalizing_indexes"] = self.fixed_normalizing_indexes
+            else:
+                out["normalizing_indexes"] = get_normalizing_indexes(self.DataInfo)
+            self._baseline = get_BPM_summary_baseline(out, out["normalizing_indexes"], n_files)
+            out["Amplitude_norm"][:] = out["Amplitude_avg"] / self._baseline[0]
+            out["BPM_norm"][:] = out["BPM_avg"] / self._baseline[1]
+        else:
+            out["Amplitude_norm"][kk] = out["Amplitude_avg"][kk] / self._baseline[0]
+            out["BPM_norm"][kk] = out["BPM_avg"][kk] / self._baseline[1]
+
+    def poll(self) -> List[str]:
+        """Process all new complete files once; returns the names added."""
+        return [name for name in self.list_new_files() if self.add_file(name)]
+
+    def watch(
+        self,
+        poll_interval: float = 10.0,
+        callback: Optional[Callable[["IncrementalAnalysis", List[str]], None]] = None,
+        max_polls: Optional[int] = None,
+    ) -> None:
+        """Poll every poll_interval seconds (until KeyboardInterrupt or max_polls); callback(self, added) after new files."""
+        polls = 0
+        try:
+            while max_polls is None or polls < max_polls:
+                added = self.poll()
+                if added and callback is not None:
+                    callback(self, added)
+                polls += 1
+                if max_polls is None or polls < max_polls:
+                    time.sleep(poll_interval)
+        except KeyboardInterrupt:
+            pass
+
+
+def start_incremental_analysis_of_folder(
+    folder_of_files: str,
+    manually_chosen_mea_electrodes: Optional[List[int]] = None,
+    exp_name: Optional[str] = None,
+    meas_name: Optional[str] = None,
+    meas_date: Optional[str] = None,
+    **kwargs: Any,
+) -> IncrementalAnalysis:
+    """IncrementalAnalysis of folder_of_files (create_DataInfo_of_folder arguments); kwargs go to IncrementalAnalysis."""
+    DataInfo = create_DataInfo_of_folder(
+        exp_name=exp_name,
+        meas_name=meas_name,
+        meas_date=meas_date,
+        file_type=".h5",
+        folder_of_files=folder_of_files,
+        manually_chosen_mea_electrodes=manually_chosen_mea_electrodes,
+    )
+    return IncrementalAnalysis(DataInfo, **kwargs)
@@ -0,0 +1,12 @@
+"""Visualization: min/max decimation pyramids of signals and plots with detected peaks."""
+
+from datanalyzer.part1_raw_data_handling.signal_pyramid import SignalPyramid, SignalPyramidBuilder, build_signal_pyramid
+from .plot_signal import get_peaks_in_window, plot_signal_envelope
+
+__all__ = [
+    "SignalPyramid",
+    "SignalPyramidBuilder",
+    "build_signal_pyramid",
+    "get_peaks_in_window",
+    "plot_signal_envelope",
+]
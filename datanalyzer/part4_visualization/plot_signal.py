@@ -0,0 +1,71 @@
+"""
+Plot MEA signals from a SignalPyramid with the detected peaks of Data_BPM overlaid.
+"""
+
+from typing import Any, List, Optional, Tuple
+import numpy as np
+
+from datanalyzer.part1_raw_data_handling.signal_pyramid import SignalPyramid
+
+
+def get_peaks_in_window(
+    Data_BPM: List[dict],
+    file_index: int,
+    col: int,
+    framerate: float,
+    t_start: float = 0.0,
+    t_end: Optional[float] = None,
+    peaks: str = "active",
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    (times in seconds, values) of the peaks of 1-based file_index and data column col within
+    t_start..t_end. peaks: "active" (peak_locations after update_Data_BPM), "low" or "high".
+    Peak locations are sorted, so the window is found by binary search.
+    """
+    suffix = "" if peaks == "active" else "_" + peaks
+    d = Data_BPM[file_index - 1]
+    locs = np.atleast_1d(d.get("peak_locations" + suffix, {}).get(col, np.array([])))
+    values = np.atleast_1d(d.get("peak_values" + suffix, {}).get(col, np.array([])))
+    times = (locs - 1) / framerate
+    a = np.searchsorted(times, t_start, side="left")
+    b = times.size if t_end is None else np.searchsorted(times, t_end, side="right")
+    return times[a:b], values[a:b]
+
+
+def plot_signal_envelope(
+    pyramid: SignalPyramid,
+    col: int,
+    t_start: float = 0.0,
+    t_end: Optional[float] = None,
+    Data_BPM: Optional[List[dict]] = None,
+    file_index: Optional[int] = None,
+    peaks: str = "active",
+    ax: Any = None,
+    n_pixels: Optional[int] = None,
+) -> Any:
+    """
+    Draw the min/max envelope of data column col (1-based) in t_start..t_end seconds, with the
+    peaks of Data_BPM[file_index - 1] as markers. n_pixels defaults to the axes width in pixels.
+    Returns the matplotlib axes.
+    """
+    if ax is None:
+        import matplotlib.pyplot as plt
+
+        _, ax = plt.subplots()
+    if n_pixels is None:
+        n_pixels = max(100, int(ax.get_window_extent().width))
+    times, mins, maxs = pyramid.envelope(t_start, t_end, n_pixels, columns=[col])
+    if times.size and np.array_equal(mins, maxs):
+        ax.plot(times, mins[:, 0], lw=0.8)
+    elif times.size:
+        edges = np.append(times, times[-1] + (times[-1] - times[-2] if times.size > 1 else 1 / pyramid.framerate))
+        ax.fill_between(edges, np.append(mins[:, 0], mins[-1, 0]), np.append(maxs[:, 0], maxs[-1, 0]),
+                        step="post", lw=0.5)
+    if Data_BPM is not None and file_index is not None:
+        peak_times, peak_values = get_peaks_in_window(
+            Data_BPM, file_index, col, pyramid.framerate, t_start, t_end, peaks
+        )
+        ax.plot(peak_times, peak_values, "v", color="tab:red", ms=4, label="peaks")
+    ax.set_xlabel("Time (s)")
+    ax.set_ylabel("Voltage (V)")
+    return ax
@@ -0,0 +1,185 @@
+"""
+Per-stage timing and memory instrumentation for the analysis pipeline.
+
+Pipeline functions wrap their stages in `with profile_stage("name", file_index) as rec:` and
+report bytes with rec.add(bytes_read=..., array_bytes=...). While profiling is disabled
+(the default) profile_stage returns a shared no-op record, so the hooks cost one global
+lookup. enable_profiling() starts collecting; nested stages inherit the file index of the
+enclosing stage and their time is subtracted from its self_seconds. Stages nest per thread,
+so a background loader (PrefetchReader) records its own stages alongside the main thread.
+"""
+
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional
+import csv
+import json
+import threading
+import time
+
+RECORD_FIELDS = ("stage", "file_index", "seconds", "self_seconds", "bytes_read", "array_bytes", "depth")
+
+
+class _NullRecord:
+    """Stage record used while profiling is disabled."""
+
+    def __enter__(self) -> "_NullRecord":
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        return None
+
+    def add(self, **counters: int) -> None:
+        return None
+
+
+_NULL_RECORD = _NullRecord()
+_profiler = None
+
+
+class StageRecord:
+    """One timed stage; created by Profiler.stage."""
+
+    def __init__(self, profiler: "Profiler", stage: str, file_index: Optional[int]):
+        self.profiler = profiler
+        self.stage = stage
+        self.file_index = file_index
+        self.bytes_read = 0
+        self.array_bytes = 0
+        self.child_seconds = 0.0
+
+    def add(self, bytes_read: int = 0, array_bytes: int = 0) -> None:
+        """Count bytes read from files and bytes of arrays allocated in this stage."""
+        self.bytes_read += int(bytes_read)
+        self.array_bytes += int(array_bytes)
+
+    def __enter__(self) -> "StageRecord":
+        stack = self.profiler.stack
+        if self.file_index is None and stack:
+            self.file_index = stack[-1].file_index
+        self.depth = len(stack)
+        stack.append(self)
+        self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        seconds = time.perf_counter() - self.t0
+        stack = self.profiler.stack
+        stack.pop()
+        if stack:
+            stack[-1].child_seconds += seconds
+        self.profiler.records.append({
+            "stage": self.stage,
+            "file_index": self.file_index,
+            "seconds": seconds,
+            "self_seconds": seconds - self.child_seconds,
+            "bytes_read": self.bytes_read,
+            "array_bytes": self.array_bytes,
+            "depth": self.depth,
+        })
+
+
+class Profiler:
+    """Collected stage records: {stage, file_index, seconds, self_seconds, bytes_read, array_bytes, depth}."""
+
+    def __init__(self):
+        self.records = []
+        self._local = threading.local()
+
+    @property
+    def stack(self) -> List["StageRecord"]:
+        """Open stages of the calling thread."""
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    def stage(self, stage: str, file_index: Optional[int] = None) -> StageRecord:
+        return StageRecord(self, stage, file_index)
+
+    def stage_totals(self) -> List[Dict[str, Any]]:
+        """Per stage: calls, seconds, self_seconds, bytes_read, array_bytes; slowest (self time) first."""
+        totals = defaultdict(lambda: {"calls": 0, "seconds": 0.0, "self_seconds": 0.0, "bytes_read": 0, "array_bytes": 0})
+        for rec in self.records:
+            t = totals[rec["stage"]]
+            t["calls"] += 1
+            for key in ("seconds", "self_seconds", "bytes_read", "array_bytes"):
+                t[key] += rec[key]
+        return sorted(({"stage": k, **v} for k, v in totals.items()), key=lambda t: -t["self_seconds"])
+
+    def file_totals(self) -> List[Dict[str, Any]]:
+        """Per file: self seconds summed over stages, bytes read and allocated; slowest first."""
+        totals = defaultdict(lambda: {"seconds": 0.0, "bytes_read": 0, "array_bytes": 0})
+        for rec in self.records:
+            if rec["file_index"] is None:
+                continue
+            t = totals[rec["file_index"]]
+            t["seconds"] += rec["self_seconds"]
+            t["bytes_read"] += rec["bytes_read"]
+            t["array_bytes"] += rec["array_bytes"]
+        return sorted(({"file_index": k, **v} for k, v in totals.items()), key=lambda t: -t["seconds"])
+
+    def write_report(self, path: str, file_names: Optional[List[str]] = None) -> None:
+        """Write all records as CSV (path ending .csv) or JSON with records, stage and file totals."""
+        if str(path).lower().endswith(".csv"):
+            with open(path, "w", newline="") as f:
+                writer = csv.DictWriter(f, fieldnames=RECORD_FIELDS)
+                writer.writeheader()
+                writer.writerows(self.records)
+            return
+        files = self.file_totals()
+        if file_names:
+            for t in files:
+                if 1 <= t["file_index"] <= len(file_names):
+                    t["file_name"] = file_names[t["file_index"] - 1]
+        with open(path, "w") as f:
+            json.dump({"stages": self.stage_totals(), "files": files, "records": self.records}, f, indent=2)
+
+    def print_report(self, top: int = 5, file_names: Optional[List[str]] = None) -> None:
+        """Print the slowest stages (self time) and files."""
+        print("Slowest stages (self time):")
+        for t in self.stage_totals()[:top]:
+            print("  %-28s %8.3f s  %5d calls  %10.1f MiB read  %10.1f MiB arrays" % (
+                t["stage"], t["self_seconds"], t["calls"], t["bytes_read"] / 2 ** 20, t["array_bytes"] / 2 ** 20))
+        print("Slowest files:")
+        for t in self.file_totals()[:top]:
+            idx = t["file_index"]
+            name = file_names[idx - 1] if file_names and 1 <= idx <= len(file_names) else ""
+            print("  %4d %-40s %8.3f s  %10.1f MiB read" % (idx, name, t["seconds"], t["bytes_read"] / 2 ** 20))
+
+
+def enable_profiling() -> Profiler:
+    """Start collecting stage records (a new Profiler) and return it."""
+    global _profiler
+    _profiler = Profiler()
+    return _profiler
+
+
+def disable_profiling() -> Optional[Profiler]:
+    """Stop collecting; returns the Profiler that was active (or None)."""
+    global _profiler
+    profiler, _profiler = _profiler, None
+    return profiler
+
+
+def get_profiler() -> Optional[Profiler]:
+    return _profiler
+
+
+@contextmanager
+def separate_profiler(enabled: bool):
+    """Collect into a fresh Profiler (None if not enabled) inside the block and restore the active one after."""
+    global _profiler
+    previous = _profiler
+    _profiler = Profiler() if enabled else None
+    try:
+        yield _profiler
+    finally:
+        _profiler = previous
+
+
+def profile_stage(stage: str, file_index: Optional[int] = None):
+    """Context manager timing one stage; a no-op record unless profiling is enabled."""
+    if _profiler is None:
+        return _NULL_RECORD
+    return _profiler.stage(stage, file_index)
@@ -5,9 +5,29 @@ Example script: load MEA .h5 data, find peaks, update BPM, create BPM summary.
 
 import argparse
 
-from datanalyzer.part1_raw_data_handling import load_raw_mea_data_to_Data_and_DataInfo
-from datanalyzer.part2_peak_handling import find_peaks_in_loop, set_default_filetype_rules_for_peak_finding
-from datanalyzer.part3_data_handling_and_analyses import update_Data_BPM, create_BPM_summary
+from datanalyzer.profiling import enable_profiling, get_profiler
+from datanalyzer.part1_raw_data_handling import (
+    load_raw_mea_data_to_Data_and_DataInfo,
+    create_DataInfo_of_folder,
+    load_Data_of_DataInfo,
+    read_mea_file_framerate,
+)
+from datanalyzer.part2_peak_handling import (
+    find_peaks_in_loop,
+    find_peaks_in_files_parallel,
+    set_default_filetype_rules_for_peak_finding,
+    PeakCache,
+)
+from datanalyzer.part3_data_handling_and_analyses import (
+    update_Data_BPM,
+    create_BPM_summary,
+    compute_beat_features,
+    IncrementalAnalysis,
+    export_results,
+    plan_analysis_memory,
+    run_analysis_with_memory_plan,
+    format_memory_plan,
+)
 
 
 def main():
@@ -17,12 +37,107 @@ def main():
     p.add_argument("--meas-name", default="MEA21002b", help="Measurement name")
     p.add_argument("--meas-date", default="2020_03_02", help="Measurement date")
     p.add_argument("--electrodes", type=int, nargs="+", default=None, help="MEA electrode numbers (e.g. 21 28 31 51)")
+    p.add_argument("--all-streams", action="store_true",
+                   help="Analyze every recording and analog stream of each file as its own entry (not with --watch)")
     p.add_argument("--max-bpm", type=float, default=40, help="Max BPM for peak finding")
     p.add_argument("--min-peak-value", type=float, default=5e-5, help="Min peak amplitude (V)")
+    p.add_argument("--peak-engine", choices=("scipy", "vectorized"), default="scipy",
+                   help="Peak finder: scipy find_peaks per electrode, or all electrodes of a file at once")
+    p.add_argument("--highpass", type=float, default=None, metavar="HZ",
+                   help="High-pass filter cutoff before peak finding (with --lowpass: band-pass)")
+    p.add_argument("--lowpass", type=float, default=None, metavar="HZ", help="Low-pass filter cutoff before peak finding")
+    p.add_argument("--notch", type=float, default=None, metavar="HZ", help="Notch filter for line noise (50 or 60)")
+    p.add_argument("--zero-phase", action="store_true",
+                   help="Filter forward and backward (no delay) instead of causally")
+    p.add_argument("--beat-features", action="store_true",
+                   help="Per-beat FPD, repolarization amplitude, slope and template correlation "
+                   "(needs the loaded signals, so not with --watch, or --workers without --max-memory)")
+    p.add_argument("--workers", type=int, default=1,
+                   help="Worker processes for per-file load + peak finding (1 = serial)")
+    p.add_argument("--max-memory", default=None, metavar="SIZE",
+                   help="Memory budget (e.g. 4G, 512M): plan storage, workers, caching and block sizes "
+                   "from the file shapes to stay within it, and print the plan; --workers is the most "
+                   "workers to use, --prefetch the most files read ahead (default planned; not with --watch); "
+                   "10%% of it (at least 32 MiB) is kept for the interpreter and results")
+    p.add_argument("--prefetch", type=int, default=0, metavar="N",
+                   help="Read up to N files ahead in a background thread while peaks are found (0 = off; "
+                   "not with --workers or --watch)")
+    p.add_argument("--peak-cache", default=None,
+                   help="Folder for cached peak results; unchanged files are not re-read on re-runs "
+                   "(not with --workers or --watch)")
+    p.add_argument("--data-cache", default=None,
+                   help="Folder for memory-mapped converted channel data; re-runs skip HDF5 decoding "
+                   "(not with --workers or --watch)")
+    p.add_argument("--watch", action="store_true",
+                   help="Keep polling the folder and analyze new .h5 files as they arrive (Ctrl-C to stop)")
+    p.add_argument("--poll-interval", type=float, default=10.0, help="Seconds between folder polls with --watch")
+    p.add_argument("--export", default=None, metavar="PATH",
+                   help="Write peaks and summary matrices as columnar tables (.h5 file, or Parquet folder with pyarrow)")
+    p.add_argument("--profile", default=None, metavar="REPORT",
+                   help="Time each stage per file and write the report (.json or .csv); prints the slowest stages and files")
     args = p.parse_args()
+    in_process_options = [
+        option for option, value in (
+            ("--peak-cache", args.peak_cache), ("--data-cache", args.data_cache), ("--prefetch", args.prefetch)
+        ) if value
+    ]
+    if args.folder and in_process_options:
+        # These act on files loaded in this process
+        if args.watch:
+            p.error("%s cannot be used with --watch" % ", ".join(in_process_options))
+        if args.workers > 1 and not args.max_memory:
+            p.error("%s cannot be used with --workers > 1" % ", ".join(in_process_options))
+    if args.folder and args.watch and args.all_streams:
+        p.error("--all-streams cannot be used with --watch")
+    if args.folder and args.beat_features:
+        # Beat features need the loaded data, which --watch and worker processes do not keep
+        if args.watch:
+            p.error("--beat-features cannot be used with --watch")
+        if args.workers > 1 and not args.max_memory:
+            p.error("--beat-features cannot be used with --workers > 1 (without --max-memory)")
+    if args.profile:
+        enable_profiling()
+
+    if args.folder and args.watch:
+        watch_folder(args)
+        return
+
+    if args.folder and args.max_memory:
+        run_with_memory_budget(args, p)
+        return
+
+    if args.folder and args.workers > 1:
+        DataInfo = create_DataInfo_of_folder(
+            exp_name=args.exp_name,
+            meas_name=args.meas_name,
+            meas_date=args.meas_date,
+            file_type=".h5",
+            folder_of_files=args.folder,
+            file_numbers_to_analyze=None,
+            manually_chosen_mea_electrodes=args.electrodes,
+            all_streams=args.all_streams,
+        )
+        if not DataInfo.file_names:
+            print("No data loaded.")
+            return
+        Rule = make_rule(args, read_mea_file_framerate(DataInfo, 1))
+        Data_BPM = find_peaks_in_files_parallel(
+            DataInfo,
+            Rule_in=Rule,
+            filenumbers=None,
+            datacolumns=None,
+            data_multiply=-1,
+            workers=args.workers,
+        )
+        Data_BPM = update_Data_BPM(DataInfo, Data_BPM, using_high_peaks=-1)
+        Data_BPM_summary = create_BPM_summary(DataInfo, Data_BPM)
+        print_results(DataInfo, Data_BPM_summary)
+        write_export(args, DataInfo, Data_BPM, Data_BPM_summary)
+        write_profile(args, DataInfo)
+        return
 
     if args.folder:
-        Data, DataInfo = load_raw_mea_data_to_Data_and_DataInfo(
+        DataInfo = create_DataInfo_of_folder(
             exp_name=args.exp_name,
             meas_name=args.meas_name,
             meas_date=args.meas_date,
@@ -30,6 +145,19 @@ def main():
             folder_of_files=args.folder,
             file_numbers_to_analyze=None,
             manually_chosen_mea_electrodes=args.electrodes,
+            all_streams=args.all_streams,
+        )
+        if not DataInfo.file_names:
+            print("No data loaded.")
+            return
+        # Peak distances use the first file's framerate; filters are designed for each file's own
+        Rule = make_rule(args, read_mea_file_framerate(DataInfo, 1))
+        DataInfo.Rule = Rule
+        Data = load_Data_of_DataInfo(
+            DataInfo,
+            lazy=args.peak_cache is not None or args.prefetch > 0,
+            cache_dir=args.data_cache,
+            Rule_in=Rule,
         )
     else:
         Data, DataInfo = load_raw_mea_data_to_Data_and_DataInfo(
@@ -46,13 +174,6 @@ def main():
         print("No data loaded.")
         return
 
-    Rule = set_default_filetype_rules_for_peak_finding(
-        frame_rate=float(DataInfo.framerate.flat[0]),
-    )
-    Rule.max_bpm = args.max_bpm
-    Rule.min_peak_value = args.min_peak_value
-    DataInfo.Rule = Rule
-
     Data_BPM = find_peaks_in_loop(
         Data,
         DataInfo,
@@ -60,14 +181,135 @@ def main():
         filenumbers=None,
         datacolumns=None,
         data_multiply=-1,
+        peak_cache=PeakCache(args.peak_cache) if args.peak_cache else None,
+        prefetch_depth=args.prefetch,
     )
+    print_prefetch(DataInfo)
     Data_BPM = update_Data_BPM(DataInfo, Data_BPM, using_high_peaks=-1)
+    if args.beat_features:
+        Data_BPM = compute_beat_features(Data, DataInfo, Data_BPM)
     Data_BPM_summary = create_BPM_summary(DataInfo, Data_BPM)
+    print_results(DataInfo, Data_BPM_summary)
+    write_export(args, DataInfo, Data_BPM, Data_BPM_summary)
+    write_profile(args, DataInfo)
+
+
+def run_with_memory_budget(args, parser):
+    DataInfo = create_DataInfo_of_folder(
+        exp_name=args.exp_name,
+        meas_name=args.meas_name,
+        meas_date=args.meas_date,
+        file_type=".h5",
+        folder_of_files=args.folder,
+        file_numbers_to_analyze=None,
+        manually_chosen_mea_electrodes=args.electrodes,
+        read_metadata=True,
+        all_streams=args.all_streams,
+    )
+    if not DataInfo.file_names:
+        print("No data loaded.")
+        return
+    Rule = make_rule(args, float(DataInfo.framerate.flat[0]))
+    try:
+        plan = plan_analysis_memory(
+            DataInfo, args.max_memory, Rule_in=Rule, data_multiply=-1, workers=args.workers,
+            beat_features=args.beat_features, max_prefetch=args.prefetch or None,
+        )
+    except ValueError as e:
+        parser.error("--max-memory: %s" % e)
+    print(format_memory_plan(plan))
+    unused = [
+        option for option, value, modes in (
+            ("--peak-cache", args.peak_cache, ("resident", "lazy")),
+            ("--data-cache", args.data_cache, ("resident", "lazy")),
+            ("--prefetch", args.prefetch, ("lazy",)),
+        ) if value and plan["mode"] not in modes
+    ]
+    if unused:
+        print("Warning: %s not used by the %s plan" % (", ".join(unused), plan["mode"]))
+    Data, Data_BPM, Data_BPM_summary = run_analysis_with_memory_plan(
+        DataInfo,
+        plan,
+        Rule_in=Rule,
+        data_multiply=-1,
+        using_high_peaks=-1,
+        beat_features=args.beat_features,
+        peak_cache=PeakCache(args.peak_cache) if args.peak_cache else None,
+        cache_dir=args.data_cache,
+    )
+    print_prefetch(DataInfo)
+    print_results(DataInfo, Data_BPM_summary)
+    write_export(args, DataInfo, Data_BPM, Data_BPM_summary)
+    write_profile(args, DataInfo)
+
+
+def watch_folder(args):
+    DataInfo = create_DataInfo_of_folder(
+        exp_name=args.exp_name,
+        meas_name=args.meas_name,
+        meas_date=args.meas_date,
+        file_type=".h5",
+        folder_of_files=args.folder,
+        file_numbers_to_analyze=None,
+        manually_chosen_mea_electrodes=args.electrodes,
+    )
+    Rule = make_rule(args, read_mea_file_framerate(DataInfo, 1) if DataInfo.file_names else 25e3)
+    analysis = IncrementalAnalysis(DataInfo, Rule_in=Rule, data_multiply=-1, using_high_peaks=-1)
+    print_results(analysis.DataInfo, analysis.Data_BPM_summary)
+
+    def report(analysis, added):
+        for name, seconds in zip(added, analysis.file_seconds[-len(added):]):
+            print("  + %s (%.2f s)" % (name, seconds))
+        print_results(analysis.DataInfo, analysis.Data_BPM_summary)
+
+    print("Watching %s every %g s (Ctrl-C to stop)" % (args.folder, args.poll_interval))
+    analysis.watch(poll_interval=args.poll_interval, callback=report)
+    # Ctrl-C ends watch(); export and report the files analysed so far
+    write_export(args, analysis.DataInfo, analysis.Data_BPM, analysis.Data_BPM_summary)
+    write_profile(args, analysis.DataInfo)
 
+
+def make_rule(args, frame_rate):
+    Rule = set_default_filetype_rules_for_peak_finding(frame_rate=frame_rate)
+    Rule.max_bpm = args.max_bpm
+    Rule.min_peak_value = args.min_peak_value
+    Rule.peak_engine = args.peak_engine
+    Rule.filter_highpass = args.highpass
+    Rule.filter_lowpass = args.lowpass
+    Rule.filter_notch = args.notch
+    Rule.filter_zero_phase = args.zero_phase
+    return Rule
+
+
+def print_prefetch(DataInfo):
+    if "prefetch" in DataInfo.io_stats:
+        m = DataInfo.io_stats["prefetch"]
+        print("Prefetch: %d files, %.2f s loading, %.2f s waited, %.2f s (%.0f%%) hidden" % (
+            m["files_loaded"], m["load_seconds"], m["wait_seconds"], m["hidden_seconds"], 100 * m["hidden_fraction"]))
+
+
+def print_results(DataInfo, Data_BPM_summary):
     print("Done.")
-    print("  Data: %d files" % len(Data))
+    print("  Data: %d files" % DataInfo.files_amount)
     print("  Data_BPM_summary.BPM_avg shape:", Data_BPM_summary["BPM_avg"].shape)
     print("  Data_BPM_summary.Amplitude_avg shape:", Data_BPM_summary["Amplitude_avg"].shape)
+    if "FPD_avg" in Data_BPM_summary:
+        print("  Data_BPM_summary.FPD_avg shape:", Data_BPM_summary["FPD_avg"].shape)
+
+
+def write_export(args, DataInfo, Data_BPM, Data_BPM_summary):
+    if args.export:
+        export_results(args.export, DataInfo, Data_BPM, Data_BPM_summary)
+        print("Results exported to %s" % args.export)
+
+
+def write_profile(args, DataInfo):
+    profiler = get_profiler()
+    if profiler is None:
+        return
+    profiler.write_report(args.profile, DataInfo.file_names)
+    profiler.print_report(top=5, file_names=DataInfo.file_names)
+    print("Profile written to %s" % args.profile)
 
 
 if __name__ == "__main__":
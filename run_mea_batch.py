@@ -0,0 +1,46 @@
+#!/usr/bin/env python3
+"""
+Batch script: analyze many experiments from a manifest with checkpoint/resume.
+Re-running the same command after a crash or Ctrl-C continues with the unfinished files.
+"""
+
+import argparse
+import warnings
+
+from datanalyzer.part3_data_handling_and_analyses import read_batch_manifest, run_batch
+
+
+def main():
+    p = argparse.ArgumentParser(description="DatAnalyzer: checkpointed batch analysis of many MEA experiments")
+    p.add_argument("manifest",
+                   help="Jobs as .json (list of {exp_name, meas_name, folder, electrodes, ...}) or .csv with a header row")
+    p.add_argument("--checkpoint-dir", default="batch_checkpoints",
+                   help="Folder for per-file peak results; files already done there are skipped")
+    p.add_argument("--workers", type=int, default=None, help="Worker processes (default: CPU count)")
+    args = p.parse_args()
+
+    jobs = read_batch_manifest(args.manifest)
+
+    def progress(name, file_name, done, total):
+        print("  %s: %d/%d %s" % (name, done, total, file_name))
+
+    def job_done(name, result):
+        summary = result["Data_BPM_summary"]
+        print("Done %s: %d files (%d from checkpoint), BPM_avg shape %s" % (
+            name, result["DataInfo"].files_amount, result["files_from_checkpoint"], summary["BPM_avg"].shape))
+
+    failed = {}
+    with warnings.catch_warnings():
+        # Columns without peaks give mean-of-empty warnings by design
+        warnings.simplefilter("ignore", RuntimeWarning)
+        results = run_batch(
+            jobs, args.checkpoint_dir, workers=args.workers, progress=progress, on_job_done=job_done, failed=failed
+        )
+    for name, files in failed.items():
+        for file_name, error in files.items():
+            print("Failed %s: %s (%s)" % (name, file_name, error))
+    print("%d of %d jobs finished." % (len(results), len(jobs)))
+
+
+if __name__ == "__main__":
+    main()
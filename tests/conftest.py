@@ -0,0 +1,63 @@
+import sys
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "benchmarks"))
+from synthetic_mea import make_synthetic_mea_folder  # noqa: E402
+
+ELECTRODES = [21, 28, 31, 51]
+
+
+@pytest.fixture
+def synthetic_folder(tmp_path):
+    """Three short synthetic recordings with low noise, so that both low and high peaks are found."""
+    folder = tmp_path / "source"
+    make_synthetic_mea_folder(str(folder), n_files=3, duration_sec=4.0, noise_uV=1.0, amplitude_uV=200.0)
+    return str(folder) + "/"
+
+
+@pytest.fixture
+def analysed_folder(synthetic_folder):
+    """(Data, DataInfo, Data_BPM) of synthetic_folder with low and high peaks, after update_Data_BPM."""
+    from datanalyzer.part1_raw_data_handling import load_raw_mea_data_to_Data_and_DataInfo
+    from datanalyzer.part2_peak_handling import find_peaks_in_loop, set_default_filetype_rules_for_peak_finding
+    from datanalyzer.part3_data_handling_and_analyses import update_Data_BPM
+
+    Data, DataInfo = load_raw_mea_data_to_Data_and_DataInfo(
+        folder_of_files=synthetic_folder, manually_chosen_mea_electrodes=ELECTRODES
+    )
+    Rule = set_default_filetype_rules_for_peak_finding(frame_rate=float(DataInfo.framerate.flat[0]))
+    Data_BPM = update_Data_BPM(DataInfo, find_peaks_in_loop(Data, DataInfo, Rule_in=Rule, data_multiply=0))
+    return Data, DataInfo, Data_BPM
+
+
+def make_random_Data_BPM(n_files=6, n_cols=5, seed=0):
+    """
+    (DataInfo, Data_BPM) as find_peaks_in_loop gives them for random low and high peaks, with
+    a file without peaks, columns with 0 or 1 peaks and different framerates per file.
+    """
+    from datanalyzer.models import DataInfo
+
+    rng = np.random.default_rng(seed)
+    info = DataInfo(
+        file_names=["file_%02d.h5" % kk for kk in range(n_files)],
+        files_amount=n_files,
+        datacol_numbers=list(range(1, n_cols + 1)),
+        framerate=rng.choice([10e3, 25e3, 50e3], (n_files, 1)),
+    )
+    Data_BPM = []
+    for kk in range(n_files):
+        d = {"file_index": kk + 1}
+        for suffix, sign in (("low", -1), ("high", 1)):
+            d["peak_values_" + suffix], d["peak_locations_" + suffix], d["peak_widths_" + suffix] = {}, {}, {}
+            d["Amount_of_peaks_" + suffix] = np.zeros(n_cols)
+            for col in range(1, n_cols + 1):
+                n = 0 if kk == 1 else int(rng.choice([0, 1, 2, rng.integers(3, 40)]))
+                d["peak_locations_" + suffix][col] = np.sort(rng.choice(200000, size=n, replace=False)) + 1
+                d["peak_values_" + suffix][col] = sign * rng.uniform(5e-5, 5e-4, n)
+                d["peak_widths_" + suffix][col] = rng.uniform(50, 400, n)
+                d["Amount_of_peaks_" + suffix][col - 1] = n
+        Data_BPM.append(d)
+    return info, Data_BPM
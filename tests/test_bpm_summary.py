@@ -0,0 +1,45 @@
+import warnings
+
+import numpy as np
+import pytest
+
+from conftest import make_random_Data_BPM
+from datanalyzer.part3_data_handling_and_analyses import (
+    PeakStore,
+    create_BPM_summary,
+    create_BPM_summary_vectorized,
+    update_Data_BPM,
+)
+
+
+def assert_same_summary(summary, expected):
+    assert summary.keys() == expected.keys()
+    for key, value in expected.items():
+        if isinstance(value, np.ndarray):
+            np.testing.assert_array_equal(summary[key], value, err_msg=key)
+    np.testing.assert_array_equal(summary["normalizing_indexes"], expected["normalizing_indexes"])
+    for name in ("peak_values", "peak_locations", "peak_widths", "peak_distances"):
+        assert sorted(summary[name]) == sorted(expected[name]), name
+        for kk, columns in expected[name].items():
+            assert sorted(summary[name][kk]) == sorted(columns), (name, kk)
+            for col, value in columns.items():
+                np.testing.assert_array_equal(summary[name][kk][col], value, err_msg="%s[%d][%d]" % (name, kk, col))
+
+
+@pytest.mark.parametrize("seed", range(3))
+@pytest.mark.parametrize("normalizing_indexes", [[0], [1], [0, 2, 3], []])
+@pytest.mark.parametrize("chosen_datacol_indexes", [None, [2, 4, 5]])
+def test_vectorized_summary_equals_create_BPM_summary(seed, normalizing_indexes, chosen_datacol_indexes):
+    DataInfo, Data_BPM = make_random_Data_BPM(seed=seed)
+    Data_BPM = update_Data_BPM(DataInfo, Data_BPM, using_high_peaks=-1)
+    store = PeakStore.from_Data_BPM(Data_BPM, DataInfo).update_bpm(DataInfo, using_high_peaks=-1)
+    with warnings.catch_warnings():
+        # Mean of empty slices (electrodes without peaks) is NaN by design
+        warnings.simplefilter("ignore", RuntimeWarning)
+        expected = create_BPM_summary(DataInfo, Data_BPM, normalizing_indexes, chosen_datacol_indexes)
+        for data in (Data_BPM, store, store.as_Data_BPM()):
+            summary = create_BPM_summary_vectorized(DataInfo, data, normalizing_indexes, chosen_datacol_indexes)
+            assert_same_summary(summary, expected)
+    # File 2 has no peaks, other electrodes have too few for a rate
+    assert np.isnan(expected["BPM_avg"][1]).all()
+    assert np.isnan(expected["BPM_avg"]).any() and not np.isnan(expected["BPM_avg"]).all()
@@ -0,0 +1,72 @@
+import numpy as np
+import pytest
+from scipy.signal import sosfilt, sosfilt_zi, sosfiltfilt
+
+from conftest import ELECTRODES
+from datanalyzer.part1_raw_data_handling import filter_data_in_place, load_raw_mea_data_to_Data_and_DataInfo
+from datanalyzer.part1_raw_data_handling.filtering import BlockFilter, get_filter_sos, get_sosfiltfilt_padlen
+from datanalyzer.part2_peak_handling import set_default_filetype_rules_for_peak_finding
+
+SETTINGS = [
+    {"highpass": 1.0, "lowpass": None, "notch": None},
+    {"highpass": 1.0, "lowpass": 2000.0, "notch": 50.0},
+    {"highpass": None, "lowpass": 500.0, "notch": None},
+]
+
+
+def get_sos(settings):
+    return get_filter_sos(dict(settings, order=2, notch_q=30.0), 25e3)
+
+
+def random_data(n_rows, n_cols=3, seed=0):
+    rng = np.random.default_rng(seed)
+    return rng.normal(0, 1e-5, (n_rows, n_cols)) + rng.uniform(-1e-3, 1e-3, n_cols)
+
+
+@pytest.mark.parametrize("settings", SETTINGS)
+@pytest.mark.parametrize("block_rows", [7, 1000, 2 ** 16])
+def test_zero_phase_equals_sosfiltfilt(settings, block_rows):
+    sos = get_sos(settings)
+    data = random_data(5000)
+    expected = sosfiltfilt(sos, data, axis=0)
+    np.testing.assert_array_equal(filter_data_in_place(data, sos, zero_phase=True, block_rows=block_rows), expected)
+
+
+@pytest.mark.parametrize("settings", SETTINGS)
+@pytest.mark.parametrize("block_rows", [7, 1000, 2 ** 16])
+def test_causal_equals_sosfilt_from_steady_state(settings, block_rows):
+    sos = get_sos(settings)
+    data = random_data(5000)
+    expected, _ = sosfilt(sos, data, axis=0, zi=sosfilt_zi(sos)[:, :, None] * data[0])
+    np.testing.assert_array_equal(filter_data_in_place(data.copy(), sos, block_rows=block_rows), expected)
+
+    # Streamed blocks give the same signal
+    block_filter = BlockFilter(sos)
+    streamed = np.concatenate([block_filter.process(data[r0:r0 + 333]) for r0 in range(0, data.shape[0], 333)])
+    np.testing.assert_array_equal(streamed, expected)
+
+
+def test_zero_phase_too_short_raises():
+    sos = get_sos(SETTINGS[1])
+    padlen = get_sosfiltfilt_padlen(sos)
+    filter_data_in_place(random_data(padlen + 1), sos, zero_phase=True)
+    with pytest.raises(ValueError, match="more than %d samples" % padlen):
+        filter_data_in_place(random_data(padlen), sos, zero_phase=True)
+
+
+def test_too_short_file_is_filtered_causally(tmp_path):
+    from synthetic_mea import write_synthetic_mea_file
+
+    folder = tmp_path / "folder"
+    folder.mkdir()
+    write_synthetic_mea_file(str(folder / "synthetic_mea_2020-09-15T09-30-00.h5"), duration_sec=1.0)
+    write_synthetic_mea_file(str(folder / "synthetic_mea_2020-09-15T09-35-00.h5"), duration_sec=0.0002)
+    Rule = set_default_filetype_rules_for_peak_finding(frame_rate=25e3)
+    Rule.filter_highpass = 1.0
+    Rule.filter_zero_phase = True
+    with pytest.warns(UserWarning, match="09-35-00 has only 5 samples"):
+        Data, DataInfo = load_raw_mea_data_to_Data_and_DataInfo(
+            folder_of_files=str(folder) + "/", manually_chosen_mea_electrodes=ELECTRODES, Rule_in=Rule
+        )
+    assert DataInfo.io_stats["zero_phase_too_short"] == [2]
+    assert [entry["data"].shape[0] for entry in Data] == [25000, 5]
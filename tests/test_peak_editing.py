@@ -0,0 +1,69 @@
+import numpy as np
+
+from datanalyzer.part2_peak_handling.find_peaks import init_Data_BPM
+from datanalyzer.part3_data_handling_and_analyses import PeakEditor, create_BPM_summary, update_Data_BPM
+
+PEAK_KEYS = [prefix + "_" + side for side in ("low", "high") for prefix in ("peak_locations", "peak_values", "peak_widths")]
+
+
+def assert_same(value, expected, path="Data"):
+    if isinstance(expected, dict):
+        assert sorted(value, key=str) == sorted(expected, key=str), path
+        for key in expected:
+            assert_same(value[key], expected[key], "%s[%r]" % (path, key))
+    elif isinstance(expected, (list, tuple)) and not np.isscalar(expected):
+        assert len(value) == len(expected), path
+        for ii, (v, e) in enumerate(zip(value, expected)):
+            assert_same(v, e, "%s[%d]" % (path, ii))
+    else:
+        np.testing.assert_array_equal(value, expected, err_msg=path)
+
+
+def recompute(DataInfo, Data_BPM):
+    """update_Data_BPM and create_BPM_summary of the peaks of Data_BPM from scratch."""
+    fresh = init_Data_BPM(None, len(Data_BPM), len(DataInfo.datacol_numbers))
+    for d_fresh, d in zip(fresh, Data_BPM):
+        for key in PEAK_KEYS:
+            d_fresh[key] = {col: np.array(value) for col, value in d[key].items()}
+    fresh = update_Data_BPM(DataInfo, fresh, using_high_peaks=-1)
+    return fresh, create_BPM_summary(DataInfo, fresh)
+
+
+def test_edits_equal_full_recompute(analysed_folder):
+    Data, DataInfo, Data_BPM = analysed_folder
+    editor = PeakEditor(DataInfo, Data_BPM, create_BPM_summary(DataInfo, Data_BPM), Data=Data)
+
+    locs = editor.get_peaks(2, 1, -1)[0]
+    editor.remove_peak(2, 1, int(locs[0]), -1)
+    editor.move_peak(2, 1, int(locs[1]), int(locs[1]) + 5, -1)
+    editor.add_peak(2, 1, int((locs[1] + locs[2]) // 2), -1)
+    # File 1 is the normalizing file: the normalized columns of every file change
+    editor.remove_peak(1, 3, int(editor.get_peaks(1, 3, 1)[0][1]), 1)
+    editor.remove_peak(1, 4, int(editor.get_peaks(1, 4, -1)[0][-1]), -1)
+
+    expected_Data_BPM, expected_summary = recompute(DataInfo, editor.Data_BPM)
+    assert_same(editor.Data_BPM, expected_Data_BPM)
+    assert_same(editor.Data_BPM_summary, expected_summary, "Data_BPM_summary")
+
+
+def test_removing_all_peaks_clears_stats(analysed_folder):
+    Data, DataInfo, Data_BPM = analysed_folder
+    editor = PeakEditor(DataInfo, Data_BPM, create_BPM_summary(DataInfo, Data_BPM), Data=Data, auto_update=False)
+    for polarity in (-1, 1):
+        for location in editor.get_peaks(3, 2, polarity)[0]:
+            editor.remove_peak(3, 2, int(location), polarity)
+    assert editor.update() == [(3, 2, -1), (3, 2, 1)]
+
+    d = editor.Data_BPM[2]
+    for suffix in ("low", "high", ""):
+        suffix = "_" + suffix if suffix else ""
+        assert d["Amount_of_peaks" + suffix][1] == 0
+        assert np.isnan(d["BPM_avg" + suffix][1])
+        assert np.isnan(d["peak_avg_distance_in_ms" + suffix][1]).all()
+    summary = editor.Data_BPM_summary
+    assert summary["Amount_of_peaks"][2, 1] == 0
+    assert np.isnan(summary["BPM_avg"][2, 1]) and np.isnan(summary["Amplitude_avg"][2, 1])
+
+    expected_Data_BPM, expected_summary = recompute(DataInfo, editor.Data_BPM)
+    assert_same(editor.Data_BPM, expected_Data_BPM)
+    assert_same(summary, expected_summary, "Data_BPM_summary")
@@ -0,0 +1,28 @@
+import copy
+
+import numpy as np
+import pytest
+
+from conftest import make_random_Data_BPM
+from datanalyzer.part3_data_handling_and_analyses import PeakStore, update_Data_BPM
+
+
+@pytest.mark.parametrize("seed", range(3))
+@pytest.mark.parametrize("using_high_peaks", [-1, 0, 1])
+def test_peak_store_view_equals_update_Data_BPM(seed, using_high_peaks):
+    DataInfo, Data_BPM = make_random_Data_BPM(seed=seed)
+    store = PeakStore.from_Data_BPM(Data_BPM, DataInfo).update_bpm(DataInfo, using_high_peaks=using_high_peaks)
+    expected = update_Data_BPM(DataInfo, copy.deepcopy(Data_BPM), using_high_peaks=using_high_peaks)
+
+    view = store.as_Data_BPM()
+    assert len(view) == len(expected)
+    for kk, (d_view, d) in enumerate(zip(view, expected)):
+        for key, value in d_view.items():
+            if isinstance(d[key], dict):
+                assert sorted(value) == sorted(d[key]), (kk, key)
+                for col in d[key]:
+                    np.testing.assert_array_equal(value[col], d[key][col], err_msg="%d %s %d" % (kk, key, col))
+            else:
+                np.testing.assert_array_equal(value, d[key], err_msg="%d %s" % (kk, key))
+    for d_copy, d_view in zip(store.to_Data_BPM(), view):
+        assert d_copy.keys() == set(d_view)
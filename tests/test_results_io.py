@@ -0,0 +1,47 @@
+import numpy as np
+import pytest
+
+from datanalyzer.part3_data_handling_and_analyses import (
+    PeakStore,
+    create_BPM_summary,
+    export_results,
+    read_peak_store,
+    read_peak_table,
+    read_summary,
+)
+from datanalyzer.part3_data_handling_and_analyses.results_io import PEAK_TABLE_COLUMNS, get_peak_table
+
+
+@pytest.mark.parametrize("file_format", ["h5", "parquet"])
+def test_export_round_trip(tmp_path, analysed_folder, file_format):
+    if file_format == "parquet":
+        pytest.importorskip("pyarrow")
+    Data, DataInfo, Data_BPM = analysed_folder
+    summary = create_BPM_summary(DataInfo, Data_BPM)
+    path = str(tmp_path / ("results.h5" if file_format == "h5" else "results"))
+    export_results(path, DataInfo, Data_BPM, summary)
+
+    expected = get_peak_table(Data_BPM, DataInfo)
+    assert expected["location"].size > 0
+    table = read_peak_table(path)
+    for key in PEAK_TABLE_COLUMNS:
+        np.testing.assert_array_equal(table[key].to_numpy(), expected[key])
+
+    # Partial reads return the matching rows only
+    table = read_peak_table(path, file_range=(2, 3), electrode_range=(28, 31))
+    keep = (expected["file_index"] >= 2) & (expected["electrode"] >= 28) & (expected["electrode"] <= 31)
+    for key in PEAK_TABLE_COLUMNS:
+        np.testing.assert_array_equal(table[key].to_numpy(), expected[key][keep])
+
+    matrices = read_summary(path)
+    np.testing.assert_array_equal(matrices["file_index"], [1, 2, 3])
+    for key in ("BPM_avg", "Amplitude_avg", "BPM_norm", "peak_width_avg"):
+        np.testing.assert_array_equal(matrices[key], summary[key])
+    matrices = read_summary(path, file_range=(2, 2), electrode_range=(28, 31), keys=["BPM_avg"])
+    np.testing.assert_array_equal(matrices["BPM_avg"], summary["BPM_avg"][1:2, 1:3])
+    np.testing.assert_array_equal(matrices["BPM_avg_datacolumns"], [2, 3])
+
+    if file_format == "h5":
+        store, expected_store = read_peak_store(path), PeakStore.from_Data_BPM(Data_BPM, DataInfo)
+        for key in ("offsets", "locations", "values", "widths"):
+            np.testing.assert_array_equal(getattr(store, key), getattr(expected_store, key))
@@ -0,0 +1,42 @@
+import numpy as np
+import pytest
+
+from conftest import ELECTRODES
+from datanalyzer.part1_raw_data_handling import load_raw_mea_data_to_Data_and_DataInfo
+from datanalyzer.part2_peak_handling import (
+    find_peaks_in_loop,
+    set_default_filetype_rules_for_peak_finding,
+    sweep_peak_finding_rules,
+)
+from datanalyzer.part2_peak_handling.rule_sweep import make_rule_grid
+
+GRID = {"max_bpm": [20, 40, 200], "min_peak_value": [2e-5, 5e-5, 1.5e-4], "minimum_peak_width": [1, 50, 150]}
+PEAK_KEYS = [
+    prefix + "_" + side for side in ("low", "high") for prefix in ("peak_locations", "peak_values", "peak_widths")
+]
+
+
+@pytest.mark.parametrize("storage", ["float64", "raw"])
+def test_sweep_equals_independent_runs(synthetic_folder, storage):
+    Data, DataInfo = load_raw_mea_data_to_Data_and_DataInfo(
+        folder_of_files=synthetic_folder, manually_chosen_mea_electrodes=ELECTRODES, storage=storage
+    )
+    Rule = set_default_filetype_rules_for_peak_finding(frame_rate=float(DataInfo.framerate.flat[0]))
+    rules = make_rule_grid(Rule, GRID)
+    table, Data_BPM_of_rules = sweep_peak_finding_rules(Data, DataInfo, rules, data_multiply=0, return_Data_BPM=True)
+
+    amounts = set()
+    for setting, (rule, Data_BPM) in enumerate(zip(rules, Data_BPM_of_rules)):
+        expected = find_peaks_in_loop(Data, DataInfo, Rule_in=rule, data_multiply=0)
+        for d, d_expected in zip(Data_BPM, expected):
+            for key in PEAK_KEYS:
+                assert d[key].keys() == d_expected[key].keys()
+                for col, value in d_expected[key].items():
+                    np.testing.assert_array_equal(d[key][col], value, err_msg="%d %s %d" % (setting, key, col))
+            rows = table[(table["setting"] == setting) & (table["file_index"] == d["file_index"])]
+            for _, row in rows.iterrows():
+                suffix = "high" if row["data_multiply"] > 0 else "low"
+                assert row["Amount_of_peaks"] == np.size(d_expected["peak_locations_" + suffix][row["datacolumn"]])
+                amounts.add(row["Amount_of_peaks"])
+    # The grid is wide enough that the settings find different peaks
+    assert len(amounts) > 3
@@ -0,0 +1,35 @@
+import numpy as np
+import pytest
+
+from conftest import ELECTRODES
+from datanalyzer.part1_raw_data_handling import load_raw_mea_data_to_Data_and_DataInfo
+from datanalyzer.part2_peak_handling import find_peaks_in_loop, set_default_filetype_rules_for_peak_finding
+
+
+def find_peaks_with_storage(folder, storage, peak_engine):
+    Data, DataInfo = load_raw_mea_data_to_Data_and_DataInfo(
+        folder_of_files=folder, manually_chosen_mea_electrodes=ELECTRODES, storage=storage
+    )
+    Rule = set_default_filetype_rules_for_peak_finding(frame_rate=float(DataInfo.framerate.flat[0]))
+    Rule.peak_engine = peak_engine
+    return find_peaks_in_loop(Data, DataInfo, Rule_in=Rule, data_multiply=0)
+
+
+@pytest.mark.parametrize("peak_engine", ["scipy", "vectorized"])
+@pytest.mark.parametrize("storage, rtol_values, rtol_widths", [("raw", 0, 1e-12), ("float32", 1e-7, 1e-6)])
+def test_storage_matches_float64(synthetic_folder, peak_engine, storage, rtol_values, rtol_widths):
+    expected = find_peaks_with_storage(synthetic_folder, "float64", peak_engine)
+    Data_BPM = find_peaks_with_storage(synthetic_folder, storage, peak_engine)
+    n_peaks = 0
+    for d, d_expected in zip(Data_BPM, expected):
+        for suffix in ("low", "high"):
+            for col, locs in d_expected["peak_locations_" + suffix].items():
+                np.testing.assert_array_equal(d["peak_locations_" + suffix][col], locs)
+                np.testing.assert_allclose(
+                    d["peak_values_" + suffix][col], d_expected["peak_values_" + suffix][col], rtol=rtol_values
+                )
+                np.testing.assert_allclose(
+                    d["peak_widths_" + suffix][col], d_expected["peak_widths_" + suffix][col], rtol=rtol_widths
+                )
+                n_peaks += locs.size
+    assert n_peaks > 0
@@ -0,0 +1,73 @@
+import os
+import warnings
+
+import h5py
+import numpy as np
+import pytest
+
+from conftest import ELECTRODES
+from datanalyzer.part1_raw_data_handling import create_DataInfo_of_folder, load_raw_mea_data_to_Data_and_DataInfo
+from datanalyzer.part2_peak_handling import (
+    find_peaks_in_loop,
+    find_peaks_streaming,
+    set_default_filetype_rules_for_peak_finding,
+)
+
+PEAK_KEYS = [
+    (prefix + "_" + side)
+    for side in ("low", "high")
+    for prefix in ("peak_locations", "peak_values", "peak_widths")
+]
+
+
+def assert_same_peaks(Data_BPM, expected):
+    n_peaks = 0
+    for d, d_expected in zip(Data_BPM, expected):
+        for key in PEAK_KEYS:
+            assert d[key].keys() == d_expected[key].keys()
+            for col, value in d_expected[key].items():
+                if key.startswith("peak_locations"):
+                    np.testing.assert_array_equal(d[key][col], value)
+                    n_peaks += np.size(value)
+                else:
+                    np.testing.assert_allclose(d[key][col], value, rtol=1e-9)
+    assert n_peaks > 0
+
+
+@pytest.mark.parametrize("block_frames", [4096, 2 ** 18])
+def test_streaming_matches_find_peaks_in_loop(synthetic_folder, block_frames):
+    Data, DataInfo = load_raw_mea_data_to_Data_and_DataInfo(
+        folder_of_files=synthetic_folder, manually_chosen_mea_electrodes=ELECTRODES
+    )
+    Rule = set_default_filetype_rules_for_peak_finding(frame_rate=float(DataInfo.framerate.flat[0]))
+    expected = find_peaks_in_loop(Data, DataInfo, Rule_in=Rule, data_multiply=0)
+
+    info = create_DataInfo_of_folder(folder_of_files=synthetic_folder, manually_chosen_mea_electrodes=ELECTRODES)
+    with warnings.catch_warnings():
+        warnings.simplefilter("error")
+        Data_BPM = find_peaks_streaming(info, Rule_in=Rule, data_multiply=0, block_frames=block_frames)
+    assert_same_peaks(Data_BPM, expected)
+    assert not info.io_stats["stream_forced_joins"].any()
+
+
+def test_streaming_counts_forced_joins(synthetic_folder):
+    # A negative offset keeps the low-peak signal above 0, so blocks never join at an exact 0
+    with h5py.File(synthetic_folder + sorted(os.listdir(synthetic_folder))[0], "r+") as f:
+        f["Data/Recording_0/AnalogStream/Stream_0/ChannelData"][...] -= 5000
+    Data, DataInfo = load_raw_mea_data_to_Data_and_DataInfo(
+        folder_of_files=synthetic_folder, manually_chosen_mea_electrodes=ELECTRODES
+    )
+    Rule = set_default_filetype_rules_for_peak_finding(frame_rate=float(DataInfo.framerate.flat[0]))
+
+    info = create_DataInfo_of_folder(folder_of_files=synthetic_folder, manually_chosen_mea_electrodes=ELECTRODES)
+    with pytest.warns(UserWarning, match="max_tail_frames=0"):
+        find_peaks_streaming(info, Rule_in=Rule, data_multiply=-1, block_frames=4096)
+    forced_joins = info.io_stats["stream_forced_joins"]
+    assert forced_joins[0] > 0
+    assert not forced_joins[1:].any()
+
+    info = create_DataInfo_of_folder(folder_of_files=synthetic_folder, manually_chosen_mea_electrodes=ELECTRODES)
+    with warnings.catch_warnings():
+        warnings.simplefilter("error")
+        Data_BPM = find_peaks_streaming(info, Rule_in=Rule, data_multiply=-1, block_frames=4096, max_tail_frames=0)
+    assert_same_peaks(Data_BPM, find_peaks_in_loop(Data, DataInfo, Rule_in=Rule, data_multiply=-1))
@@ -0,0 +1,64 @@
+import numpy as np
+import pytest
+from scipy.signal import find_peaks as scipy_find_peaks
+
+from datanalyzer.part2_peak_handling import find_peaks_in_block
+from datanalyzer.part2_peak_handling.vector_peaks import find_peaks_in_columns
+
+
+def random_block(rng, n_rows=4000, n_cols=6):
+    """Noisy beats rounded to whole units, so that plateaus and equal neighbours occur."""
+    t = np.arange(n_rows)[:, None]
+    beats = np.sin(2 * np.pi * t / rng.uniform(150, 600, n_cols)) ** 15 * rng.uniform(5, 40, n_cols)
+    return np.round(beats * rng.choice([-1, 1], n_cols) + rng.normal(0, 2, (n_rows, n_cols)) + rng.normal(0, 1, n_cols))
+
+
+def scipy_peaks(signal, polarity, threshold, distance, width):
+    clipped = signal * polarity
+    clipped[clipped < 0] = 0
+    locs, props = scipy_find_peaks(clipped, height=threshold, distance=distance, width=width)
+    widths = props["widths"] if width is not None else np.full(locs.size, np.nan)
+    return clipped[locs], locs, widths
+
+
+@pytest.mark.parametrize("seed", range(8))
+@pytest.mark.parametrize("polarity", [-1, 1])
+@pytest.mark.parametrize("width", [None, 3.0, 12.0])
+def test_find_peaks_in_columns_matches_scipy(seed, polarity, width):
+    rng = np.random.default_rng(seed)
+    block = random_block(rng)
+    thresholds = rng.uniform(0.5, 10, block.shape[1])
+    distance = int(rng.choice([1, 2, 7, 40, 250]))
+    found = find_peaks_in_columns(block, polarity, thresholds, distance, width)
+    n_peaks = 0
+    for j, (values, locs, widths) in enumerate(found):
+        pks, expected_locs, expected_widths = scipy_peaks(block[:, j], polarity, thresholds[j], distance, width)
+        np.testing.assert_array_equal(locs, expected_locs)
+        np.testing.assert_array_equal(values, pks)
+        np.testing.assert_array_equal(widths, expected_widths)
+        n_peaks += locs.size
+    assert n_peaks > 0
+
+
+@pytest.mark.parametrize("raw", [False, True])
+def test_find_peaks_in_block_matches_scipy(raw):
+    rng = np.random.default_rng(1)
+    block = random_block(rng, n_cols=10)
+    if raw:
+        scale = rng.uniform(0.5, 2.0, block.shape[1]) * 1e-6
+        offset = rng.integers(-100, 100, block.shape[1])
+        entry = {"data": (block + offset).astype(np.int32), "scale": scale, "offset": offset}
+    else:
+        scale = np.ones(block.shape[1])
+        entry = {"data": block}
+    columns = [1, 3, 4, 5, 8, 10]
+    min_peak_value = 4.0 * scale.min()
+    # Small blocks, so that the columns are split over several of them
+    found = find_peaks_in_block(entry, columns, (-1, 1), min_peak_value, 60.5, 5.0, block_bytes=3 * 8 * block.shape[0])
+    assert sorted(found) == sorted((col, polarity) for col in columns for polarity in (-1, 1))
+    for (col, polarity), (values, locs_1based, widths) in found.items():
+        threshold = min_peak_value / scale[col - 1]
+        pks, locs, expected_widths = scipy_peaks(block[:, col - 1], polarity, threshold, 60, 5.0)
+        np.testing.assert_array_equal(locs_1based, locs + 1)
+        np.testing.assert_allclose(values, pks * scale[col - 1], rtol=1e-15)
+        np.testing.assert_array_equal(widths, expected_widths)
@@ -0,0 +1,68 @@
+import shutil
+from pathlib import Path
+
+import numpy as np
+import pytest
+from synthetic_mea import make_synthetic_mea_folder
+
+from conftest import ELECTRODES
+from datanalyzer.part1_raw_data_handling import load_raw_mea_data_to_Data_and_DataInfo
+from datanalyzer.part2_peak_handling import (
+    find_peaks_in_loop,
+    set_default_filetype_rules_for_peak_finding,
+)
+from datanalyzer.part3_data_handling_and_analyses import update_Data_BPM
+from datanalyzer.part3_data_handling_and_analyses.watch_folder import (
+    start_incremental_analysis_of_folder,
+)
+
+
+@pytest.mark.parametrize("peak_engine", ["scipy", "vectorized"])
+@pytest.mark.parametrize("data_multiply", [-1, 1, 0])
+def test_watch_folder_matches_find_peaks_in_loop(tmp_path, data_multiply, peak_engine):
+    source = tmp_path / "source"
+    # Low noise, so that the positive wave after each spike is found as a high peak
+    paths = make_synthetic_mea_folder(
+        str(source), n_files=3, duration_sec=4.0, n_channels=60, noise_uV=1.0, amplitude_uV=200.0
+    )
+    Data, DataInfo = load_raw_mea_data_to_Data_and_DataInfo(
+        folder_of_files=str(source) + "/", manually_chosen_mea_electrodes=ELECTRODES
+    )
+    Rule = set_default_filetype_rules_for_peak_finding(frame_rate=float(DataInfo.framerate.flat[0]))
+    Rule.peak_engine = peak_engine
+    expected = update_Data_BPM(DataInfo, find_peaks_in_loop(Data, DataInfo, Rule_in=Rule, data_multiply=data_multiply))
+
+    watched = tmp_path / "watched"
+    watched.mkdir()
+    shutil.copy(paths[0], watched)
+    inc = start_incremental_analysis_of_folder(
+        str(watched) + "/", ELECTRODES, Rule_in=Rule, data_multiply=data_multiply, settle_sec=0
+    )
+    for path in paths[1:]:
+        shutil.copy(path, watched)
+        assert inc.poll() == [Path(path).name]
+
+    n_peaks = 0
+    for d_expected, d_watched in zip(expected, inc.Data_BPM):
+        for key in ("peak_locations_low", "peak_locations_high", "peak_locations"):
+            for col, value in d_expected[key].items():
+                np.testing.assert_array_equal(d_watched[key][col], value)
+        np.testing.assert_array_equal(d_watched["BPM_avg"], d_expected["BPM_avg"])
+        for key in ("peak_locations_low", "peak_locations_high"):
+            n_peaks += sum(np.size(value) for value in d_watched[key].values())
+    assert n_peaks > 0
+
+
+def test_watch_folder_skips_vanished_and_unreadable_files(tmp_path):
+    paths = make_synthetic_mea_folder(str(tmp_path), n_files=1, duration_sec=1.0, n_channels=60)
+    inc = start_incremental_analysis_of_folder(str(tmp_path) + "/", ELECTRODES, settle_sec=0)
+    assert inc.DataInfo.file_names == [Path(paths[0]).name]
+
+    # Listed, then removed before it is read
+    assert not inc.add_file("synthetic_mea_2020-09-15T09-35-00.h5")
+    # Not an MEA file: remembered until it changes
+    (tmp_path / "synthetic_mea_2020-09-15T09-40-00.h5").write_bytes(b"not hdf5")
+    assert inc.poll() == []
+    assert list(inc.failed) == ["synthetic_mea_2020-09-15T09-40-00.h5"]
+    assert inc.DataInfo.file_names == [Path(paths[0]).name]
+    assert len(inc.Data_BPM) == 1